@@ -45,7 +45,8 @@ The built loader will be installed in the same directory as the script file.
    |                | specific settings to use when         |                               |
    |                | **linking** the custom loader. If you |                               |
    |                | specify this setting on posix, you    |                               |
-   |                | override our default '-lstdc++'       |                               |
+   |                | override our default '-lstdc++        |                               |
+   |                | -lpthread'                            |                               |
    +----------------+---------------------------------------+-------------------------------+
    | *detection*    | The default tamper protection used    | an int                        |
    |                | by your loader. Valid choices are;    |                               |
@@ -72,6 +73,50 @@ The built loader will be installed in the same directory as the script file.
    |                | Exclude those modules that are        |                               |
    |                | replaced by the virtualenv pkg.       |                               |
    +----------------+---------------------------------------+-------------------------------+
+   | *prevalidate*  | Embed the location of each dependency | a boolean                     |
+   |                | so the loader can verify them before  |                               |
+   |                | python is initialized.                |                               |
+   +----------------+---------------------------------------+-------------------------------+
+   | *cache*        | Build a loader that caches the digests| a boolean                     |
+   |                | of verified files, and skips hashing  |                               |
+   |                | files that have not changed (posix).  |                               |
+   +----------------+---------------------------------------+-------------------------------+
+   | *freeze*       | Compile the python source dependencies| a boolean                     |
+   |                | into the loader, and import them from |                               |
+   |                | there instead of the filesystem.      |                               |
+   +----------------+---------------------------------------+-------------------------------+
+   | *lazy*         | Verify each dependency when it is     | a boolean                     |
+   |                | first imported, rather than before    |                               |
+   |                | the script runs.                      |                               |
+   +----------------+---------------------------------------+-------------------------------+
+   | *budget*       | Milliseconds of verification before   | an integer                    |
+   |                | the script runs, the rest is finished |                               |
+   |                | in the background.                    |                               |
+   +----------------+---------------------------------------+-------------------------------+
+   | *critical*     | Modules always verified before the    | a list of strings             |
+   |                | script runs, whatever the *budget*.   |                               |
+   +----------------+---------------------------------------+-------------------------------+
+   | *watch*        | Keep watching the verified files while| a boolean                     |
+   |                | the script runs, and verify them again|                               |
+   |                | when they change (linux).             |                               |
+   +----------------+---------------------------------------+-------------------------------+
+   | *uring*        | Read the dependencies in batches      | a boolean                     |
+   |                | through an io_uring (linux).          |                               |
+   +----------------+---------------------------------------+-------------------------------+
+   | *faststart*    | Start python without site, ignoring   | a boolean                     |
+   |                | PYTHON* environment variables, with   |                               |
+   |                | sys.path as it was at build time.     |                               |
+   +----------------+---------------------------------------+-------------------------------+
+   | *multicall*    | Build one loader of this name for all | a string                      |
+   |                | the scripts in *ext_modules*, run as  |                               |
+   |                | each script's name.                   |                               |
+   +----------------+---------------------------------------+-------------------------------+
+   | *digest*       | The digest algorithm of the script    | sha1 (default), sha256 or     |
+   |                | and dependency signatures.            | blake2b                       |
+   +----------------+---------------------------------------+-------------------------------+
+   | *treehash*     | Hash files larger than this many MB   | an integer, or kilobytes with |
+   |                | in chunks of that size, in parallel.  | a K suffix (eg: 256K)         |
+   +----------------+---------------------------------------+-------------------------------+
 
 Windows Resources
 -----------------
@@ -151,6 +196,20 @@ We've collected the module replacements from virtualenv into a predefined
 exclude list. If your *setup.py* uses the **--virtualenv** option, the loader
 will be built with these excludes.
 
+Pre-interpreter Validation
+--------------------------
+
+By default the loader initializes python to learn *sys.path*, then searches it
+for each dependency. With the **--prevalidate** option, **build_signet** embeds
+the search roots (*sys.path*) it resolved your dependencies against, along with
+each dependency's path and size. The loader verifies those files before python
+is initialized, so a tampered dependency aborts the loader without any
+interpreter cost.
+
+Once python is running, the loader compares *sys.path* with the embedded roots.
+Only if they differ (or an embedded path was missing) are dependencies
+resolved against *sys.path* the traditional way.
+
 
 Examples
 --------
@@ -226,13 +285,209 @@ An example to build a *virtualenv* compatible loaders
         )
 
 
+Verification Cache
+------------------
+
+A loader built with the **--cache** option keeps a cache of the digests of
+the files it verified, in ``$XDG_CACHE_HOME/signet`` (``~/.cache/signet`` by
+default). Each digest is keyed by the file's path and stat fingerprint
+(device, inode, size, modification and change times). When none of these
+have changed, the loader reuses the cached digest instead of hashing the
+file again. Since any write to a file updates its change time, which can't
+be set by the user, a modified file is always hashed again.
+
+The cache file is authenticated with a random key embedded in the loader at
+build time, so a cache file written by anyone without the loader can't be
+used to pre-seed digests. Keep in mind that anyone who can read the loader
+can read its key. The cache holds the most recently used digests, older
+entries are evicted. Loaders update the cache atomically, so many loaders
+may share it safely. The cache is not available on windows. Set
+**SIGNET_CACHE=OFF** to disable the cache at runtime.
+
+Lazy Verification
+-----------------
+
+A loader built with the **--lazy** option verifies the script before it runs,
+but leaves its dependencies until they are imported. The loader installs an
+import hook on *sys.meta_path* that holds the module signatures. When the
+script first imports a signed module, the hook reads the module file once,
+verifies those bytes and compiles them, so the code that runs is the code
+that was verified. Scripts that only use a few of their dependencies on each
+run skip hashing the rest.
+
+Bytecode caches (*.pyc*) of signed source modules are ignored, the source is
+compiled on every import. Extension modules are verified, then loaded by
+python from their file. Modules python imports while it initializes (before
+the hook is installed) are verified up front. Tampering found after the script
+started terminates the loader immediately (unless *detection* is 1).
+
+Frozen Dependencies
+-------------------
+
+With the **--freeze** option, **build_signet** compiles each dependency that is
+a python source module into a code object, and embeds it in the loader. The
+loader's import hook serves those modules from the loader itself, so they are
+never located, read, hashed or compiled at startup, and tampering with their
+files on disk has no effect. The frozen modules keep their signatures, and are
+verified as usual if python imports them from disk while it initializes
+(before the hook is installed). Extension modules and bytecode-only modules
+are not frozen. The frozen code is tied to the magic number of the python
+that built the loader. Under a different python, the loader ignores the frozen
+code and verifies those modules on disk instead.
+
+Background Verification
+-----------------------
+
+For latency sensitive tools, the **--budget=ms** option lets the script start
+before every dependency is verified. The loader always verifies the script,
+then verifies dependencies until the budget runs out, and hands the rest to a
+background thread that hashes them while the script runs. If the background
+thread finds tampering, the loader reports the **SECURITY VIOLATION** and
+terminates the process (unless *detection* is 1). The loader waits for the
+background thread before it exits, so every run is fully verified. A budget
+of 0 verifies nothing but the script up front.
+
+Code the script imports before the background thread reaches it runs
+unverified, so name the modules that must never run unverified with
+**--critical** (a comma separated list, submodules included). They are
+verified before the script runs, whatever the budget::
+
+    python setup.py build_signet --budget=20 --critical=mypkg,ssl
+
+Set **SIGNET_BUDGET=ms** to override the budget at runtime
+(**SIGNET_BUDGET=OFF** verifies everything before the script runs).
+
+Watching Dependencies
+---------------------
+
+A daemon can run for weeks after it was verified. A loader built with the
+**--watch** option (linux only) keeps an inotify watch on the directories
+holding the script and the dependencies it verified. When one of those files
+is written, replaced or removed, a low priority thread hashes that file alone
+and applies the *detection* level: the **SECURITY VIOLATION** is reported,
+and the process is terminated unless *detection* is 1. Nothing is hashed
+while the files don't change::
+
+    python setup.py build_signet --watch
+
+Set **SIGNET_WATCH=ON** (or **OFF**) to override the option at runtime.
+
+Batched Reads
+-------------
+
+Each worker reads the dependencies it hashes with a blocking read, so at most
+one read per worker is waiting for the disk at any time. On a cold page cache,
+or a network filesystem, startup is then bound by the latency of each read.
+A loader built with the **--uring** option (linux 5.6 or later) reads the
+files smaller than 64KB through an io_uring instead: after resolving them,
+the reads of up to 256 files are submitted together, 64 of them in flight at
+a time, and the workers hash each batch once it was read. Larger files are
+memory mapped and hashed as before::
+
+    python setup.py build_signet --uring
+
+Where io_uring is not available (an older kernel, or disabled by
+*kernel.io_uring_disabled*), the files are read as usual. Set
+**SIGNET_URING=ON** (or **OFF**) to override the option at runtime.
+
+Static Probes
+-------------
+
+A loader built with the USDT define carries static probes (the *signet*
+provider) that perf, bpftrace or systemtap can attach to on a live host,
+without changing its environment or log level. It needs *sys/sdt.h*, from
+the systemtap-sdt-dev (or systemtap-sdt-devel) package::
+
+    python setup.py build_signet --define USDT
+
+    bpftrace -e 'usdt:./hello:signet:tamper { printf("%s\n", str(arg0)); }'
+
+A probe no tracer is attached to is a single nop, so the probes can be left
+in production loaders. Without the define they are not compiled in. The
+probes are listed in the loader documentation.
+
+Fast Start
+----------
+
+By default the loader initializes python as the python executable would: it
+imports *site*, which scans site-packages and it's .pth files, and honors the
+PYTHON* environment variables. With a large site-packages that costs tens of
+milliseconds per launch. A loader built with **--faststart** skips all of it.
+It embeds sys.path as it is while building (the script's directory stands for
+itself, wherever the loader is installed), and starts python without *site*,
+without the user site directory and ignoring PYTHONPATH, PYTHONHOME and the
+other PYTHON* variables. sys.path is then set to the embedded path::
+
+    python setup.py build_signet --faststart
+
+Build the loader with the python, and the sys.path, it will run with.
+Anything *site* would provide at runtime (the *exit* builtin, paths added by
+.pth files installed later) is not available to the script. Set
+**SIGNET_FASTSTART=OFF** to start python normally at runtime.
+
+Multi-Call Loaders
+------------------
+
+Each extension in *ext_modules* normally gets a loader of it's own. A product
+shipping many scripts that share their dependencies can instead build a
+single multi-call loader with the **--multicall=name** option. The loader is
+compiled and linked once, embeds one merged signature table (each dependency
+appears once, however many scripts use it) and every script's digest and
+compiled code. Each script is then given a hard link to the loader, named as
+it's own loader would be (a copy, where links are not supported)::
+
+    python setup.py build_signet --multicall=tools
+
+builds *tools*, with links *backup*, *restore*, ... for *backup.py*,
+*restore.py*, ... The loader runs the script named by the link it was invoked
+through (a symbolic link works as well), and only verifies that script's
+dependencies. Invoked under it's own name, it runs the script named by it's
+first argument (``tools backup --full``). The scripts must share a directory,
+since the loader finds them next to itself.
+
+Digest Algorithms
+-----------------
+
+Signatures are SHA-1 digests by default. The **--digest** option selects the
+algorithm instead, one of *sha1*, *sha256* or *blake2b* (BLAKE2b with a 32
+byte digest)::
+
+    python setup.py build_signet --digest=blake2b
+
+The algorithm is recorded in the loader, which is compiled with the matching
+native implementation. SHA-1 is the fastest where the cpu has SHA-1
+instructions. Elsewhere, on 64-bit hosts, BLAKE2b is both faster and, unlike
+SHA-1, free of known collision attacks. Building with *blake2b* requires
+python's hashlib to provide it (python 3.6) or the pyblake2 package.
+
+Tree Hashing
+------------
+
+A file is hashed by one thread, so a single large dependency (a native
+extension of a hundred megabytes, say) can set the loader's startup time on
+it's own. With **--treehash=MB**, files larger than *MB* megabytes are signed
+with a tree digest instead: each *MB* chunk of the file is hashed on it's own,
+and the digest is that of the chunk digests (see :func:`content_digest`). The
+loader hashes the chunks of a file on all it's worker threads at once::
+
+    python setup.py build_signet --treehash=8
+
+Smaller files are signed as usual. A size with a *K* suffix is in kilobytes
+(**--treehash=256K**), for chunks smaller than a megabyte.
+
 Utility Functions
 -----------------
 
 .. autofunction:: module_signatures
 
+.. autofunction:: new_digest
+
+.. autofunction:: content_digest
+
 .. autofunction:: generate_sigs_decl
 
+.. autofunction:: search_roots
+
 """
 # pylint: enable=C0301
 
@@ -245,9 +500,14 @@ from distutils.dep_util import newer_group
 from distutils.dir_util import copy_tree
 from distutils.errors import DistutilsSetupError
 import StringIO
+import binascii
 import hashlib
+import imp
+import marshal
 import os
 import re
+import shutil
+import struct
 import sys
 import sysconfig
 
@@ -274,6 +534,10 @@ VIRTUALENV_EXCLUDES = [
         'site',
         ]
 
+# Digest algorithms, in the order of the loader's DIGEST_ALGORITHM values
+
+DIGESTS = ['sha1', 'sha256', 'blake2b']
+
 
 def find_module(modname, paths):
     r"""Search *paths* for a sub-directory or a file *modname*, returns the
@@ -291,23 +555,86 @@ def find_module(modname, paths):
     return None
 
 
-def find_module_path(modname):
-    r"""Search for *modname* in sys.path, and return the pathname of match or
-    None"""
+def locate_module(modname):
+    r"""Search for *modname* in sys.path, and return 2-tuple (root, pathname)
+    of the sys.path entry the match was found under and the pathname of the
+    match, or (None, None)"""
     paths = sys.path
+    root = None
     for modpart in modname.split('.'):
         modpath = find_module(modpart, paths)
         if not modpath:
-            return None
+            return (None, None)
+        if root is None:
+            root = os.path.dirname(modpath)
         if os.path.isfile(modpath):
-            return modpath
+            return (root, modpath)
         paths = [modpath]
-    return None
+    return (None, None)
+
+
+def find_module_path(modname):
+    r"""Search for *modname* in sys.path, and return the pathname of match or
+    None"""
+    return locate_module(modname)[1]
 
 
-def module_signatures(py_source, verbose=True):
+def search_roots(py_source):
+    r"""Return the module search roots (sys.path) a loader for *py_source*
+    will be built against, as canonical paths. The directory holding
+    *py_source* is returned as '', since the loader resolves it at runtime.
+    """
+    script_dir = os.path.realpath(os.path.dirname(os.path.abspath(py_source)))
+    roots = []
+    for pth in sys.path:
+        pth = os.path.realpath(os.path.abspath(pth))
+        roots.append('' if pth == script_dir else pth)
+    return roots
+
+
+def new_digest(name='sha1', data=''):
+    r"""Return a new hashlib style hash object of *data* for the digest
+        algorithm *name* (one of DIGESTS). *blake2b* digests are 32 bytes,
+        and require hashlib.blake2b (python 3.6) or the pyblake2 package."""
+    if name == 'blake2b':
+        blake2b = getattr(hashlib, 'blake2b', None)
+        if blake2b is None:
+            try:
+                from pyblake2 import blake2b
+            except ImportError:
+                raise DistutilsSetupError("digest 'blake2b' requires "
+                        "python 3.6 or the pyblake2 package")
+        return blake2b(data, digest_size=32)
+    if name not in DIGESTS:
+        raise DistutilsSetupError("unknown digest '%s' (expected one of %s)"
+                % (name, ', '.join(DIGESTS)))
+    return hashlib.new(name, data)
+
+
+def content_digest(data, digest='sha1', tree=0):
+    r"""Return the hexdigest the loader verifies *data* with: it's *digest*
+        or, if *tree* (a chunk size in bytes) is set and *data* is larger
+        than one chunk, it's tree digest. A tree digest is the *digest* of a
+        0x01 byte followed by the digests of each *tree* bytes of *data*
+        (the last chunk may be shorter), each prefixed by a 0x00 byte."""
+    if not tree or len(data) <= tree:
+        return new_digest(digest, data).hexdigest()
+    root = new_digest(digest, '\x01')
+    for offset in range(0, len(data), tree):
+        root.update(new_digest(digest,
+                               '\x00' + data[offset:offset + tree]).digest())
+    return root.hexdigest()
+
+
+def module_signatures(py_source, verbose=True, locations=False,
+                      digest='sha1', tree=0):
     r"""Scan *py_source* for dependencies, and return list of
-        2-tuples [(hexdigest, modulename), ...], sorted by modulename.
+        3-tuples [(hexdigest, modulename, filename), ...], sorted by
+        modulename. If *locations* is true, each tuple is extended with
+        (root, relpath, size) -- the sys.path entry the module was found
+        under, it's path relative to root, and it's size in bytes.
+        *digest* names the algorithm of hexdigest, and *tree* the chunk
+        size of tree digests (see :func:`content_digest`).
 
         To see what signatures signet will use when building your loader::
 
@@ -318,59 +645,258 @@ def module_signatures(py_source, verbose=True):
     modules = {}
     ast, _ = snakefood.find.parse_python_source(py_source)
     for res in snakefood.find.get_ast_imports(ast):
-        path = find_module_path(res[0])
-        if not path and verbose:
-            log.warn('cannot find module %s' % res[0])
+        root, path = locate_module(res[0])
+        if not path:
+            if verbose:
+                log.warn('cannot find module %s' % res[0])
             continue
         if path not in modules:
-            modules[path] = res[0]
+            modules[path] = (res[0], root)
 
     signatures = []
-    sha1 = hashlib.sha1
     for modpath in sorted(modules.keys()):
+        modname, root = modules[modpath]
         with open(modpath, 'rb') as fin:
-            digest = sha1(fin.read()).hexdigest()
-            signatures.append(
-                [digest, modules[modpath], os.path.basename(modpath)])
+            data = fin.read()
+        sig = [content_digest(data, digest, tree), modname,
+               os.path.basename(modpath)]
+        if locations:
+            root = os.path.realpath(os.path.abspath(root))
+            relpath = os.path.relpath(os.path.realpath(modpath), root)
+            sig.extend([root, relpath, len(data)])
+        signatures.append(sig)
     return sorted(signatures, key=lambda s: s[1])
 
 
+def c_string(value):
+    r"""Return *value* as a quoted C string literal"""
+    return '"%s"' % value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def make_roots_decl(roots):
+    r"""Accept list of search roots, and returns C declaration."""
+    roots_decl = StringIO.StringIO()
+    roots_decl.write('const char* const ROOTS[] = {\n')
+
+    for root in roots:
+        roots_decl.write('\t%s,\n' % c_string(root))
+    roots_decl.write('\tNULL\n')
+    roots_decl.write('\t};\n')
+
+    return roots_decl.getvalue()
+
+
+def file_module(modname, filename):
+    r"""Return the part of *modname* that names the module in *filename*,
+    eg. 'os' for ('os.path', 'os.py')"""
+    stem = os.path.splitext(filename)[0]
+    parts = modname.split('.')
+    for i, part in enumerate(parts):
+        if part == stem:
+            return '.'.join(parts[:i + 1])
+    return modname
+
+
+def c_bytes(data):
+    r"""Return the bytes of *data* as a C array initializer"""
+    return '{%s}' % ', '.join('0x%02x' % ord(c) for c in data)
+
+
+def signature_table(sigs):
+    r"""Return the list of 2-tuples [(module, sig), ...] the loader's SIGS
+        are generated from -- one per module file, keyed by the module the
+        file provides (see :func:`file_module`), sorted by module."""
+    table = {}
+    for sig in sigs:
+        table.setdefault(file_module(sig[1], sig[2]), sig)
+    return sorted(table.items())
+
+
 def make_sigs_decl(sigs):
     r"""Accept list of signature tuples, and returns C declaration.
-        *sigs* is a list of 2-tuples [(sha1, mod), ...].
+        *sigs* is a list of 3-tuples [(digest, mod, fname), ...]. A tuple may
+        be extended with (root, relpath, size) to embed the module's location,
+        where *root* is an index into the ROOTS declaration (or None).
+
+        Signatures are keyed by the module their file provides, and sorted
+        by it, so the loader can binary search them. Module names are front
+        coded (each name starts with a byte counting the chars shared with
+        the previous name), file names and paths are pooled.
     """
-    sigs_decl = StringIO.StringIO()
-    sigs_decl.write('const Signature SIGS[] = {\n')
+    table = dict(signature_table(sigs))
+
+    pool = ['']
+    offsets = {'': 0}
+    pool_size = [1]
+
+    def intern(value):
+        r"""return the offset of *value* in the string pool"""
+        if value not in offsets:
+            offsets[value] = pool_size[0]
+            pool_size[0] += len(value) + 1
+            pool.append(value)
+        return offsets[value]
+
+    names_decl = StringIO.StringIO()
+    entries_decl = StringIO.StringIO()
+    prev = ''
+    for mod in sorted(table.keys()):
+        sig = table[mod]
+        shared = 0
+        while shared < min(len(prev), len(mod), 255) and \
+                prev[shared] == mod[shared]:
+            shared += 1
+        names_decl.write('\t"\\%03o%s\\000"\n' % (shared, mod[shared:]))
+        prev = mod
+
+        root, relpath, size = -1, '', 0
+        if len(sig) > 3 and sig[3] is not None:
+            root, relpath, size = sig[3:]
+        entries_decl.write('\t{%s, %d, %d, %d, %d},\n' % (
+            c_bytes(binascii.unhexlify(sig[0])), intern(sig[2]), root,
+            intern(relpath), size))
+
+    if not table:
+        return 'const SigTable SIGS = {"", "", NULL, 0};\n'
 
-    for sha1, mod, fname in sigs:
-        sigs_decl.write('\t{"%s", "%s", "%s"},\n' % (sha1, mod, fname))
-    sigs_decl.write('\t{NULL, NULL, NULL}\n')
+    sigs_decl = StringIO.StringIO()
+    sigs_decl.write('const char SIG_NAMES[] =\n%s\t;\n' % names_decl.getvalue())
+    sigs_decl.write('const char SIG_STRINGS[] =\n')
+    for value in pool:
+        sigs_decl.write('\t%s "\\000"\n' % c_string(value))
+    sigs_decl.write('\t;\n')
+    sigs_decl.write('const Signature SIG_ENTRIES[] = {\n')
+    sigs_decl.write(entries_decl.getvalue())
     sigs_decl.write('\t};\n')
+    sigs_decl.write('const SigTable SIGS = {SIG_NAMES, SIG_STRINGS, '
+                    'SIG_ENTRIES, %d};\n' % len(table))
 
     return sigs_decl.getvalue()
 
 
-def generate_sigs_decl(py_source, verbose=True, excludes=None, includes=None):
-    r"""Scan *py_source*, and returns C declaration as string.
-        If *verbose* is true, display diagnostic output. Any modules or it's
-        decendants in the *excludes* list will be excluded from signatures
-        declaration. If *includes* list is provided, ONLY generate declarations
-        for the modules in the list.
-
-        The returned string will be formatted:
-
-    .. code-block:: c
+def make_code_decl(py_source, name='SCRIPT_CODE'):
+    r"""Compile *py_source*, and return the C declaration of it's marshalled
+        code object (a Bytecode named *name*), tagged with the magic number
+        of this interpreter. If *py_source* doesn't compile, no code is
+        embedded (the loader will report the error at runtime)."""
+    with open(py_source, 'rb') as fin:
+        source = fin.read()
+    try:
+        code = compile(source, os.path.basename(py_source), 'exec', 0, True)
+    except (SyntaxError, TypeError), exc:
+        log.warn('cannot compile %s: %s' % (py_source, exc))
+        return 'const Bytecode %s = {0, NULL, 0};\n' % name
+
+    data = marshal.dumps(code)
+    magic = struct.unpack('<L', imp.get_magic())[0]
+
+    code_decl = StringIO.StringIO()
+    code_decl.write('const unsigned char %s_DATA[] = {\n' % name)
+    for i in range(0, len(data), 12):
+        code_decl.write('\t%s,\n' % ', '.join('0x%02x' % ord(c)
+                                              for c in data[i:i + 12]))
+    code_decl.write('\t};\n')
+    code_decl.write('const Bytecode %s = {%dL, %s_DATA, sizeof(%s_DATA)};\n'
+                    % (name, magic, name, name))
+    return code_decl.getvalue()
+
+
+def entry_point_name(py_source):
+    r"""Return the name a multi-call loader runs *py_source* as -- the name
+        of it's loader, were it built on it's own"""
+    return os.path.splitext(os.path.basename(py_source))[0]
+
+
+def make_entry_points_decl(scripts, sigs, digest='sha1', tree=0):
+    r"""Accept list of 2-tuples [(py_source, script_sigs), ...], and the
+        signature tuples of all of them merged (see :func:`make_sigs_decl`),
+        and return the C declaration of a multi-call loader's ENTRY_POINTS.
+        Each entry point lists the indexes into SIGS of it's own
+        dependencies, and the digest of it's script (see
+        :func:`content_digest` for *digest* and *tree*)."""
+    index = dict((mod, i) for i, (mod, _) in
+                 enumerate(signature_table(sigs)))
+
+    entries_decl = StringIO.StringIO()
+    points = sorted((entry_point_name(py_source), py_source, script_sigs)
+                    for py_source, script_sigs in scripts)
+    for i, (_, py_source, script_sigs) in enumerate(points):
+        entries_decl.write(make_code_decl(py_source, 'ENTRY_CODE_%d' % i))
+        entries_decl.write('const int ENTRY_SIGS_%d[] = {%s};\n' % (i,
+            ''.join('%d, ' % index[mod] for mod, _ in
+                    signature_table(script_sigs)) + '-1'))
+
+    entries_decl.write('const EntryPoint ENTRY_POINTS_ENTRIES[] = {\n')
+    for i, (name, py_source, _) in enumerate(points):
+        with open(py_source, 'rb') as fin:
+            script_digest = binascii.unhexlify(content_digest(fin.read(),
+                                                              digest, tree))
+        entries_decl.write('\t{%s, %s, %s, &ENTRY_CODE_%d, ENTRY_SIGS_%d},\n'
+            % (c_string(name), c_string(os.path.basename(py_source)),
+               c_bytes(script_digest), i, i))
+    entries_decl.write('\t};\n')
+    entries_decl.write('const EntryPointTable ENTRY_POINTS = '
+                       '{ENTRY_POINTS_ENTRIES, %d};\n' % len(points))
+    return entries_decl.getvalue()
+
+
+def make_frozen_decl(sigs, digest='sha1', tree=0):
+    r"""Accept list of signature tuples (see :func:`make_sigs_decl`), compile
+        the python source modules among them, and return the C declaration
+        of their marshalled code objects, tagged with the magic number of
+        this interpreter. Modules that don't compile (or no longer match
+        their signature, see :func:`content_digest` for *digest* and *tree*)
+        are not frozen."""
+    frozen_decl = StringIO.StringIO()
+    entries = []
+    for index, (mod, sig) in enumerate(signature_table(sigs)):
+        pathname = locate_module(sig[1])[1]
+        if not pathname or not pathname.endswith('.py'):
+            continue
+        pathname = os.path.abspath(pathname)
+        with open(pathname, 'rb') as fin:
+            source = fin.read()
+        if content_digest(source, digest, tree) != sig[0]:
+            continue
+        try:
+            code = compile(source, pathname, 'exec', 0, True)
+        except (SyntaxError, TypeError), exc:
+            log.warn('cannot freeze %s: %s' % (mod, exc))
+            continue
 
-        const Signature SIGS[] = {
-                {"hexdigest1", "module1", "filename1"},
-                {"hexdigest2", "module2", "filename2"},
-                };
-    """
+        data = marshal.dumps(code)
+        name = 'FROZEN_%d' % len(entries)
+        frozen_decl.write('const unsigned char %s[] = {\n' % name)
+        for i in range(0, len(data), 12):
+            frozen_decl.write('\t%s,\n' % ', '.join('0x%02x' % ord(c)
+                                                    for c in data[i:i + 12]))
+        frozen_decl.write('\t};\n')
+        entries.append('\t{%d, %s, %s, sizeof(%s)},\n' % (index,
+            c_string(pathname), name, name))
+
+    if not entries:
+        return 'const FrozenTable FROZEN = {0, NULL, 0};\n'
+
+    magic = struct.unpack('<L', imp.get_magic())[0]
+    frozen_decl.write('const FrozenModule FROZEN_MODULES[] = {\n')
+    frozen_decl.write(''.join(entries))
+    frozen_decl.write('\t};\n')
+    frozen_decl.write('const FrozenTable FROZEN = {%dL, FROZEN_MODULES, %d};\n'
+                      % (magic, len(entries)))
+    return frozen_decl.getvalue()
+
+
+def collect_signatures(py_source, verbose=True, excludes=None, includes=None,
+                       roots=None, digest='sha1', tree=0):
+    r"""Scan *py_source*, and return the list of signature tuples to embed
+        in the loader (see :func:`generate_sigs_decl` for the arguments)."""
 
     excludes = excludes or []
     includes = includes or []
     sigs = []
-    for sha1, mod, fname in module_signatures(py_source, verbose):
+    for sig in module_signatures(py_source, verbose, roots is not None,
+                                 digest, tree):
+        mod = sig[1]
 
         # See if module is in excludes list
 
@@ -387,9 +913,53 @@ def generate_sigs_decl(py_source, verbose=True, excludes=None, includes=None):
         # OR the module is in the includes list
 
         if not includes or mod in includes:
-            sigs.append([sha1, mod, fname])
+            sigs.append(sig)
 
-    return make_sigs_decl(sigs)
+    # map each module's root to it's index in ROOTS
+
+    if roots is not None:
+        script_dir = os.path.realpath(
+                os.path.dirname(os.path.abspath(py_source)))
+        roots = [r or script_dir for r in roots]
+        for sig in sigs:
+            sig[3] = roots.index(sig[3]) if sig[3] in roots else None
+
+    return sigs
+
+
+def generate_sigs_decl(py_source, verbose=True, excludes=None, includes=None,
+                       roots=None, digest='sha1', tree=0):
+    r"""Scan *py_source*, and returns C declaration as string.
+        If *verbose* is true, display diagnostic output. Any modules or it's
+        decendants in the *excludes* list will be excluded from signatures
+        declaration. If *includes* list is provided, ONLY generate declarations
+        for the modules in the list. If *roots* (see :func:`search_roots`) is
+        provided, embed the location of each module under those roots for
+        the loader's pre-interpreter validation. *digest* names the
+        signature algorithm, and *tree* the chunk size of tree digests (see
+        :func:`content_digest`).
+
+        The returned string will be formatted:
+
+    .. code-block:: c
+
+        const char SIG_NAMES[] =
+                "\000module1\000"
+                "\006.sub\000"
+                ;
+        const char SIG_STRINGS[] =
+                "" "\000"
+                "module1.py" "\000"
+                "sub.py" "\000"
+                ;
+        const Signature SIG_ENTRIES[] = {
+                {{0xda, 0x39, ...}, 1, -1, 0, 0},
+                {{0x2f, 0xd4, ...}, 12, -1, 0, 0},
+                };
+        const SigTable SIGS = {SIG_NAMES, SIG_STRINGS, SIG_ENTRIES, 2};
+    """
+    return make_sigs_decl(collect_signatures(py_source, verbose, excludes,
+                                             includes, roots, digest, tree))
 
 
 def parse_rc_version(vstring):
@@ -471,28 +1041,61 @@ class build_signet(_build_ext):
     user_options.extend([
 
         # options that require parameters
+        ('budget=', None,
+         "milliseconds of verification before the script runs, the rest "
+         "is finished in the background (default: verify everything first)"),
         ('cflags=',  None,
          "optional compiler flags (MSVC default is /EHsc)"),
+        ('critical=', None,
+         "list of modules always verified before the script runs "
+         "(comma separated)"),
         ('detection=', None,
          "tamper detection - 0 disabled, 1 warn, 2 normal, 3 signed-binary "
          "(default 2)"),
+        ('digest=', None,
+         "signature digest - sha1, sha256 or blake2b (default sha1)"),
         ('excludes=', None,
          "list of dependant modules to exlcude from signet loader (comma separated)"),
         ('ldflags=', None,
-         "optional linker flags (posix default is -lstdc++)"),
+         "optional linker flags (posix default is -lstdc++,-lpthread)"),
+        ('multicall=', None,
+         "build one loader of this name for every script, run as the "
+         "script's name (through links)"),
         ('template=', None,
          "signet loader template (c or c++)"),
+        ('treehash=', None,
+         "hash files larger than this many megabytes (or kilobytes, "
+         "with a K suffix) in chunks of that size, in parallel"),
 
         # boolean options (no parameter expected)
+        ('cache', None,
+         "cache digests of verified files (posix only)"),
+        ('faststart', None,
+         "start python without site or PYTHON* environment, with the "
+         "build's sys.path"),
+        ('freeze', None,
+         "compile python dependencies into the loader"),
+        ('lazy', None,
+         "verify dependencies when they are first imported"),
         ('mkresource', None,
          "dynamic generation of windows resources"),
+        ('prevalidate', None,
+         "embed dependency locations, verify them before python starts"),
         ('skipdepends', None,
          "do not scan script dependencies"),
+        ('uring', None,
+         "read dependencies in batches through an io_uring (linux only)"),
         ('virtualenv', None,
          "build virtualenv compatible loader"),
+        ('watch', None,
+         "verify files again when they change while the script runs "
+         "(linux only)"),
         ])
 
-    boolean_options.extend(['mkresource', 'skipdepends', 'virtaulenv'])
+    boolean_options.extend(['cache', 'faststart', 'freeze', 'lazy',
+                            'mkresource',
+                            'prevalidate',
+                            'skipdepends', 'uring', 'virtaulenv', 'watch'])
 
     def __init__(self, dist):
         r"""initialize local variables -- BEFORE calling the
@@ -516,14 +1119,26 @@ class build_signet(_build_ext):
 
         _build_ext.initialize_options(self)
 
+        self.budget = None
+        self.cache = None
         self.cflags = []
+        self.critical = None
         self.detection = None
+        self.digest = None
         self.excludes = None
+        self.faststart = None
+        self.freeze = None
+        self.lazy = None
         self.ldflags = []
         self.mkresource = None
+        self.multicall = None
+        self.prevalidate = None
         self.skipdepends = None
         self.template = None
+        self.treehash = None
+        self.uring = None
         self.virtualenv = None
+        self.watch = None
 
 
     def finalize_options(self):
@@ -568,7 +1183,7 @@ class build_signet(_build_ext):
         if not self.ldflags and opts:
             self.opts = opts.get('ldflags', (None, []))[1]
         if not self.ldflags and os.name == 'posix':
-            self.ldflags = ['-lstdc++',]
+            self.ldflags = ['-lstdc++', '-lpthread']
         if isinstance(self.ldflags, str):
             # pylint: disable=E1103
             self.ldlags = self.ldlags.split(',')
@@ -583,6 +1198,35 @@ class build_signet(_build_ext):
         else:
             self.detection = int(self.detection)
 
+        # validate digest
+
+        if self.digest is None:
+            if opts:
+                self.digest = opts.get('digest', (None, 'sha1'))[1]
+            else:
+                self.digest = 'sha1'
+        new_digest(self.digest)
+
+        # validate treehash
+
+        if self.treehash is None and opts:
+            self.treehash = opts.get('treehash', (None, None))[1]
+        if self.treehash is not None:
+            size = str(self.treehash).strip().upper()
+            scale = 1024 * 1024
+            if size.endswith('K'):
+                (size, scale) = (size[:-1], 1024)
+            elif size.endswith('M'):
+                size = size[:-1]
+            try:
+                self.treehash = int(size) * scale
+            except ValueError:
+                self.treehash = 0
+            if self.treehash < 1:
+                raise DistutilsSetupError("'treehash' must be a number of "
+                        "megabytes, or of kilobytes with a K suffix "
+                        "(1 or more)")
+
         # validate excludes
 
         if self.excludes is None:
@@ -595,11 +1239,80 @@ class build_signet(_build_ext):
             # pylint: disable=E1103
             self.excludes = self.excludes.split(',')
 
+        # validate budget
+
+        if self.budget is None and opts:
+            self.budget = opts.get('budget', (None, None))[1]
+        if self.budget is not None:
+            try:
+                self.budget = int(self.budget)
+            except ValueError:
+                self.budget = -1
+            if self.budget < 0:
+                raise DistutilsSetupError("'budget' must be a number of "
+                        "milliseconds (0 or more)")
+
+        # validate critical
+
+        if self.critical is None:
+            if opts:
+                self.critical = opts.get('critical', (None, []))[1]
+            else:
+                self.critical = []
+
+        if isinstance(self.critical, str):
+            # pylint: disable=E1103
+            self.critical = self.critical.split(',')
+
+        # validate multicall
+
+        if self.multicall is None and opts:
+            self.multicall = opts.get('multicall', (None, None))[1]
+        if self.multicall is not None and (not self.multicall or
+                os.path.basename(self.multicall) != self.multicall):
+            raise DistutilsSetupError("'multicall' must be a loader name "
+                    "(not a path)")
+
         # validate skipdepends
 
         if self.skipdepends is None and opts:
             self.skipdepends = opts.get('skipdepends', (None, None))[1]
 
+        # validate cache
+
+        if self.cache is None and opts:
+            self.cache = opts.get('cache', (None, None))[1]
+
+        # validate faststart
+
+        if self.faststart is None and opts:
+            self.faststart = opts.get('faststart', (None, None))[1]
+
+        # validate freeze
+
+        if self.freeze is None and opts:
+            self.freeze = opts.get('freeze', (None, None))[1]
+
+        # validate lazy
+
+        if self.lazy is None and opts:
+            self.lazy = opts.get('lazy', (None, None))[1]
+
+        # validate watch
+
+        if self.watch is None and opts:
+            self.watch = opts.get('watch', (None, None))[1]
+
+        # validate uring
+
+        if self.uring is None and opts:
+            self.uring = opts.get('uring', (None, None))[1]
+
+        # validate prevalidate
+
+        if self.prevalidate is None and opts:
+            self.prevalidate = opts.get('prevalidate', (None, None))[1]
+
         # validate virtualenv
 
         if self.virtualenv is None and opts:
@@ -617,26 +1330,49 @@ class build_signet(_build_ext):
             raise DistutilsSetupError("'mkresource' is only a valid "
                     "option on windows")
 
-    def generate_loader_source(self, py_source):
+    def generate_loader_source(self, py_source, multicall=None):
         r"""Generate loader source code
 
         Read from a loader template and write out c/c++ source code, making
-        suitable substitutions.
+        suitable substitutions. The loader runs the script *py_source*. With
+        *multicall* (the loader's name), *py_source* may be a list of
+        scripts, and the loader has an entry point for each of them, sharing
+        one signature table.
         """
+        # R0912 (too-many-branches)
         # R0914 (too-many-locals)
-        # pylint: disable=R0914
+        # R0915 (too-many-statements)
+        # pylint: disable=R0912, R0914, R0915
 
         includes = None
-
-        sig_decls = []
-        if not self.skipdepends:
-            sig_decls = generate_sigs_decl(py_source, verbose=False,
-                            excludes=self.excludes, includes=includes)
+        py_sources = py_source
+        if isinstance(py_sources, basestring):
+            py_sources = [py_sources]
+        py_source = py_sources[0]
+        tree = self.treehash or 0
+
+        roots = None
+        if self.faststart or (self.prevalidate and not self.skipdepends):
+            roots = search_roots(py_source)
+        sig_roots = roots if self.prevalidate else None
+
+        scripts = []
+        for source in py_sources:
+            script_sigs = []
+            if not self.skipdepends:
+                script_sigs = collect_signatures(source, verbose=False,
+                                excludes=self.excludes, includes=includes,
+                                roots=sig_roots, digest=self.digest,
+                                tree=tree)
+            scripts.append((source, script_sigs))
+        sigs = [sig for _, script_sigs in scripts for sig in script_sigs]
+        sig_decls = make_sigs_decl(sigs) if sigs else []
 
         self.debug_print(sig_decls)
 
         loader_source = os.path.join(self.build_lib,
-                            os.path.basename(py_source[0:-3]) + '.cpp')
+                            (multicall or entry_point_name(py_source)) +
+                            '.cpp')
 
         with open(self.template) as fin:
             with open(loader_source, 'w') as fout:
@@ -645,30 +1381,77 @@ class build_signet(_build_ext):
 
         script_digest = None
         with open(py_source, 'rb') as fin:
-            script_digest = hashlib.sha1(fin.read()).hexdigest()
+            script_digest = binascii.unhexlify(content_digest(fin.read(),
+                                                              self.digest,
+                                                              tree))
 
+        size_tag = 'const size_t DIGEST_SIZE'
+        algorithm_tag = 'const int DIGEST_ALGORITHM'
+        tree_tag = 'long long TREE_CHUNK'
         script_tag = 'const char SCRIPT[]'
-        digest_tag = 'const char SCRIPT_HEXDIGEST[]'
-        sigs_tag = 'const Signature SIGS[]'
+        digest_tag = 'const unsigned char SCRIPT_DIGEST[DIGEST_SIZE]'
+        code_tag = 'const Bytecode SCRIPT_CODE'
+        sigs_tag = 'const SigTable SIGS'
+        frozen_tag = 'const FrozenTable FROZEN'
+        roots_tag = 'const char* const ROOTS[]'
+        cache_tag = 'const char CACHE_KEY[]'
+        lazy_tag = 'int LAZY'
+        budget_tag = 'int BUDGET'
+        critical_tag = 'const char* const CRITICAL[]'
+        watch_tag = 'int WATCH'
+        uring_tag = 'int URING'
+        faststart_tag = 'int FASTSTART'
+        entry_tag = 'const EntryPointTable ENTRY_POINTS'
         tamp_tag = 'int TAMPER'
 
-        found_script, found_digest, found_sigs, found_tamp = (False, False,
-                False, False)
+        found_size, found_algorithm, found_tree, found_script, \
+                found_digest, found_code, found_sigs, found_frozen, \
+                found_roots, found_cache, found_lazy, found_budget, \
+                found_critical, found_watch, found_uring, found_faststart, \
+                found_entry, found_tamp = (False,) * 18
 
         loader_hdr = os.path.join(self.signet_root, 'templates', 'loader.h')
         with open(loader_hdr) as fin:
             tgt_hdr = os.path.join(self.build_lib, 'loader.h')
             with open(tgt_hdr, 'w') as fout:
                 for line in fin:
+                    # found DIGEST_SIZE declaration ?
+                    if line.startswith(size_tag):
+                        fout.write('%s = %d;\n' % (size_tag,
+                            len(script_digest)))
+                        found_size = True
+                    # found DIGEST_ALGORITHM declaration ?
+                    elif line.startswith(algorithm_tag):
+                        fout.write('%s = %d;\t/* %s */\n' % (algorithm_tag,
+                            DIGESTS.index(self.digest), self.digest))
+                        found_algorithm = True
+                    # found TREE_CHUNK declaration ?
+                    elif line.startswith(tree_tag):
+                        fout.write('%s = %dLL;\n' % (tree_tag, tree))
+                        found_tree = True
                     # found SCRIPT declaration ?
-                    if line.startswith(script_tag):
-                        fout.write('%s = "%s";\n' % (script_tag,
-                            os.path.basename(py_source)))
+                    elif line.startswith(script_tag):
+                        if multicall:
+                            fout.write(line)
+                        else:
+                            fout.write('%s = "%s";\n' % (script_tag,
+                                os.path.basename(py_source)))
                         found_script = True
-                    # found SCRIPT_HEXDIGEST declaration ?
+                    # found SCRIPT_DIGEST declaration ?
                     elif line.startswith(digest_tag):
-                        fout.write('%s = "%s";\n' % (digest_tag, script_digest))
+                        if multicall:
+                            fout.write(line)
+                        else:
+                            fout.write('%s = %s;\n' % (digest_tag,
+                                c_bytes(script_digest)))
                         found_digest = True
+                    # found SCRIPT_CODE declaration ?
+                    elif line.startswith(code_tag):
+                        if multicall:
+                            fout.write(line)
+                        else:
+                            fout.write(make_code_decl(py_source))
+                        found_code = True
                     # found SIGS declatation ?
                     elif line.startswith(sigs_tag):
                         if sig_decls:
@@ -676,6 +1459,67 @@ class build_signet(_build_ext):
                         else:
                             fout.write(line)
                         found_sigs = True
+                    # found FROZEN declaration ?
+                    elif line.startswith(frozen_tag):
+                        if self.freeze and sigs:
+                            fout.write(make_frozen_decl(sigs, self.digest,
+                                                        tree))
+                        else:
+                            fout.write(line)
+                        found_frozen = True
+                    # found ROOTS declaration ?
+                    elif line.startswith(roots_tag):
+                        if roots:
+                            fout.write(make_roots_decl(roots))
+                        else:
+                            fout.write(line)
+                        found_roots = True
+                    # found CACHE_KEY declaration ?
+                    elif line.startswith(cache_tag):
+                        cache_key = ''
+                        if self.cache:
+                            cache_key = binascii.hexlify(os.urandom(32))
+                        fout.write('%s = "%s";\n' % (cache_tag, cache_key))
+                        found_cache = True
+                    # found LAZY declaration ?
+                    elif line.startswith(lazy_tag):
+                        fout.write('%s = %d;\n' % (lazy_tag,
+                            1 if self.lazy else 0))
+                        found_lazy = True
+                    # found BUDGET declaration ?
+                    elif line.startswith(budget_tag):
+                        fout.write('%s = %d;\n' % (budget_tag,
+                            -1 if self.budget is None else self.budget))
+                        found_budget = True
+                    # found CRITICAL declaration ?
+                    elif line.startswith(critical_tag):
+                        fout.write('%s = {%s};\n' % (critical_tag,
+                            ''.join('"%s", ' % mod for mod in self.critical
+                                    if mod) + 'NULL'))
+                        found_critical = True
+                    # found WATCH declaration ?
+                    elif line.startswith(watch_tag):
+                        fout.write('%s = %d;\n' % (watch_tag,
+                            1 if self.watch else 0))
+                        found_watch = True
+                    # found URING declaration ?
+                    elif line.startswith(uring_tag):
+                        fout.write('%s = %d;\n' % (uring_tag,
+                            1 if self.uring else 0))
+                        found_uring = True
+                    # found FASTSTART declaration ?
+                    elif line.startswith(faststart_tag):
+                        fout.write('%s = %d;\n' % (faststart_tag,
+                            1 if self.faststart else 0))
+                        found_faststart = True
+                    # found ENTRY_POINTS declaration ?
+                    elif line.startswith(entry_tag):
+                        if multicall:
+                            fout.write(make_entry_points_decl(scripts, sigs,
+                                self.digest, tree))
+                        else:
+                            fout.write(line)
+                        found_entry = True
                     # found tamper protection decl?
                     elif line.startswith(tamp_tag):
                         fout.write('%s = %d;\n' % (tamp_tag, self.detection))
@@ -683,9 +1527,23 @@ class build_signet(_build_ext):
                     else:
                         fout.write(line)
 
-        for found, tag in ((found_script, script_tag),
+        for found, tag in ((found_size, size_tag),
+                           (found_algorithm, algorithm_tag),
+                           (found_tree, tree_tag),
+                           (found_script, script_tag),
                            (found_digest, digest_tag),
+                           (found_code, code_tag),
                            (found_sigs, sigs_tag),
+                           (found_frozen, frozen_tag),
+                           (found_roots, roots_tag),
+                           (found_cache, cache_tag),
+                           (found_lazy, lazy_tag),
+                           (found_budget, budget_tag),
+                           (found_critical, critical_tag),
+                           (found_watch, watch_tag),
+                           (found_uring, uring_tag),
+                           (found_faststart, faststart_tag),
+                           (found_entry, entry_tag),
                            (found_tamp, tamp_tag)):
             if not found:
                 raise DistutilsSetupError("missing declaration '%s' in %s"
@@ -777,31 +1635,99 @@ class build_signet(_build_ext):
 
         return rcfile
 
-    def build_extension(self, ext):
-        r"""perform the build action(s)"""
+    def build_extensions(self):
+        r"""build a loader for each extension, or with *multicall*, one
+            multi-call loader for all of them"""
 
-        # R0912 (too-many-branches)
-        # R0914 (too-many-locals)
-        # pylint: disable=R0912, R0914
+        if not self.multicall:
+            _build_ext.build_extensions(self)
+            return
+
+        self.check_extensions_list(self.extensions)
+        self.build_multicall(self.extensions)
 
-        if ext.sources is None or len(ext.sources) > 1:
+    @staticmethod
+    def extension_source(ext):
+        r"""return the python script extension *ext* builds a loader for"""
+
+        if ext.sources is None or len(ext.sources) != 1:
             raise DistutilsSetupError(
                 "in 'ext_modules' options (extension '%s'), "
                 "'sources' must be present and must be "
                 "a single source filename" % ext.name)
+        return ext.sources[0]
+
+    def build_extension(self, ext):
+        r"""perform the build action(s)"""
+
+        py_source = self.extension_source(ext)
+        self.build_loader([ext], os.path.splitext(py_source)[0])
+
+    def build_multicall(self, exts):
+        r"""build one loader, named *multicall*, that runs every script of
+            *exts*, and link each script's loader name to it"""
+
+        py_sources = [self.extension_source(ext) for ext in exts]
+
+        # the loader finds the scripts next to itself
+
+        script_dir = os.path.dirname(os.path.abspath(py_sources[0]))
+        for py_source in py_sources:
+            if os.path.dirname(os.path.abspath(py_source)) != script_dir:
+                raise DistutilsSetupError("'multicall' scripts must share "
+                        "a directory (%s is not in %s)" % (py_source,
+                        script_dir))
+
+        names = [entry_point_name(py_source) for py_source in py_sources]
+        if len(set(names)) != len(names):
+            raise DistutilsSetupError("'multicall' scripts must have "
+                    "unique names")
+
+        exe_base = os.path.join(os.path.dirname(py_sources[0]),
+                                self.multicall)
+        self.build_loader(exts, exe_base, self.multicall)
+
+        # one (hard) link per entry point
+
+        exe_ext = '.exe' if os.name == 'nt' else ''
+        for name in names:
+            if name == self.multicall:
+                continue
+            link = os.path.join(os.path.dirname(exe_base), name + exe_ext)
+            if os.path.exists(link):
+                if os.path.samefile(link, exe_base + exe_ext):
+                    continue
+                os.remove(link)
+            log.info("linking %s -> %s", link, exe_base + exe_ext)
+            try:
+                os.link(exe_base + exe_ext, link)
+            except (AttributeError, OSError):
+                shutil.copy2(exe_base + exe_ext, link)
+
+    def build_loader(self, exts, exe_base, multicall=None):
+        r"""build the loader *exe_base* (less .exe) for the scripts of
+            extensions *exts*, a multi-call loader if *multicall* (it's
+            name) is given"""
+
+        # R0912 (too-many-branches)
+        # R0914 (too-many-locals)
+        # pylint: disable=R0912, R0914
 
-        py_source = ext.sources[0]
+        py_sources = [self.extension_source(ext) for ext in exts]
+        name = multicall or exts[0].name
 
-        depends = ext.sources + ext.depends
-        exe_path = os.path.splitext(py_source)[0]
+        depends = []
+        for ext in exts:
+            depends.extend(ext.sources + ext.depends)
+        exe_path = exe_base
         if os.name == 'nt':
             exe_path += '.exe'
 
         if not (self.force or newer_group(depends, exe_path, 'newer')):
-            log.info("skipping '%s' loader (up-to-date)", ext.name)
+            log.info("skipping '%s' loader (up-to-date)", name)
             return
         else:
-            log.info("building '%s' signet loader", ext.name)
+            log.info("building '%s' signet loader", name)
 
         # Copy libary files from signet pakage to our intended
         # target directory
@@ -811,52 +1737,67 @@ class build_signet(_build_ext):
         # Build list of source files we are compiling -> objs
         # (loader template + library code)
 
-        loader_sources = [self.generate_loader_source(py_source)]
+        loader_sources = [self.generate_loader_source(py_sources, multicall)]
         for lib_source in lib_sources:
             if os.path.splitext(lib_source)[1] in self.loader_exts:
                 loader_sources.append(lib_source)
 
         if self.mkresource:
-            loader_sources.append(self.generate_rcfile(py_source, self.build_lib))
+            loader_sources.append(self.generate_rcfile(py_sources[0],
+                                                       self.build_lib))
 
         # Add extra compiler args (from Extension or command line)
 
-        extra_args = ext.extra_compile_args or []
+        extra_args = []
+        for ext in exts:
+            extra_args.extend(ext.extra_compile_args or [])
         if self.cflags:
             extra_args += self.cflags
 
         # Add macros (and remove undef'ed macros)
 
-        macros = ext.define_macros[:]
-        for undef in ext.undef_macros:
-            macros.append((undef,))
+        macros = []
+        include_dirs = []
+        for ext in exts:
+            macros.extend(ext.define_macros)
+            for undef in ext.undef_macros:
+                macros.append((undef,))
+            include_dirs.extend(ext.include_dirs)
 
         # compile
 
         objects = self.compiler.compile(loader_sources,
                     macros = macros,
-                    include_dirs = ext.include_dirs,
+                    include_dirs = include_dirs,
                     debug = self.debug,
                     extra_postargs = extra_args,
-                    depends = ext.depends)
+                    depends = depends)
 
         self._built_objects = objects[:]
 
         # Add extra objs to link pass
 
-        if ext.extra_objects:
-            objects.extend(ext.extra_objects)
+        for ext in exts:
+            if ext.extra_objects:
+                objects.extend(ext.extra_objects)
 
         # Add extra link arguments
 
-        extra_args = ext.extra_link_args or []
+        extra_args = []
+        for ext in exts:
+            extra_args.extend(ext.extra_link_args or [])
         if self.ldflags:
             extra_args.extend(self.ldflags)
 
         # Extra link libraries
 
         library_dirs = []
-        libraries = self.get_libraries(ext)
+        libraries = []
+        runtime_library_dirs = []
+        for ext in exts:
+            libraries.extend(lib for lib in self.get_libraries(ext)
+                             if lib not in libraries)
+            runtime_library_dirs.extend(ext.runtime_library_dirs or [])
         if os.name == 'posix':
             pylib = ('python%d.%d' %
                      (sys.hexversion >> 24, (sys.hexversion >> 16) & 0xff))
@@ -870,9 +1811,9 @@ class build_signet(_build_ext):
 
         self.compiler.link_executable(
                 objects,
-                os.path.splitext(py_source)[0],
+                exe_base,
                 libraries = libraries,
                 library_dirs = library_dirs,
-                runtime_library_dirs = ext.runtime_library_dirs,
+                runtime_library_dirs = runtime_library_dirs,
                 extra_postargs = extra_args,
                 debug = self.debug)
@@ -0,0 +1,135 @@
+#include <string.h>
+
+#include "blake2b.h"
+
+static const uint64_t IV[8] = {
+	0x6a09e667f3bcc908ULL, 0xbb67ae8584caa73bULL,
+	0x3c6ef372fe94f82bULL, 0xa54ff53a5f1d36f1ULL,
+	0x510e527fade682d1ULL, 0x9b05688c2b3e6c1fULL,
+	0x1f83d9abfb41bd6bULL, 0x5be0cd19137e2179ULL
+	};
+
+static const unsigned char SIGMA[12][16] = {
+	{ 0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15},
+	{14, 10, 4, 8, 9, 15, 13, 6, 1, 12, 0, 2, 11, 7, 5, 3},
+	{11, 8, 12, 0, 5, 2, 15, 13, 10, 14, 3, 6, 7, 1, 9, 4},
+	{ 7, 9, 3, 1, 13, 12, 11, 14, 2, 6, 5, 10, 4, 0, 15, 8},
+	{ 9, 0, 5, 7, 2, 4, 10, 15, 14, 1, 11, 12, 6, 8, 3, 13},
+	{ 2, 12, 6, 10, 0, 11, 8, 3, 4, 13, 7, 5, 15, 14, 1, 9},
+	{12, 5, 1, 15, 14, 13, 4, 10, 0, 7, 6, 3, 9, 2, 8, 11},
+	{13, 11, 7, 14, 12, 1, 3, 9, 5, 0, 15, 4, 8, 6, 2, 10},
+	{ 6, 15, 14, 9, 11, 3, 0, 8, 12, 2, 13, 7, 1, 4, 10, 5},
+	{10, 2, 8, 4, 7, 6, 1, 5, 15, 11, 9, 14, 3, 12, 13, 0},
+	{ 0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15},
+	{14, 10, 4, 8, 9, 15, 13, 6, 1, 12, 0, 2, 11, 7, 5, 3}
+	};
+
+#define ROR64(x, n) (((x) >> (n)) | ((x) << (64 - (n))))
+
+#define G(a, b, c, d, x, y)				\
+	do {								\
+		v[a] = v[a] + v[b] + (x);		\
+		v[d] = ROR64(v[d] ^ v[a], 32);	\
+		v[c] = v[c] + v[d];				\
+		v[b] = ROR64(v[b] ^ v[c], 24);	\
+		v[a] = v[a] + v[b] + (y);		\
+		v[d] = ROR64(v[d] ^ v[a], 16);	\
+		v[c] = v[c] + v[d];				\
+		v[b] = ROR64(v[b] ^ v[c], 63);	\
+		} while (0)
+
+/* mix the 128 byte *block* into the state, *last* for the final block */
+
+static void compress(Blake2bContext* ctx, const unsigned char* block, 
+		int last) {
+
+	uint64_t m[16], v[16];
+
+	for(int i = 0; i < 16; i++) {
+		const unsigned char* p = block + 8*i;
+		m[i] = (uint64_t)p[0] | ((uint64_t)p[1] << 8) | 
+			((uint64_t)p[2] << 16) | ((uint64_t)p[3] << 24) |
+			((uint64_t)p[4] << 32) | ((uint64_t)p[5] << 40) | 
+			((uint64_t)p[6] << 48) | ((uint64_t)p[7] << 56);
+		}
+	for(int i = 0; i < 8; i++) {
+		v[i] = ctx->h[i];
+		v[i+8] = IV[i];
+		}
+	v[12] ^= ctx->t[0];
+	v[13] ^= ctx->t[1];
+	if (last)
+		v[14] = ~v[14];
+
+	for(int r = 0; r < 12; r++) {
+		const unsigned char* s = SIGMA[r];
+		G(0, 4,  8, 12, m[s[ 0]], m[s[ 1]]);
+		G(1, 5,  9, 13, m[s[ 2]], m[s[ 3]]);
+		G(2, 6, 10, 14, m[s[ 4]], m[s[ 5]]);
+		G(3, 7, 11, 15, m[s[ 6]], m[s[ 7]]);
+		G(0, 5, 10, 15, m[s[ 8]], m[s[ 9]]);
+		G(1, 6, 11, 12, m[s[10]], m[s[11]]);
+		G(2, 7,  8, 13, m[s[12]], m[s[13]]);
+		G(3, 4,  9, 14, m[s[14]], m[s[15]]);
+		}
+
+	for(int i = 0; i < 8; i++) {
+		ctx->h[i] ^= v[i] ^ v[i+8];
+		}
+	}
+
+/* count *size* more bytes hashed */
+
+static void increment(Blake2bContext* ctx, size_t size) {
+	ctx->t[0] += size;
+	if (ctx->t[0] < size)
+		ctx->t[1]++;
+	}
+
+void blake2b_init(Blake2bContext* ctx, size_t size) {
+	memcpy(ctx->h, IV, sizeof(IV));
+	ctx->h[0] ^= 0x01010000ULL ^ size;	/* depth 1, fanout 1, no key */
+	ctx->t[0] = ctx->t[1] = 0;
+	ctx->used = 0;
+	ctx->size = size;
+	}
+
+void blake2b_update(Blake2bContext* ctx, const void* data, size_t size) {
+
+	const unsigned char* bytes = (const unsigned char*)data;
+
+	/* the last block is compressed by blake2b_final, so a full buffer is
+	 * only compressed once more data arrives */
+
+	while (size > 0) {
+		if (ctx->used == sizeof(ctx->buffer)) {
+			increment(ctx, ctx->used);
+			compress(ctx, ctx->buffer, 0);
+			ctx->used = 0;
+			}
+		if (ctx->used == 0) {
+			for(; size > sizeof(ctx->buffer); bytes += 128, size -= 128) {
+				increment(ctx, 128);
+				compress(ctx, bytes, 0);
+				}
+			}
+		size_t fill = sizeof(ctx->buffer) - ctx->used;
+		if (fill > size)
+			fill = size;
+		memcpy(ctx->buffer + ctx->used, bytes, fill);
+		ctx->used += fill;
+		bytes += fill;
+		size -= fill;
+		}
+	}
+
+void blake2b_final(Blake2bContext* ctx, unsigned char digest[]) {
+
+	increment(ctx, ctx->used);
+	memset(ctx->buffer + ctx->used, 0, sizeof(ctx->buffer) - ctx->used);
+	compress(ctx, ctx->buffer, 1);
+
+	for(size_t i = 0; i < ctx->size; i++) {
+		digest[i] = (unsigned char)(ctx->h[i / 8] >> (8 * (i % 8)));
+		}
+	}
@@ -0,0 +1,31 @@
+#ifndef _BLAKE2B_H_
+#define _BLAKE2B_H_
+
+#include <stddef.h>
+
+#if defined(_MSC_VER) && _MSC_VER < 1600
+typedef unsigned __int64 uint64_t;
+#else
+#include <stdint.h>
+#endif
+
+/* BLAKE2b (RFC 7693), unkeyed, portable C */
+
+const size_t BLAKE2B_MAX_SIZE = 64;	/* largest digest, in bytes */
+
+struct Blake2bContext {
+	uint64_t h[8];				/* chained state */
+	uint64_t t[2];				/* bytes hashed (128 bit counter) */
+	unsigned char buffer[128];	/* partial (or last) block */
+	size_t used;				/* bytes in buffer */
+	size_t size;				/* digest size */
+	};
+
+/* start a digest of *size* bytes (1 to BLAKE2B_MAX_SIZE) */
+void blake2b_init(Blake2bContext* ctx, size_t size);
+void blake2b_update(Blake2bContext* ctx, const void* data, size_t size);
+
+/* store the digest (of the size given to blake2b_init) in *digest* */
+void blake2b_final(Blake2bContext* ctx, unsigned char digest[]);
+
+#endif
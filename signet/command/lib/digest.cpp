@@ -0,0 +1,90 @@
+#include <string.h>
+
+#include "digest.h"
+
+const size_t BLAKE2B_SIZE = 32;
+
+size_t digest_size(int algorithm) {
+	switch (algorithm) {
+		case DIGEST_SHA1:
+			return SHA1_HASH_SIZE;
+		case DIGEST_SHA256:
+			return SHA256_SIZE;
+		case DIGEST_BLAKE2B:
+			return BLAKE2B_SIZE;
+		}
+	return 0;
+	}
+
+const char* digest_name(int algorithm) {
+	switch (algorithm) {
+		case DIGEST_SHA1:
+			return "sha1";
+		case DIGEST_SHA256:
+			return "sha256";
+		case DIGEST_BLAKE2B:
+			return "blake2b";
+		}
+	return "unknown";
+	}
+
+void digest_init(DigestContext* ctx, int algorithm) {
+	ctx->algorithm = algorithm;
+	switch (algorithm) {
+		case DIGEST_SHA1:
+			Sha1Initialise(&ctx->ctx.sha1);
+			break;
+		case DIGEST_SHA256:
+			sha256_init(&ctx->ctx.sha256);
+			break;
+		case DIGEST_BLAKE2B:
+			blake2b_init(&ctx->ctx.blake2b, BLAKE2B_SIZE);
+			break;
+		}
+	}
+
+/* feed *size* (at most 1GB) bytes at *data* to *ctx* */
+
+static void update(DigestContext* ctx, const char* data, size_t size) {
+	switch (ctx->algorithm) {
+		case DIGEST_SHA1:
+			Sha1Update(&ctx->ctx.sha1, (void*)data, (uint32_t)size);
+			break;
+		case DIGEST_SHA256:
+			sha256_update(&ctx->ctx.sha256, data, size);
+			break;
+		case DIGEST_BLAKE2B:
+			blake2b_update(&ctx->ctx.blake2b, data, size);
+			break;
+		}
+	}
+
+void digest_update(DigestContext* ctx, const void* data, 
+		unsigned long long size) {
+
+	/* Sha1Update takes a 32 bit size (and size_t may be 32 bits) */
+
+	const char* bytes = (const char*)data;
+	const unsigned long long chunk = 1 << 30;
+	for(; size > chunk; bytes += chunk, size -= chunk) {
+		update(ctx, bytes, (size_t)chunk);
+		}
+	update(ctx, bytes, (size_t)size);
+	}
+
+void digest_final(DigestContext* ctx, unsigned char digest[]) {
+	switch (ctx->algorithm) {
+		case DIGEST_SHA1: {
+			SHA1_HASH hash;
+			Sha1Finalise(&ctx->ctx.sha1, &hash);
+			memcpy(digest, hash.bytes, SHA1_HASH_SIZE);
+			break;
+			}
+		case DIGEST_SHA256:
+			sha256_final(&ctx->ctx.sha256, digest);
+			break;
+		case DIGEST_BLAKE2B:
+			blake2b_final(&ctx->ctx.blake2b, digest);
+			break;
+		}
+	}
@@ -0,0 +1,46 @@
+#ifndef _DIGEST_H_
+#define _DIGEST_H_
+
+#include <stddef.h>
+
+#include "blake2b.h"
+#include "sha1.h"
+#include "sha256.h"
+
+/* The digest algorithms a loader can be built with (build_signet --digest).
+ * Values are those of the loader's DIGEST_ALGORITHM */
+
+enum {
+	DIGEST_SHA1 = 0,
+	DIGEST_SHA256 = 1,
+	DIGEST_BLAKE2B = 2			/* BLAKE2b with a 32 byte digest */
+	};
+
+const size_t DIGEST_MAX_SIZE = 32;	/* largest digest, in bytes */
+
+struct DigestContext {
+	int algorithm;
+	union {
+		Sha1Context sha1;
+		Sha256Context sha256;
+		Blake2bContext blake2b;
+		} ctx;
+	};
+
+/* return the bytes in an *algorithm* digest, 0 if unknown */
+
+size_t digest_size(int algorithm);
+
+/* return the name of *algorithm* ("sha1", "sha256" or "blake2b") */
+
+const char* digest_name(int algorithm);
+
+void digest_init(DigestContext* ctx, int algorithm);
+void digest_update(DigestContext* ctx, const void* data, 
+		unsigned long long size);
+
+/* store the raw digest (digest_size() bytes) in *digest* */
+
+void digest_final(DigestContext* ctx, unsigned char digest[]);
+
+#endif
@@ -0,0 +1,420 @@
+#include <ctype.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+
+#include <algorithm>
+#include <sstream>
+#include <vector>
+
+#include "digestcache.h"
+#include "digest.h"
+
+#ifndef _MSC_VER
+#include <errno.h>
+#include <fcntl.h>
+#include <sys/file.h>
+#include <unistd.h>
+#endif
+
+using namespace std;
+
+const char CACHE_MAGIC[] = "signet-cache 1\n";
+const char CACHE_HMAC[] = "hmac ";
+
+// seconds before the last use time of a cache hit is refreshed on disk,
+// so warm starts don't rewrite the cache file every time
+
+const long long CACHE_TOUCH = 3600;
+
+#if defined(__APPLE__)
+#define ST_MTIME_NS(st) ((long long)(st).st_mtimespec.tv_sec * 1000000000 + \
+		(st).st_mtimespec.tv_nsec)
+#define ST_CTIME_NS(st) ((long long)(st).st_ctimespec.tv_sec * 1000000000 + \
+		(st).st_ctimespec.tv_nsec)
+#elif !defined(_MSC_VER)
+#define ST_MTIME_NS(st) ((long long)(st).st_mtim.tv_sec * 1000000000 + \
+		(st).st_mtim.tv_nsec)
+#define ST_CTIME_NS(st) ((long long)(st).st_ctim.tv_sec * 1000000000 + \
+		(st).st_ctim.tv_nsec)
+#endif
+
+/* return *len* bytes at *data* as lower case hex */
+
+static string hexlify(const unsigned char* data, size_t len) {
+	static const char digits[] = "0123456789abcdef";
+	string hex;
+	for(size_t i = 0; i < len; i++) {
+		hex += digits[data[i] >> 4];
+		hex += digits[data[i] & 0xf];
+		}
+	return hex;
+	}
+
+/* return the bytes of hex string *hex* */
+
+static string unhexlify(const char* hex) {
+	string data;
+	for(; hex[0] && hex[1]; hex += 2) {
+		unsigned int byte;
+		if (sscanf(hex, "%2x", &byte) != 1)
+			break;
+		data += (char)byte;
+		}
+	return data;
+	}
+
+/* return the HMAC-SHA1 (hex) of *data* under *key* */
+
+static string hmac_sha1(const string& key, const string& data) {
+
+	unsigned char block[64];
+	memset(block, 0, sizeof(block));
+
+	Sha1Context ctx;
+	SHA1_HASH digest;
+
+	if (key.size() > sizeof(block)) {
+		Sha1Initialise(&ctx);
+		Sha1Update(&ctx, (void*)key.data(), (uint32_t)key.size());
+		Sha1Finalise(&ctx, &digest);
+		memcpy(block, digest.bytes, sizeof(digest.bytes));
+		}
+	else{
+		memcpy(block, key.data(), key.size());
+		}
+
+	unsigned char pad[64];
+
+	for(size_t i = 0; i < sizeof(pad); i++)
+		pad[i] = block[i] ^ 0x36;
+	Sha1Initialise(&ctx);
+	Sha1Update(&ctx, pad, sizeof(pad));
+	Sha1Update(&ctx, (void*)data.data(), (uint32_t)data.size());
+	Sha1Finalise(&ctx, &digest);
+
+	for(size_t i = 0; i < sizeof(pad); i++)
+		pad[i] = block[i] ^ 0x5c;
+	Sha1Initialise(&ctx);
+	Sha1Update(&ctx, pad, sizeof(pad));
+	Sha1Update(&ctx, digest.bytes, sizeof(digest.bytes));
+	Sha1Finalise(&ctx, &digest);
+
+	return hexlify(digest.bytes, sizeof(digest.bytes));
+	}
+
+/* compare two strings in constant time, return 1 if equal */
+
+static int secure_equal(const string& s1, const string& s2) {
+	if (s1.size() != s2.size())
+		return 0;
+	unsigned char diff = 0;
+	for(size_t i = 0; i < s1.size(); i++)
+		diff |= (unsigned char)(s1[i] ^ s2[i]);
+	return diff == 0;
+	}
+
+DigestCache::DigestCache() : dirty(0) {}
+
+int DigestCache::enabled() const {
+	return !path.empty();
+	}
+
+#ifdef _MSC_VER
+
+// dev/inode/ctime don't make a trustworthy fingerprint on windows
+
+void DigestCache::open(const string& fname, const char* hexkey) {}
+
+int DigestCache::read(const string& fname, CacheEntries& into) {
+	return -1;
+	}
+
+int DigestCache::lookup(const struct stat& st, const string& pathname,
+		char hexdigest[]) {
+	return 0;
+	}
+
+void DigestCache::store(const struct stat& st, const string& pathname,
+		const char* hexdigest) {}
+
+int DigestCache::save(size_t max_entries) {
+	return 0;
+	}
+
+string default_cache_file(const char* name, const char* hexkey) {
+	return "";
+	}
+
+int same_fingerprint(const struct stat& st1, const struct stat& st2) {
+	return st1.st_size == st2.st_size && st1.st_mtime == st2.st_mtime;
+	}
+
+#else
+
+int same_fingerprint(const struct stat& st1, const struct stat& st2) {
+	return st1.st_dev == st2.st_dev && st1.st_ino == st2.st_ino &&
+		st1.st_size == st2.st_size &&
+		ST_MTIME_NS(st1) == ST_MTIME_NS(st2) &&
+		ST_CTIME_NS(st1) == ST_CTIME_NS(st2);
+	}
+
+/* return the cache key of *pathname* with stat fingerprint *st* */
+
+static string fingerprint(const struct stat& st, const string& pathname) {
+	char fp[128];
+	sprintf(fp, "%llu %llu %lld %lld %lld ",
+			(unsigned long long)st.st_dev, (unsigned long long)st.st_ino,
+			(long long)st.st_size, ST_MTIME_NS(st), ST_CTIME_NS(st));
+	return fp + pathname;
+	}
+
+/* read and authenticate cache file *fname* into *into*. Returns 0 if
+ * read, -1 if missing or invalid */
+
+int DigestCache::read(const string& fname, CacheEntries& into) {
+
+	FILE* fin = fopen(fname.c_str(), "rb");
+	if (fin == NULL)
+		return -1;
+
+	/* only trust our own cache files */
+
+	struct stat st;
+	if (fstat(fileno(fin), &st) != 0 || st.st_uid != geteuid() ||
+			!S_ISREG(st.st_mode)) {
+		fclose(fin);
+		return -1;
+		}
+
+	string data;
+	char buf[64 * 1024];
+	size_t rdsz;
+	while((rdsz = fread(buf, 1, sizeof(buf), fin)) > 0) {
+		data.append(buf, rdsz);
+		}
+	fclose(fin);
+
+	/* verify magic & hmac (the last line) */
+
+	size_t tail = data.rfind(CACHE_HMAC);
+	if (data.compare(0, strlen(CACHE_MAGIC), CACHE_MAGIC) != 0 ||
+			tail == string::npos || (tail > 0 && data[tail-1] != '\n'))
+		return -1;
+
+	string mac = data.substr(tail + strlen(CACHE_HMAC));
+	mac.erase(mac.find_last_not_of("\n") + 1);
+	data.erase(tail);
+
+	if (!secure_equal(mac, hmac_sha1(key, data)))
+		return -1;
+
+	/* parse entries, "used dev ino size mtime_ns ctime_ns hexdigest path".
+	 * Digests are up to 2*DIGEST_MAX_SIZE (64) hex chars */
+
+	istringstream lines(data.substr(strlen(CACHE_MAGIC)));
+	string line;
+	while(getline(lines, line)) {
+		long long used;
+		char hexdigest[2*DIGEST_MAX_SIZE+1];
+		int pos = 0;
+		if (sscanf(line.c_str(), "%lld %*s %*s %*s %*s %*s %64s %n",
+					&used, hexdigest, &pos) < 2 || pos == 0 ||
+				!isspace((unsigned char)line[pos-1]) ||
+				strlen(hexdigest) % 2 != 0)
+			continue;
+
+		/* the fingerprint is everything between used & hexdigest + path */
+
+		size_t fp_start = line.find(' ') + 1;
+		size_t fp_end = line.find(hexdigest, fp_start);
+		string fp = line.substr(fp_start, fp_end - fp_start) +
+			line.substr(pos);
+
+		CacheEntry& entry = into[fp];
+		if (entry.hexdigest.empty() || entry.used < used) {
+			entry.hexdigest = hexdigest;
+			entry.used = used;
+			}
+		}
+	return 0;
+	}
+
+void DigestCache::open(const string& fname, const char* hexkey) {
+	if (fname.empty() || hexkey == NULL || !*hexkey)
+		return;
+	key = unhexlify(hexkey);
+	path = fname;
+	entries.clear();
+	read(path, entries);
+	}
+
+int DigestCache::lookup(const struct stat& st, const string& pathname,
+		char hexdigest[]) {
+
+	if (!enabled())
+		return 0;
+
+	int found = 0;
+	long long now = (long long)time(NULL);
+
+	mutex.lock();
+	CacheEntries::iterator hit = entries.find(fingerprint(st, pathname));
+	if (hit != entries.end()) {
+		strcpy(hexdigest, hit->second.hexdigest.c_str());
+		if (now - hit->second.used > CACHE_TOUCH) {
+			hit->second.used = now;
+			dirty = 1;
+			}
+		found = 1;
+		}
+	mutex.unlock();
+
+	return found;
+	}
+
+void DigestCache::store(const struct stat& st, const string& pathname,
+		const char* hexdigest) {
+
+	if (!enabled() || pathname.find('\n') != string::npos)
+		return;
+
+	mutex.lock();
+	CacheEntry& entry = entries[fingerprint(st, pathname)];
+	entry.hexdigest = hexdigest;
+	entry.used = (long long)time(NULL);
+	dirty = 1;
+	mutex.unlock();
+	}
+
+/* order cache entries most recently used first */
+
+static bool recent_first(const CacheEntries::const_iterator& e1,
+		const CacheEntries::const_iterator& e2) {
+	return e1->second.used > e2->second.used;
+	}
+
+int DigestCache::save(size_t max_entries) {
+
+	if (!enabled() || !dirty)
+		return 0;
+
+	/* one writer at a time, but never wait for another loader */
+
+	string lockname = path + ".lock";
+	int lockfd = ::open(lockname.c_str(), O_RDWR | O_CREAT, 0600);
+	if (lockfd < 0)
+		return -1;
+	if (flock(lockfd, LOCK_EX | LOCK_NB) != 0) {
+		close(lockfd);
+		return -1;
+		}
+
+	/* merge what other loaders saved since we read the file */
+
+	CacheEntries merged;
+	read(path, merged);
+	for(CacheEntries::const_iterator it = entries.begin();
+			it != entries.end(); it++) {
+		CacheEntry& entry = merged[it->first];
+		if (entry.hexdigest.empty() || entry.used < it->second.used)
+			entry = it->second;
+		}
+
+	/* evict least recently used */
+
+	vector<CacheEntries::const_iterator> order;
+	for(CacheEntries::const_iterator it = merged.begin();
+			it != merged.end(); it++) {
+		order.push_back(it);
+		}
+	sort(order.begin(), order.end(), recent_first);
+	if (order.size() > max_entries)
+		order.resize(max_entries);
+
+	string data = CACHE_MAGIC;
+	for(vector<CacheEntries::const_iterator>::const_iterator it =
+			order.begin(); it != order.end(); it++) {
+
+		/* fingerprint is "dev ino size mtime ctime path" */
+
+		const string& fp = (*it)->first;
+		size_t split = 0;
+		for(int fields = 0; fields < 5; fields++)
+			split = fp.find(' ', split) + 1;
+
+		char used[32];
+		sprintf(used, "%lld ", (*it)->second.used);
+		data += used + fp.substr(0, split) + (*it)->second.hexdigest + " " +
+			fp.substr(split) + "\n";
+		}
+
+	string mac = CACHE_HMAC + hmac_sha1(key, data) + "\n";
+
+	/* write a private temp file, then atomically replace the cache */
+
+	char pid[32];
+	sprintf(pid, ".%ld.tmp", (long)getpid());
+	string tmpname = path + pid;
+
+	int rc = -1;
+	int fd = ::open(tmpname.c_str(), O_WRONLY | O_CREAT | O_TRUNC, 0600);
+	if (fd >= 0) {
+		data += mac;
+		const char* dp = data.data();
+		size_t left = data.size();
+		ssize_t wrsz = 0;
+		while(left > 0 && (wrsz = write(fd, dp, left)) > 0) {
+			dp += wrsz;
+			left -= wrsz;
+			}
+		if (close(fd) == 0 && left == 0 &&
+				rename(tmpname.c_str(), path.c_str()) == 0) {
+			rc = 0;
+			dirty = 0;
+			}
+		else{
+			unlink(tmpname.c_str());
+			}
+		}
+
+	flock(lockfd, LOCK_UN);
+	close(lockfd);
+
+	return rc;
+	}
+
+string default_cache_file(const char* name, const char* hexkey) {
+
+	string dir;
+	const char* xdg = getenv("XDG_CACHE_HOME");
+	const char* home = getenv("HOME");
+	if (xdg && *xdg == '/') {
+		dir = xdg;
+		}
+	else if (home && *home) {
+		dir = home;
+		dir += "/.cache";
+		}
+	else{
+		return "";
+		}
+
+	mkdir(dir.c_str(), 0700);
+	dir += "/signet";
+	if (mkdir(dir.c_str(), 0700) != 0 && errno != EEXIST)
+		return "";
+
+	/* name the file after the key, so rebuilt loaders don't collide */
+
+	Sha1Context ctx;
+	SHA1_HASH digest;
+	Sha1Initialise(&ctx);
+	Sha1Update(&ctx, (void*)hexkey, (uint32_t)strlen(hexkey));
+	Sha1Finalise(&ctx, &digest);
+
+	return dir + "/" + name + "-" + hexlify(digest.bytes, 8) + ".cache";
+	}
+
+#endif
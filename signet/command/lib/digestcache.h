@@ -0,0 +1,76 @@
+
+#ifndef _DIGESTCACHE_H_
+#define _DIGESTCACHE_H_
+
+#include <sys/stat.h>
+
+#include <map>
+#include <string>
+
+#include "workers.h"
+
+/* A persistent cache of file digests, used to skip hashing files that have
+ * not changed since they were last verified. Entries are keyed by path and
+ * the file's stat fingerprint (dev, inode, size, mtime & ctime in ns).
+ * The cache file is authenticated with HMAC-SHA1 under a key embedded in
+ * the loader, and is limited in size by evicting the least recently used
+ * entries. Writers replace the file atomically (rename) while holding a
+ * lock, so concurrent loaders never see a partial cache.
+ *
+ * Only available on posix, on windows the cache is never enabled. */
+
+struct CacheEntry {				/* a cached digest */
+	std::string hexdigest;
+	long long used;				/* time of last use (seconds) */
+	};
+
+typedef std::map<std::string, CacheEntry> CacheEntries;
+
+class DigestCache {
+
+private:
+	std::string key;			/* HMAC key */
+	std::string path;			/* cache file */
+	CacheEntries entries;
+	int dirty;					/* entries added/touched since open() */
+	Mutex mutex;
+
+	int read(const std::string& fname, CacheEntries& into);
+
+public:
+	DigestCache();
+
+	/* load cache file *fname* authenticated with *hexkey* (ignoring a
+	 * missing or invalid file), and enable the cache */
+	void open(const std::string& fname, const char* hexkey);
+
+	/* return 1 if open() enabled the cache */
+	int enabled() const;
+
+	/* copy the digest cached for *pathname* with stat fingerprint *st* into
+	 * *hexdigest* (2*DIGEST_MAX_SIZE+1 chars), returns 1 if found */
+	int lookup(const struct stat& st, const std::string& pathname,
+			char hexdigest[]);
+
+	/* remember *hexdigest* for *pathname* with stat fingerprint *st* */
+	void store(const struct stat& st, const std::string& pathname,
+			const char* hexdigest);
+
+	/* merge our entries into the cache file, keeping at most *max_entries*.
+	 * Returns 0 on success (or nothing to do), -1 if the file could not be
+	 * updated (eg: another loader holds the lock) */
+	int save(size_t max_entries);
+	};
+
+/* return the default cache file for a loader named *name* built with
+ * *hexkey*: $XDG_CACHE_HOME/signet/<name>-<key id>.cache (XDG_CACHE_HOME
+ * defaults to ~/.cache). Returns "" if there is no home directory */
+
+std::string default_cache_file(const char* name, const char* hexkey);
+
+/* return 1 if *st1* and *st2* have the same stat fingerprint, ie: the file
+ * has not changed */
+
+int same_fingerprint(const struct stat& st1, const struct stat& st2);
+
+#endif //_DIGESTCACHE_H_
@@ -0,0 +1,36 @@
+#ifndef _PROBES_H_
+#define _PROBES_H_
+
+/* USDT static probes of the "signet" provider, for perf, bpftrace or
+ * systemtap to attach to on a running loader, eg:
+ *
+ *	bpftrace -e 'usdt:./hello:signet:phase__start { @t[tid] = nsecs; }
+ *		usdt:./hello:signet:phase__end { @us[str(arg0)] =
+ *		hist((nsecs - @t[tid]) / 1000); }'
+ *
+ * Compiled in when the loader is built with --define USDT (which needs
+ * sys/sdt.h, from systemtap-sdt-dev or systemtap-sdt-devel). Each probe is
+ * then a single nop until a tracer attaches, and it's arguments are only
+ * read by the tracer. Otherwise (and on windows) the probes are empty, and
+ * their arguments are not evaluated.
+ *
+ * Arguments are integers or pointers, strings are passed as const char*.
+ * The probes the loader fires are listed in docs/loader.rst. */
+
+#if defined(USDT) && !defined(_MSC_VER)
+
+#include <sys/sdt.h>
+
+#define PROBE1(name, a)				DTRACE_PROBE1(signet, name, a)
+#define PROBE2(name, a, b)			DTRACE_PROBE2(signet, name, a, b)
+#define PROBE3(name, a, b, c)		DTRACE_PROBE3(signet, name, a, b, c)
+
+#else
+
+#define PROBE1(name, a)				do {} while (0)
+#define PROBE2(name, a, b)			do {} while (0)
+#define PROBE3(name, a, b, c)		do {} while (0)
+
+#endif
+
+#endif //_PROBES_H_
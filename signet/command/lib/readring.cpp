@@ -0,0 +1,342 @@
+#include <errno.h>
+#include <string.h>
+
+#include <algorithm>
+
+#include "readring.h"
+
+#ifdef __linux__
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/syscall.h>
+#include <unistd.h>
+#if defined(__NR_io_uring_setup)
+#include <linux/io_uring.h>
+#endif
+#endif
+
+/* IORING_OP_OPENAT, IORING_OP_READ and IORING_REGISTER_PROBE came with
+ * linux 5.6, as did IORING_FEAT_RW_CUR_POS (the enums can't be tested) */
+
+#if defined(IORING_FEAT_RW_CUR_POS)
+#define HAVE_IO_URING 1
+#endif
+
+using namespace std;
+
+#ifndef HAVE_IO_URING
+
+int read_files(vector<FileRead>& files, unsigned depth) { return -1; }
+
+#else
+
+/* first read of a file of unknown size */
+
+static const size_t READ_MIN = 64 * 1024;
+
+class Ring {					/* an io_uring, driven by raw syscalls */
+
+private:
+	int fd;
+	void* sq_map;
+	size_t sq_size;
+	void* cq_map;
+	size_t cq_size;
+	io_uring_sqe* sqes;
+	size_t sqes_size;
+	unsigned* sq_tail;
+	unsigned* sq_array;
+	unsigned sq_mask;
+	unsigned* cq_head;
+	unsigned* cq_tail;
+	unsigned cq_mask;
+	io_uring_cqe* cqes;
+	Ring(const Ring&);
+	Ring& operator=(const Ring&);
+
+	int supports(const unsigned char ops[], size_t count);
+
+public:
+	unsigned entries;			/* submission queue size */
+
+	Ring() : fd(-1), sq_map(MAP_FAILED), cq_map(MAP_FAILED),
+		sqes((io_uring_sqe*)MAP_FAILED), entries(0) {}
+	~Ring();
+
+	/* set up a ring of (at least) *depth* entries, returns 0, or -1 if
+	 * io_uring (or one of the operations we use) is not available */
+	int open(unsigned depth);
+
+	/* a cleared submission queue entry, queued by the next enter() */
+	io_uring_sqe* next() {
+		unsigned tail = *sq_tail;
+		unsigned index = tail & sq_mask;
+		io_uring_sqe* sqe = &sqes[index];
+		memset(sqe, 0, sizeof(*sqe));
+		sq_array[index] = index;
+		__atomic_store_n(sq_tail, tail + 1, __ATOMIC_RELEASE);
+		return sqe;
+		}
+
+	/* submit *count* queued entries and wait for a completion. Returns
+	 * the number of entries submitted, or -1 (errno) */
+	int enter(unsigned count) {
+		return (int)syscall(__NR_io_uring_enter, fd, count, 1,
+				IORING_ENTER_GETEVENTS, NULL, 0);
+		}
+
+	/* the next completion, or NULL. Call pop() once it was handled */
+	io_uring_cqe* peek() {
+		unsigned head = *cq_head;
+		if (head == __atomic_load_n(cq_tail, __ATOMIC_ACQUIRE))
+			return NULL;
+		return &cqes[head & cq_mask];
+		}
+
+	void pop() {
+		__atomic_store_n(cq_head, *cq_head + 1, __ATOMIC_RELEASE);
+		}
+	};
+
+Ring::~Ring() {
+	if (sqes != MAP_FAILED)
+		munmap(sqes, sqes_size);
+	if (cq_map != MAP_FAILED && cq_map != sq_map)
+		munmap(cq_map, cq_size);
+	if (sq_map != MAP_FAILED)
+		munmap(sq_map, sq_size);
+	if (fd >= 0)
+		close(fd);
+	}
+
+int Ring::open(unsigned depth) {
+
+	io_uring_params params;
+	memset(&params, 0, sizeof(params));
+	fd = (int)syscall(__NR_io_uring_setup, depth, &params);
+	if (fd < 0)
+		return -1;
+
+	sq_size = params.sq_off.array + params.sq_entries * sizeof(unsigned);
+	cq_size = params.cq_off.cqes + params.cq_entries * sizeof(io_uring_cqe);
+	if (params.features & IORING_FEAT_SINGLE_MMAP) {
+		sq_size = cq_size = (sq_size > cq_size) ? sq_size : cq_size;
+		}
+
+	sq_map = mmap(NULL, sq_size, PROT_READ | PROT_WRITE,
+			MAP_SHARED | MAP_POPULATE, fd, IORING_OFF_SQ_RING);
+	if (sq_map == MAP_FAILED)
+		return -1;
+	if (params.features & IORING_FEAT_SINGLE_MMAP) {
+		cq_map = sq_map;
+		}
+	else{
+		cq_map = mmap(NULL, cq_size, PROT_READ | PROT_WRITE,
+				MAP_SHARED | MAP_POPULATE, fd, IORING_OFF_CQ_RING);
+		if (cq_map == MAP_FAILED)
+			return -1;
+		}
+	sqes_size = params.sq_entries * sizeof(io_uring_sqe);
+	sqes = (io_uring_sqe*)mmap(NULL, sqes_size, PROT_READ | PROT_WRITE,
+			MAP_SHARED | MAP_POPULATE, fd, IORING_OFF_SQES);
+	if (sqes == MAP_FAILED)
+		return -1;
+
+	char* sq = (char*)sq_map;
+	char* cq = (char*)cq_map;
+	sq_tail = (unsigned*)(sq + params.sq_off.tail);
+	sq_array = (unsigned*)(sq + params.sq_off.array);
+	sq_mask = *(unsigned*)(sq + params.sq_off.ring_mask);
+	cq_head = (unsigned*)(cq + params.cq_off.head);
+	cq_tail = (unsigned*)(cq + params.cq_off.tail);
+	cq_mask = *(unsigned*)(cq + params.cq_off.ring_mask);
+	cqes = (io_uring_cqe*)(cq + params.cq_off.cqes);
+	entries = params.sq_entries;
+
+	const unsigned char ops[] = {IORING_OP_OPENAT, IORING_OP_READ};
+	return supports(ops, sizeof(ops)) ? 0 : -1;
+	}
+
+/* 1 if the kernel implements all *count* of the *ops* */
+
+int Ring::supports(const unsigned char ops[], size_t count) {
+
+	const unsigned OPS_MAX = 256;
+	vector<char> buf(sizeof(io_uring_probe) +
+			OPS_MAX * sizeof(io_uring_probe_op));
+	io_uring_probe* probe = (io_uring_probe*)&buf[0];
+	if (syscall(__NR_io_uring_register, fd, IORING_REGISTER_PROBE, probe,
+				OPS_MAX) < 0)
+		return 0;
+	for(size_t i = 0; i < count; i++) {
+		if (ops[i] > probe->last_op ||
+				!(probe->ops[ops[i]].flags & IO_URING_OP_SUPPORTED))
+			return 0;
+		}
+	return 1;
+	}
+
+struct Pending {				/* progress of one FileRead */
+	int opened;					/* fd we opened (and close), or -1 */
+	size_t used;				/* bytes of data read */
+	size_t request;				/* bytes asked for by the read in flight */
+	};
+
+/* queue the open of *file* (tagged *i*), or the read of it's next part */
+
+static void queue(Ring& ring, size_t i, FileRead& file, Pending& p) {
+
+	io_uring_sqe* sqe = ring.next();
+	sqe->user_data = i;
+
+	if (file.fd < 0) {
+		sqe->opcode = IORING_OP_OPENAT;
+		sqe->fd = AT_FDCWD;
+		sqe->addr = (unsigned long)file.pathname.c_str();
+		sqe->open_flags = O_RDONLY | O_CLOEXEC;
+		return;
+		}
+
+	/* the size hint (plus a byte, to see the end of the file) at first,
+	 * then twice as much as we have each time the buffer fills up */
+
+	if (file.data.size() == p.used) {
+		size_t grow = (p.used == 0 && file.size >= 0) ?
+			(size_t)file.size + 1 : max(p.used, READ_MIN);
+		file.data.resize(p.used + grow);
+		}
+	p.request = file.data.size() - p.used;
+
+	sqe->opcode = IORING_OP_READ;
+	sqe->fd = file.fd;
+	sqe->off = p.used;
+	sqe->addr = (unsigned long)&file.data[p.used];
+	sqe->len = (unsigned)min(p.request, (size_t)1 << 30);
+	p.request = sqe->len;
+	}
+
+/* handle completion *res* of *file*'s request. Returns 1 if the file is
+ * done, 0 if another request was queued */
+
+static int complete(Ring& ring, size_t i, FileRead& file, Pending& p,
+		int res) {
+
+	if (file.fd < 0) {
+		if (res < 0) {
+			file.error = -res;
+			return 1;
+			}
+		file.fd = p.opened = res;
+		queue(ring, i, file, p);
+		return 0;
+		}
+
+	/* a file opened O_NONBLOCK fails reads that would wait for the disk */
+
+	if (res == -EAGAIN) {
+		int flags = fcntl(file.fd, F_GETFL);
+		if (flags < 0 || !(flags & O_NONBLOCK) ||
+				fcntl(file.fd, F_SETFL, flags & ~O_NONBLOCK) != 0) {
+			file.error = EAGAIN;
+			return 1;
+			}
+		queue(ring, i, file, p);
+		return 0;
+		}
+	if (res == -EINTR) {
+		queue(ring, i, file, p);
+		return 0;
+		}
+	if (res < 0) {
+		file.error = -res;
+		return 1;
+		}
+
+	/* a short read of a file that has the expected size is the end of it,
+	 * otherwise read until there is nothing left */
+
+	p.used += res;
+	if (res == 0 || ((size_t)res < p.request && file.size >= 0 &&
+				p.used == (size_t)file.size)) {
+		file.data.resize(p.used);
+		return 1;
+		}
+	queue(ring, i, file, p);
+	return 0;
+	}
+
+int read_files(vector<FileRead>& files, unsigned depth) {
+
+	Ring ring;
+	if (ring.open(depth ? depth : 1) != 0)
+		return -1;
+
+	vector<Pending> pending(files.size());
+	vector<char> finished(files.size(), 0);
+	for(size_t i = 0; i < files.size(); i++) {
+		files[i].data.clear();
+		files[i].error = 0;
+		pending[i].opened = -1;
+		pending[i].used = 0;
+		pending[i].request = 0;
+		}
+
+	/* each file has one request in flight at a time, so the completion
+	 * queue (twice the size of the submission queue) can't overflow */
+
+	size_t next = 0, done = 0;
+	unsigned queued = 0;
+	unsigned inflight = 0;
+	int error = 0;
+
+	while (done < files.size()) {
+
+		while (next < files.size() && queued + inflight < ring.entries) {
+			queue(ring, next, files[next], pending[next]);
+			next++;
+			queued++;
+			}
+
+		int rc = ring.enter(queued);
+		if (rc < 0 && errno != EINTR && errno != EAGAIN && errno != EBUSY) {
+			error = errno;
+			break;
+			}
+		if (rc > 0) {
+			queued -= rc;
+			inflight += rc;
+			}
+
+		for(io_uring_cqe* cqe = ring.peek(); cqe; cqe = ring.peek()) {
+			size_t i = (size_t)cqe->user_data;
+			int res = cqe->res;
+			ring.pop();
+			inflight--;
+			if (complete(ring, i, files[i], pending[i], res)) {
+				finished[i] = 1;
+				done++;
+				}
+			else{
+				queued++;
+				}
+			}
+		}
+
+	/* if the ring failed, the files not finished fail. The kernel may still
+	 * write to the buffers of reads in flight, so they are left allocated */
+
+	for(size_t i = 0; i < files.size(); i++) {
+		if (!finished[i]) {
+			files[i].error = error ? error : EIO;
+			if (i < next)
+				(new string())->swap(files[i].data);
+			}
+		if (pending[i].opened >= 0) {
+			close(pending[i].opened);
+			files[i].fd = -1;
+			}
+		}
+	return 0;
+	}
+
+#endif
@@ -0,0 +1,29 @@
+#ifndef _READRING_H_
+#define _READRING_H_
+
+#include <string>
+#include <vector>
+
+/* Whole-file reads batched on an io_uring (linux only). The opens and reads
+ * of many files are submitted together, and up to *depth* of them are kept
+ * in flight, so the latency of each request (a cold cache, a network
+ * filesystem) overlaps with the others instead of being paid in turn.
+ *
+ * On other platforms, and on kernels without io_uring (or with it disabled),
+ * read_files() fails without reading anything. */
+
+struct FileRead {				/* a file read whole by read_files() */
+	std::string pathname;		/* opened if fd < 0 */
+	int fd;						/* open file (left open), or -1 */
+	long long size;				/* expected size, a hint (-1 - unknown) */
+	std::string data;			/* contents read */
+	int error;					/* 0, or errno of the failed open/read */
+	FileRead() : fd(-1), size(-1), error(0) {}
+	};
+
+/* read all the *files*, keeping up to *depth* requests in flight. Returns
+ * 0 once every file was read (or failed, see FileRead.error), or -1 if
+ * io_uring is not available, and nothing was read */
+int read_files(std::vector<FileRead>& files, unsigned depth);
+
+#endif //_READRING_H_
@@ -17,6 +17,46 @@
 
 #include "sha1.h"
 #include <memory.h>
+#include <string.h>
+
+// Hardware kernels. SHA-NI needs gcc 5, clang or VS2015 on x86; the ARMv8
+// crypto extensions need gcc 6 or clang on aarch64 (linux or darwin). Each
+// is compiled with a function level target, so the rest of the library
+// (and the loader) still run on cpus without them.
+#if (defined(__x86_64__) || defined(__i386__) || defined(_M_X64) \
+        || defined(_M_IX86)) && (defined(__clang__) \
+        || (defined(__GNUC__) && __GNUC__ >= 5) \
+        || (defined(_MSC_VER) && _MSC_VER >= 1900))
+#define SHA1_SHANI 1
+#include <immintrin.h>
+#ifdef _MSC_VER
+#include <intrin.h>
+#define SHA1_SHANI_TARGET
+#else
+#include <cpuid.h>
+#define SHA1_SHANI_TARGET __attribute__((target("sha,sse4.1")))
+#endif
+#endif
+
+#if defined(__aarch64__) && (defined(__linux__) || defined(__APPLE__)) \
+        && (defined(__ARM_FEATURE_CRYPTO) || defined(__ARM_FEATURE_SHA2) \
+        || defined(__clang__) || (defined(__GNUC__) && __GNUC__ >= 6))
+#define SHA1_ARMV8 1
+#include <arm_neon.h>
+#if defined(__ARM_FEATURE_CRYPTO) || defined(__ARM_FEATURE_SHA2)
+#define SHA1_ARMV8_TARGET
+#elif defined(__clang__)
+#define SHA1_ARMV8_TARGET __attribute__((target("crypto")))
+#else
+#define SHA1_ARMV8_TARGET __attribute__((target("+crypto")))
+#endif
+#ifdef __linux__
+#include <sys/auxv.h>
+#ifndef HWCAP_SHA1
+#define HWCAP_SHA1 (1 << 5)
+#endif
+#endif
+#endif
 
 ////////////////////////////////////////////////////////////////////////////////
 //  TYPES
@@ -28,6 +68,17 @@ typedef union
     uint32_t    l [16];
 } CHAR64LONG16;
 
+// Sha1BlockFunction - hashes Blocks consecutive 512-bit blocks into state.
+typedef void (*Sha1BlockFunction)( uint32_t state[5], const uint8_t* data,
+    uint32_t blocks );
+
+typedef struct
+{
+    const char*         Name;
+    Sha1BlockFunction   Transform;
+    int                 (*Supported)( void );
+} Sha1KernelEntry;
+
 ////////////////////////////////////////////////////////////////////////////////
 //  INTERNAL FUNCTIONS
 ////////////////////////////////////////////////////////////////////////////////
@@ -114,50 +165,412 @@ void
 }
 
 ////////////////////////////////////////////////////////////////////////////////
-//  PUBLIC FUNCTIONS
+//  TransformScalar
+//
+//  Portable kernel, and the fallback on cpus without sha instructions.
 ////////////////////////////////////////////////////////////////////////////////
+static
+void
+    TransformScalar
+    (
+        uint32_t            state[5],
+        const uint8_t*      data,
+        uint32_t            blocks
+    )
+{
+    for( ; blocks; blocks--, data += 64 )
+    {
+        TransformFunction( state, data );
+    }
+}
 
+#ifdef SHA1_SHANI
 ////////////////////////////////////////////////////////////////////////////////
-//  Sha1Initialise
+//  TransformShaNi
 //
-//  Initialises an SHA1 Context. Use this to initialise/reset a context.
+//  x86 SHA extensions kernel. Each sha1rnds4 performs four rounds; the
+//  message schedule is interleaved with the rounds that consume it.
 ////////////////////////////////////////////////////////////////////////////////
+static
+SHA1_SHANI_TARGET
 void
-    Sha1Initialise
+    TransformShaNi
     (
-        Sha1Context*                Context
+        uint32_t            state[5],
+        const uint8_t*      data,
+        uint32_t            blocks
     )
 {
-    // SHA1 initialization constants
-    Context->State[0] = 0x67452301;
-    Context->State[1] = 0xEFCDAB89;
-    Context->State[2] = 0x98BADCFE;
-    Context->State[3] = 0x10325476;
-    Context->State[4] = 0xC3D2E1F0;
-    Context->Count[0] = 0;
-    Context->Count[1] = 0;
+    __m128i     abcd;
+    __m128i     abcd_save;
+    __m128i     e_save;
+    __m128i     E0;
+    __m128i     E1;
+    __m128i     MSG0;
+    __m128i     MSG1;
+    __m128i     MSG2;
+    __m128i     MSG3;
+    const __m128i mask = _mm_set_epi64x( 0x0001020304050607ULL,
+        0x08090a0b0c0d0e0fULL );
+
+    abcd = _mm_loadu_si128( (const __m128i*) state );
+    abcd = _mm_shuffle_epi32( abcd, 0x1B );
+    E0 = _mm_set_epi32( (int)state[4], 0, 0, 0 );
+
+    for( ; blocks; blocks--, data += 64 )
+    {
+        abcd_save = abcd;
+        e_save = E0;
+
+        // Rounds 0-3
+        MSG0 = _mm_loadu_si128( (const __m128i*)(data + 0) );
+        MSG0 = _mm_shuffle_epi8( MSG0, mask );
+        E0 = _mm_add_epi32( E0, MSG0 );
+        E1 = abcd;
+        abcd = _mm_sha1rnds4_epu32( abcd, E0, 0 );
+
+        // Rounds 4-7
+        MSG1 = _mm_loadu_si128( (const __m128i*)(data + 16) );
+        MSG1 = _mm_shuffle_epi8( MSG1, mask );
+        E1 = _mm_sha1nexte_epu32( E1, MSG1 );
+        E0 = abcd;
+        abcd = _mm_sha1rnds4_epu32( abcd, E1, 0 );
+        MSG0 = _mm_sha1msg1_epu32( MSG0, MSG1 );
+
+        // Rounds 8-11
+        MSG2 = _mm_loadu_si128( (const __m128i*)(data + 32) );
+        MSG2 = _mm_shuffle_epi8( MSG2, mask );
+        E0 = _mm_sha1nexte_epu32( E0, MSG2 );
+        E1 = abcd;
+        abcd = _mm_sha1rnds4_epu32( abcd, E0, 0 );
+        MSG1 = _mm_sha1msg1_epu32( MSG1, MSG2 );
+        MSG0 = _mm_xor_si128( MSG0, MSG2 );
+
+        // Rounds 12-15
+        MSG3 = _mm_loadu_si128( (const __m128i*)(data + 48) );
+        MSG3 = _mm_shuffle_epi8( MSG3, mask );
+        E1 = _mm_sha1nexte_epu32( E1, MSG3 );
+        E0 = abcd;
+        MSG0 = _mm_sha1msg2_epu32( MSG0, MSG3 );
+        abcd = _mm_sha1rnds4_epu32( abcd, E1, 0 );
+        MSG2 = _mm_sha1msg1_epu32( MSG2, MSG3 );
+        MSG1 = _mm_xor_si128( MSG1, MSG3 );
+
+        // Rounds 16-19
+        E0 = _mm_sha1nexte_epu32( E0, MSG0 );
+        E1 = abcd;
+        MSG1 = _mm_sha1msg2_epu32( MSG1, MSG0 );
+        abcd = _mm_sha1rnds4_epu32( abcd, E0, 0 );
+        MSG3 = _mm_sha1msg1_epu32( MSG3, MSG0 );
+        MSG2 = _mm_xor_si128( MSG2, MSG0 );
+
+        // Rounds 20-23
+        E1 = _mm_sha1nexte_epu32( E1, MSG1 );
+        E0 = abcd;
+        MSG2 = _mm_sha1msg2_epu32( MSG2, MSG1 );
+        abcd = _mm_sha1rnds4_epu32( abcd, E1, 1 );
+        MSG0 = _mm_sha1msg1_epu32( MSG0, MSG1 );
+        MSG3 = _mm_xor_si128( MSG3, MSG1 );
+
+        // Rounds 24-27
+        E0 = _mm_sha1nexte_epu32( E0, MSG2 );
+        E1 = abcd;
+        MSG3 = _mm_sha1msg2_epu32( MSG3, MSG2 );
+        abcd = _mm_sha1rnds4_epu32( abcd, E0, 1 );
+        MSG1 = _mm_sha1msg1_epu32( MSG1, MSG2 );
+        MSG0 = _mm_xor_si128( MSG0, MSG2 );
+
+        // Rounds 28-31
+        E1 = _mm_sha1nexte_epu32( E1, MSG3 );
+        E0 = abcd;
+        MSG0 = _mm_sha1msg2_epu32( MSG0, MSG3 );
+        abcd = _mm_sha1rnds4_epu32( abcd, E1, 1 );
+        MSG2 = _mm_sha1msg1_epu32( MSG2, MSG3 );
+        MSG1 = _mm_xor_si128( MSG1, MSG3 );
+
+        // Rounds 32-35
+        E0 = _mm_sha1nexte_epu32( E0, MSG0 );
+        E1 = abcd;
+        MSG1 = _mm_sha1msg2_epu32( MSG1, MSG0 );
+        abcd = _mm_sha1rnds4_epu32( abcd, E0, 1 );
+        MSG3 = _mm_sha1msg1_epu32( MSG3, MSG0 );
+        MSG2 = _mm_xor_si128( MSG2, MSG0 );
+
+        // Rounds 36-39
+        E1 = _mm_sha1nexte_epu32( E1, MSG1 );
+        E0 = abcd;
+        MSG2 = _mm_sha1msg2_epu32( MSG2, MSG1 );
+        abcd = _mm_sha1rnds4_epu32( abcd, E1, 1 );
+        MSG0 = _mm_sha1msg1_epu32( MSG0, MSG1 );
+        MSG3 = _mm_xor_si128( MSG3, MSG1 );
+
+        // Rounds 40-43
+        E0 = _mm_sha1nexte_epu32( E0, MSG2 );
+        E1 = abcd;
+        MSG3 = _mm_sha1msg2_epu32( MSG3, MSG2 );
+        abcd = _mm_sha1rnds4_epu32( abcd, E0, 2 );
+        MSG1 = _mm_sha1msg1_epu32( MSG1, MSG2 );
+        MSG0 = _mm_xor_si128( MSG0, MSG2 );
+
+        // Rounds 44-47
+        E1 = _mm_sha1nexte_epu32( E1, MSG3 );
+        E0 = abcd;
+        MSG0 = _mm_sha1msg2_epu32( MSG0, MSG3 );
+        abcd = _mm_sha1rnds4_epu32( abcd, E1, 2 );
+        MSG2 = _mm_sha1msg1_epu32( MSG2, MSG3 );
+        MSG1 = _mm_xor_si128( MSG1, MSG3 );
+
+        // Rounds 48-51
+        E0 = _mm_sha1nexte_epu32( E0, MSG0 );
+        E1 = abcd;
+        MSG1 = _mm_sha1msg2_epu32( MSG1, MSG0 );
+        abcd = _mm_sha1rnds4_epu32( abcd, E0, 2 );
+        MSG3 = _mm_sha1msg1_epu32( MSG3, MSG0 );
+        MSG2 = _mm_xor_si128( MSG2, MSG0 );
+
+        // Rounds 52-55
+        E1 = _mm_sha1nexte_epu32( E1, MSG1 );
+        E0 = abcd;
+        MSG2 = _mm_sha1msg2_epu32( MSG2, MSG1 );
+        abcd = _mm_sha1rnds4_epu32( abcd, E1, 2 );
+        MSG0 = _mm_sha1msg1_epu32( MSG0, MSG1 );
+        MSG3 = _mm_xor_si128( MSG3, MSG1 );
+
+        // Rounds 56-59
+        E0 = _mm_sha1nexte_epu32( E0, MSG2 );
+        E1 = abcd;
+        MSG3 = _mm_sha1msg2_epu32( MSG3, MSG2 );
+        abcd = _mm_sha1rnds4_epu32( abcd, E0, 2 );
+        MSG1 = _mm_sha1msg1_epu32( MSG1, MSG2 );
+        MSG0 = _mm_xor_si128( MSG0, MSG2 );
+
+        // Rounds 60-63
+        E1 = _mm_sha1nexte_epu32( E1, MSG3 );
+        E0 = abcd;
+        MSG0 = _mm_sha1msg2_epu32( MSG0, MSG3 );
+        abcd = _mm_sha1rnds4_epu32( abcd, E1, 3 );
+        MSG2 = _mm_sha1msg1_epu32( MSG2, MSG3 );
+        MSG1 = _mm_xor_si128( MSG1, MSG3 );
+
+        // Rounds 64-67
+        E0 = _mm_sha1nexte_epu32( E0, MSG0 );
+        E1 = abcd;
+        MSG1 = _mm_sha1msg2_epu32( MSG1, MSG0 );
+        abcd = _mm_sha1rnds4_epu32( abcd, E0, 3 );
+        MSG3 = _mm_sha1msg1_epu32( MSG3, MSG0 );
+        MSG2 = _mm_xor_si128( MSG2, MSG0 );
+
+        // Rounds 68-71
+        E1 = _mm_sha1nexte_epu32( E1, MSG1 );
+        E0 = abcd;
+        MSG2 = _mm_sha1msg2_epu32( MSG2, MSG1 );
+        abcd = _mm_sha1rnds4_epu32( abcd, E1, 3 );
+        MSG3 = _mm_xor_si128( MSG3, MSG1 );
+
+        // Rounds 72-75
+        E0 = _mm_sha1nexte_epu32( E0, MSG2 );
+        E1 = abcd;
+        MSG3 = _mm_sha1msg2_epu32( MSG3, MSG2 );
+        abcd = _mm_sha1rnds4_epu32( abcd, E0, 3 );
+
+        // Rounds 76-79
+        E1 = _mm_sha1nexte_epu32( E1, MSG3 );
+        E0 = abcd;
+        abcd = _mm_sha1rnds4_epu32( abcd, E1, 3 );
+
+        // Add the working vars back into state
+        E0 = _mm_sha1nexte_epu32( E0, e_save );
+        abcd = _mm_add_epi32( abcd, abcd_save );
+    }
+
+    abcd = _mm_shuffle_epi32( abcd, 0x1B );
+    _mm_storeu_si128( (__m128i*) state, abcd );
+    state[4] = (uint32_t)_mm_extract_epi32( E0, 3 );
 }
 
 ////////////////////////////////////////////////////////////////////////////////
-//  Sha1Update
+//  HasShaNi
 //
-//  Adds data to the SHA1 context. This will process the data and update the
-//  internal state of the context. Keep on calling this function until all the
-//   data has been added. Then call Sha1Finalise to calculate the hash.
+//  cpuid: SHA is leaf 7 ebx bit 29, SSSE3 and SSE4.1 are leaf 1 ecx bits 9
+//  and 19.
 ////////////////////////////////////////////////////////////////////////////////
+static
+int
+    HasShaNi
+    (
+        void
+    )
+{
+#ifdef _MSC_VER
+    int         regs[4];
+
+    __cpuid( regs, 0 );
+    if( regs[0] < 7 )
+    {
+        return 0;
+    }
+    __cpuid( regs, 1 );
+    if( (regs[2] & (1 << 9)) == 0 || (regs[2] & (1 << 19)) == 0 )
+    {
+        return 0;
+    }
+    __cpuidex( regs, 7, 0 );
+    return (regs[1] & (1 << 29)) != 0;
+#else
+    unsigned    a;
+    unsigned    b;
+    unsigned    c;
+    unsigned    d;
+
+    if( __get_cpuid_max( 0, NULL ) < 7 )
+    {
+        return 0;
+    }
+    __cpuid( 1, a, b, c, d );
+    if( (c & (1 << 9)) == 0 || (c & (1 << 19)) == 0 )
+    {
+        return 0;
+    }
+    __cpuid_count( 7, 0, a, b, c, d );
+    return (b & (1u << 29)) != 0;
+#endif
+}
+#endif
+
+#ifdef SHA1_ARMV8
+////////////////////////////////////////////////////////////////////////////////
+//  TransformArmv8
+//
+//  ARMv8 crypto extensions kernel. Each of sha1c/sha1p/sha1m performs four
+//  rounds; sha1su0/sha1su1 extend the schedule four words at a time.
+////////////////////////////////////////////////////////////////////////////////
+static
+SHA1_ARMV8_TARGET
 void
-    Sha1Update
+    TransformArmv8
+    (
+        uint32_t            state[5],
+        const uint8_t*      data,
+        uint32_t            blocks
+    )
+{
+    static const uint32_t k[4] =
+        { 0x5A827999, 0x6ED9EBA1, 0x8F1BBCDC, 0xCA62C1D6 };
+    uint32x4_t      abcd;
+    uint32x4_t      abcd_save;
+    uint32x4_t      wk;
+    uint32x4_t      msg[4];
+    uint32_t        e;
+    uint32_t        e_save;
+    uint32_t        e_next;
+    int             i;
+
+    abcd = vld1q_u32( state );
+    e = state[4];
+
+    for( ; blocks; blocks--, data += 64 )
+    {
+        abcd_save = abcd;
+        e_save = e;
+
+        for( i = 0; i < 4; i++ )
+        {
+            msg[i] = vreinterpretq_u32_u8( vrev32q_u8(
+                vld1q_u8( data + 16 * i ) ) );
+        }
+
+        // 20 groups of 4 rounds. msg[i&3] holds words 4i..4i+3 of the
+        // schedule; once used, it is replaced by words 4i+16..4i+19.
+        for( i = 0; i < 20; i++ )
+        {
+            wk = vaddq_u32( msg[i & 3], vdupq_n_u32( k[i / 5] ) );
+            e_next = vsha1h_u32( vgetq_lane_u32( abcd, 0 ) );
+            if( i < 5 )
+            {
+                abcd = vsha1cq_u32( abcd, e, wk );
+            }
+            else if( i >= 10 && i < 15 )
+            {
+                abcd = vsha1mq_u32( abcd, e, wk );
+            }
+            else
+            {
+                abcd = vsha1pq_u32( abcd, e, wk );
+            }
+            e = e_next;
+            if( i < 16 )
+            {
+                msg[i & 3] = vsha1su1q_u32( vsha1su0q_u32( msg[i & 3],
+                    msg[(i + 1) & 3], msg[(i + 2) & 3] ), msg[(i + 3) & 3] );
+            }
+        }
+
+        // Add the working vars back into state
+        abcd = vaddq_u32( abcd, abcd_save );
+        e += e_save;
+    }
+
+    vst1q_u32( state, abcd );
+    state[4] = e;
+}
+
+////////////////////////////////////////////////////////////////////////////////
+//  HasArmv8
+////////////////////////////////////////////////////////////////////////////////
+static
+int
+    HasArmv8
+    (
+        void
+    )
+{
+#ifdef __linux__
+    return (getauxval( AT_HWCAP ) & HWCAP_SHA1) != 0;
+#else
+    return 1;       // every 64-bit apple cpu has the crypto extensions
+#endif
+}
+#endif
+
+// Kernels in order of preference. The scalar kernel is always last.
+static const Sha1KernelEntry Kernels [] =
+{
+#ifdef SHA1_SHANI
+    { "sha-ni", TransformShaNi, HasShaNi },
+#endif
+#ifdef SHA1_ARMV8
+    { "armv8", TransformArmv8, HasArmv8 },
+#endif
+    { "scalar", TransformScalar, NULL },
+};
+
+#define SCALAR_KERNEL   ( sizeof(Kernels) / sizeof(Kernels[0]) - 1 )
+
+// Index of the kernel in use, -1 until the first hash selects one. Threads
+// racing on the first hash all select (and store) the same kernel.
+static volatile int     KernelIndex = -1;
+
+////////////////////////////////////////////////////////////////////////////////
+//  UpdateWith
+//
+//  Sha1Update using the given block function.
+////////////////////////////////////////////////////////////////////////////////
+static
+void
+    UpdateWith
     (
         Sha1Context*        Context,
-        void*               Buffer,
-        uint32_t            BufferSize
+        const uint8_t*      Buffer,
+        uint32_t            BufferSize,
+        Sha1BlockFunction   Transform
     )
 {
     uint32_t    i;
     uint32_t    j;
+    uint32_t    blocks;
 
     j = (Context->Count[0] >> 3) & 63;
-    if( (Context->Count[0] += BufferSize << 3) < (BufferSize << 3) )     
+    if( (Context->Count[0] += BufferSize << 3) < (BufferSize << 3) )
     {
          Context->Count[1]++;
     }
@@ -167,10 +580,12 @@ void
     {
         i = 64 - j;
         memcpy( &Context->Buffer[j], Buffer, i );
-        TransformFunction(Context->State, Context->Buffer);
-        for( ; i + 63 < BufferSize; i += 64 )         
+        Transform( Context->State, Context->Buffer, 1 );
+        blocks = (BufferSize - i) / 64;
+        if( blocks )
         {
-             TransformFunction(Context->State, (uint8_t*)Buffer + i);
+            Transform( Context->State, Buffer + i, blocks );
+            i += blocks * 64;
         }
         j = 0;
     }
@@ -179,42 +594,238 @@ void
         i = 0;
     }
 
-    memcpy( &Context->Buffer[j], &((uint8_t*)Buffer)[i], BufferSize - i );
+    memcpy( &Context->Buffer[j], &Buffer[i], BufferSize - i );
 }
 
 ////////////////////////////////////////////////////////////////////////////////
-//  Sha1Finalise
+//  FinaliseWith
 //
-//  Performs the final calculation of the hash and returns the digest (20 byte
-//  buffer containing 160bit hash). After calling this, Sha1Initialised must be
-//  used to reuse the context.
+//  Sha1Finalise using the given block function.
 ////////////////////////////////////////////////////////////////////////////////
+static
 void
-    Sha1Finalise
+    FinaliseWith
     (
-        Sha1Context*                Context,
-        SHA1_HASH*                  Digest
+        Sha1Context*        Context,
+        SHA1_HASH*          Digest,
+        Sha1BlockFunction   Transform
     )
 {
     uint32_t    i;
     uint8_t     finalcount[8];
 
-    for( i=0; i<8; i++ )     
+    for( i=0; i<8; i++ )
     {
          finalcount[i] = (unsigned char)((Context->Count[(i >= 4 ? 0 : 1)]
          >> ((3-(i & 3)) * 8) ) & 255);  // Endian independent
     }
-    Sha1Update( Context, (uint8_t*)"\x80", 1 );
+    UpdateWith( Context, (const uint8_t*)"\x80", 1, Transform );
     while( (Context->Count[0] & 504) != 448 )
     {
-        Sha1Update( Context, (uint8_t*)"\0", 1 );
+        UpdateWith( Context, (const uint8_t*)"\0", 1, Transform );
     }
 
-    Sha1Update( Context, finalcount, 8 ); //Should cause a Sha1TransformFunction
-    for( i=0; i<SHA1_HASH_SIZE; i++ )     
+    UpdateWith( Context, finalcount, 8, Transform ); // Should cause a transform
+    for( i=0; i<SHA1_HASH_SIZE; i++ )
     {
          Digest->bytes[i] =
             (uint8_t)((Context->State[i>>2] >> ((3-(i & 3)) * 8) ) & 255);
     }
 }
 
+////////////////////////////////////////////////////////////////////////////////
+//  SelfTest
+//
+//  Returns 1 if the kernel reproduces the FIPS 180 test vectors, and the
+//  scalar digest of a buffer hashed many blocks at a time.
+////////////////////////////////////////////////////////////////////////////////
+static
+int
+    SelfTest
+    (
+        Sha1BlockFunction   Transform
+    )
+{
+    static const char* const vectors[][2] =
+    {
+        { "abc", "\xa9\x99\x3e\x36\x47\x06\x81\x6a\xba\x3e"
+                 "\x25\x71\x78\x50\xc2\x6c\x9c\xd0\xd8\x9d" },
+        { "abcdbcdecdefdefgefghfghighijhijkijkljklmklmnlmnomnopnopq",
+                 "\x84\x98\x3e\x44\x1c\x3b\xd2\x6e\xba\xae"
+                 "\x4a\xa1\xf9\x51\x29\xe5\xe5\x46\x70\xf1" },
+    };
+    Sha1Context     context;
+    SHA1_HASH       digest;
+    SHA1_HASH       expected;
+    uint8_t         buffer[1000];
+    uint32_t        i;
+
+    for( i = 0; i < sizeof(vectors) / sizeof(vectors[0]); i++ )
+    {
+        Sha1Initialise( &context );
+        UpdateWith( &context, (const uint8_t*)vectors[i][0],
+            (uint32_t)strlen( vectors[i][0] ), Transform );
+        FinaliseWith( &context, &digest, Transform );
+        if( memcmp( digest.bytes, vectors[i][1], SHA1_HASH_SIZE ) != 0 )
+        {
+            return 0;
+        }
+    }
+
+    for( i = 0; i < sizeof(buffer); i++ )
+    {
+        buffer[i] = (uint8_t)(i * 7 + 3);
+    }
+    Sha1Initialise( &context );
+    UpdateWith( &context, buffer, sizeof(buffer), TransformScalar );
+    FinaliseWith( &context, &expected, TransformScalar );
+    Sha1Initialise( &context );
+    UpdateWith( &context, buffer, 5, Transform );
+    UpdateWith( &context, buffer + 5, sizeof(buffer) - 5, Transform );
+    FinaliseWith( &context, &digest, Transform );
+
+    return memcmp( digest.bytes, expected.bytes, SHA1_HASH_SIZE ) == 0;
+}
+
+////////////////////////////////////////////////////////////////////////////////
+//  SelectedTransform
+//
+//  Returns the block function in use, selecting the first kernel this cpu
+//  supports that passes its self test on first use.
+////////////////////////////////////////////////////////////////////////////////
+static
+Sha1BlockFunction
+    SelectedTransform
+    (
+        void
+    )
+{
+    int     i = KernelIndex;
+
+    if( i < 0 )
+    {
+        for( i = 0; i < (int)SCALAR_KERNEL; i++ )
+        {
+            if( Kernels[i].Supported() && SelfTest( Kernels[i].Transform ) )
+            {
+                break;
+            }
+        }
+        KernelIndex = i;
+    }
+    return Kernels[i].Transform;
+}
+
+////////////////////////////////////////////////////////////////////////////////
+//  PUBLIC FUNCTIONS
+////////////////////////////////////////////////////////////////////////////////
+
+////////////////////////////////////////////////////////////////////////////////
+//  Sha1Initialise
+//
+//  Initialises an SHA1 Context. Use this to initialise/reset a context.
+////////////////////////////////////////////////////////////////////////////////
+void
+    Sha1Initialise
+    (
+        Sha1Context*                Context
+    )
+{
+    // SHA1 initialization constants
+    Context->State[0] = 0x67452301;
+    Context->State[1] = 0xEFCDAB89;
+    Context->State[2] = 0x98BADCFE;
+    Context->State[3] = 0x10325476;
+    Context->State[4] = 0xC3D2E1F0;
+    Context->Count[0] = 0;
+    Context->Count[1] = 0;
+}
+
+////////////////////////////////////////////////////////////////////////////////
+//  Sha1Update
+//
+//  Adds data to the SHA1 context. This will process the data and update the
+//  internal state of the context. Keep on calling this function until all the
+//   data has been added. Then call Sha1Finalise to calculate the hash.
+////////////////////////////////////////////////////////////////////////////////
+void
+    Sha1Update
+    (
+        Sha1Context*        Context,
+        void*               Buffer,
+        uint32_t            BufferSize
+    )
+{
+    UpdateWith( Context, (const uint8_t*)Buffer, BufferSize,
+        SelectedTransform() );
+}
+
+////////////////////////////////////////////////////////////////////////////////
+//  Sha1Finalise
+//
+//  Performs the final calculation of the hash and returns the digest (20 byte
+//  buffer containing 160bit hash). After calling this, Sha1Initialised must be
+//  used to reuse the context.
+////////////////////////////////////////////////////////////////////////////////
+void
+    Sha1Finalise
+    (
+        Sha1Context*                Context,
+        SHA1_HASH*                  Digest
+    )
+{
+    FinaliseWith( Context, Digest, SelectedTransform() );
+}
+
+////////////////////////////////////////////////////////////////////////////////
+//  Sha1Kernel
+//
+//  Returns the name of the block function in use: "sha-ni", "armv8" or
+//  "scalar".
+////////////////////////////////////////////////////////////////////////////////
+const char*
+    Sha1Kernel
+    (
+        void
+    )
+{
+    SelectedTransform();
+    return Kernels[KernelIndex].Name;
+}
+
+////////////////////////////////////////////////////////////////////////////////
+//  Sha1SelectKernel
+//
+//  Selects the named block function, or the fastest available if Name is
+//  NULL. Returns 0 on success, or -1 (leaving the selection unchanged) if
+//  the kernel is unknown, not supported by this cpu or fails its self test.
+////////////////////////////////////////////////////////////////////////////////
+int
+    Sha1SelectKernel
+    (
+        const char*                 Name
+    )
+{
+    uint32_t    i;
+
+    if( Name == NULL )
+    {
+        KernelIndex = -1;
+        SelectedTransform();
+        return 0;
+    }
+    for( i = 0; i <= SCALAR_KERNEL; i++ )
+    {
+        if( strcmp( Kernels[i].Name, Name ) == 0 )
+        {
+            if( Kernels[i].Supported && !( Kernels[i].Supported()
+                    && SelfTest( Kernels[i].Transform ) ) )
+            {
+                return -1;
+            }
+            KernelIndex = (int)i;
+            return 0;
+        }
+    }
+    return -1;
+}
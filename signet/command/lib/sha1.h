@@ -91,5 +91,33 @@ void
         SHA1_HASH*                  Digest
     );
 
+////////////////////////////////////////////////////////////////////////////////
+//  Sha1Kernel
+//
+//  Returns the name of the block function used to hash: "sha-ni" (x86 SHA
+//  extensions), "armv8" (ARMv8 crypto extensions) or "scalar". The first
+//  hash selects the fastest one the cpu supports that passes a self test
+//  against known vectors, falling back to "scalar".
+////////////////////////////////////////////////////////////////////////////////
+const char*
+    Sha1Kernel
+    (
+        void
+    );
+
+////////////////////////////////////////////////////////////////////////////////
+//  Sha1SelectKernel
+//
+//  Selects the named block function, or the fastest available if Name is
+//  NULL. Returns 0 on success, or -1 (leaving the selection unchanged) if
+//  the kernel is unknown, not supported by this cpu or fails its self test.
+//  Not thread safe: select before hashing.
+////////////////////////////////////////////////////////////////////////////////
+int
+    Sha1SelectKernel
+    (
+        const char*                 Name
+    );
+
 ////////////////////////////////////////////////////////////////////////////////
 #endif //_SHA1_H_
@@ -0,0 +1,29 @@
+#ifndef _SHA256_H_
+#define _SHA256_H_
+
+#include <stddef.h>
+
+#if defined(_MSC_VER) && _MSC_VER < 1600
+typedef unsigned __int32 uint32_t;
+typedef unsigned __int64 uint64_t;
+#else
+#include <stdint.h>
+#endif
+
+/* SHA-256 (FIPS 180-4), portable C */
+
+const size_t SHA256_SIZE = 32;	/* bytes in a digest */
+
+struct Sha256Context {
+	uint32_t state[8];
+	uint64_t count;				/* bytes hashed */
+	unsigned char buffer[64];	/* partial block */
+	};
+
+void sha256_init(Sha256Context* ctx);
+void sha256_update(Sha256Context* ctx, const void* data, size_t size);
+
+/* store the SHA256_SIZE byte digest in *digest* */
+void sha256_final(Sha256Context* ctx, unsigned char digest[]);
+
+#endif
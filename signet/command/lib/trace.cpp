@@ -0,0 +1,116 @@
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include <string>
+
+#include "trace.h"
+
+#ifdef _MSC_VER
+#include <windows.h>
+#else
+#include <pthread.h>
+#endif
+
+using namespace std;
+
+/* return a number identifying the calling thread */
+
+static unsigned long thread_id() {
+#ifdef _MSC_VER
+	return (unsigned long)GetCurrentThreadId();
+#else
+	return (unsigned long)pthread_self();
+#endif
+	}
+
+Tracer::Tracer() : fout(NULL), owned(0), origin(0) {}
+
+Tracer::~Tracer() {
+	close();
+	}
+
+int Tracer::open(const char* spec, long long start) {
+
+	close();
+	if (spec == NULL || !*spec)
+		return -1;
+
+	/* all digits is a file descriptor, anything else a path */
+
+	if (strspn(spec, "0123456789") == strlen(spec)) {
+		int fd = atoi(spec);
+#ifdef _MSC_VER
+		fout = _fdopen(fd, "a");
+#else
+		fout = fdopen(fd, "a");
+#endif
+		owned = 0;
+		}
+	else{
+		fout = fopen(spec, "a");
+		owned = 1;
+		}
+
+	origin = start;
+	return fout ? 0 : -1;
+	}
+
+int Tracer::enabled() const {
+	return fout != NULL;
+	}
+
+void Tracer::event(const char* name, long long start, long long end,
+		const string& fields) {
+
+	if (fout == NULL)
+		return;
+
+	char head[256];
+	sprintf(head, "{\"event\": \"%s\", \"ts\": %lld, \"dur\": %lld, "
+			"\"tid\": %lu", name, start - origin, end - start, thread_id());
+
+	string line = head;
+	if (!fields.empty()) {
+		line += ", ";
+		line += fields;
+		}
+	line += "}\n";
+
+	mutex.lock();
+	fputs(line.c_str(), fout);
+	fflush(fout);
+	mutex.unlock();
+	}
+
+void Tracer::close() {
+
+	/* never close a descriptor we were handed */
+
+	if (fout != NULL && owned)
+		fclose(fout);
+	else if (fout != NULL)
+		fflush(fout);
+	fout = NULL;
+	}
+
+string json_string(const string& value) {
+
+	string quoted = "\"";
+	for(size_t i = 0; i < value.size(); i++) {
+		unsigned char c = (unsigned char)value[i];
+		if (c == '"' || c == '\\') {
+			quoted += '\\';
+			quoted += (char)c;
+			}
+		else if (c < 0x20) {
+			char esc[8];
+			sprintf(esc, "\\u%04x", c);
+			quoted += esc;
+			}
+		else{
+			quoted += (char)c;
+			}
+		}
+	return quoted + "\"";
+	}
@@ -0,0 +1,52 @@
+#ifndef _TRACE_H_
+#define _TRACE_H_
+
+#include <stdio.h>
+
+#include <string>
+
+#include "workers.h"
+
+/* A startup timeline, written as JSON lines. Each event is one line:
+ *
+ *	{"event": "hash", "ts": 1234, "dur": 56, "tid": 1, "path": "..."}
+ *
+ * with *ts* (start) and *dur* in microseconds since the trace was opened,
+ * *tid* the thread that recorded it, followed by the event's own fields.
+ * Lines are flushed as they are written, so a trace survives the loader
+ * exiting abruptly. Events may be recorded from any thread. */
+
+class Tracer {
+
+private:
+	FILE* fout;
+	int owned;					/* we opened fout (by path) */
+	long long origin;			/* timestamps are relative to this */
+	Mutex mutex;
+
+public:
+	Tracer();
+	~Tracer();
+
+	/* start tracing to *spec*, a file descriptor number or a path (which is
+	 * appended to). *origin* is the monotonic time (usecs) of time zero.
+	 * Returns 0, or -1 if *spec* could not be opened */
+	int open(const char* spec, long long origin);
+
+	/* return 1 if open() succeeded */
+	int enabled() const;
+
+	/* record event *name*, that ran from *start* until *end* (monotonic
+	 * usecs). *fields* are extra JSON members, eg: "\"bytes\": 10" */
+	void event(const char* name, long long start, long long end,
+			const std::string& fields = "");
+
+	/* stop tracing */
+	void close();
+	};
+
+/* return *value* as a quoted JSON string */
+
+std::string json_string(const std::string& value);
+
+#endif //_TRACE_H_
@@ -0,0 +1,132 @@
+#include <stdio.h>
+#include <string.h>
+
+#include "watchdog.h"
+
+#ifdef __linux__
+#include <errno.h>
+#include <fcntl.h>
+#include <limits.h>
+#include <poll.h>
+#include <sys/inotify.h>
+#include <unistd.h>
+
+/* events that mean a file's contents may not be what we verified. IN_MODIFY
+ * catches writes through a descriptor (or shared mapping) that is kept
+ * open, the paths of a burst of writes are verified once per wait() */
+
+static const unsigned int WATCH_EVENTS = IN_MODIFY | IN_CLOSE_WRITE |
+		IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE | IN_CREATE;
+#endif
+
+using namespace std;
+
+DirWatcher::DirWatcher() : fd(-1) {
+	wakeup[0] = wakeup[1] = -1;
+	}
+
+DirWatcher::~DirWatcher() {
+#ifdef __linux__
+	if (fd >= 0)
+		close(fd);
+	for(int i = 0; i < 2; i++) {
+		if (wakeup[i] >= 0)
+			close(wakeup[i]);
+		}
+#endif
+	}
+
+#ifndef __linux__
+
+int DirWatcher::open() { return -1; }
+int DirWatcher::add(const string& path) { return -1; }
+int DirWatcher::wait(vector<string>& changed) { return -1; }
+void DirWatcher::stop() {}
+
+#else
+
+int DirWatcher::open() {
+
+	if (fd >= 0)
+		return 0;
+	if (pipe(wakeup) != 0)
+		return -1;
+	for(int i = 0; i < 2; i++)
+		fcntl(wakeup[i], F_SETFD, FD_CLOEXEC);
+
+	fd = inotify_init1(IN_CLOEXEC);
+	if (fd < 0) {
+		close(wakeup[0]);
+		close(wakeup[1]);
+		wakeup[0] = wakeup[1] = -1;
+		return -1;
+		}
+	return 0;
+	}
+
+int DirWatcher::add(const string& path) {
+
+	if (fd < 0)
+		return -1;
+	int wd = inotify_add_watch(fd, path.c_str(), WATCH_EVENTS | IN_ONLYDIR);
+	if (wd < 0)
+		return -1;
+
+	mutex.lock();
+	dirs[wd] = path;
+	mutex.unlock();
+	return 0;
+	}
+
+int DirWatcher::wait(vector<string>& changed) {
+
+	changed.clear();
+	if (fd < 0)
+		return -1;
+
+	char buf[64 * (sizeof(struct inotify_event) + NAME_MAX + 1)]
+		__attribute__ ((aligned(__alignof__(struct inotify_event))));
+
+	while (changed.empty()) {
+
+		struct pollfd fds[2] = {{fd, POLLIN, 0}, {wakeup[0], POLLIN, 0}};
+		if (poll(fds, 2, -1) < 0) {
+			if (errno == EINTR)
+				continue;
+			return -1;
+			}
+		if (fds[1].revents)
+			return -1;
+
+		ssize_t n = read(fd, buf, sizeof(buf));
+		if (n < 0 && (errno == EINTR || errno == EAGAIN))
+			continue;
+		if (n <= 0)
+			return -1;
+
+		mutex.lock();
+		for(char* p = buf; p < buf + n; ) {
+			struct inotify_event* ev = (struct inotify_event*)p;
+			p += sizeof(struct inotify_event) + ev->len;
+
+			if (ev->mask & IN_Q_OVERFLOW) {
+				changed.push_back("");
+				continue;
+				}
+			map<int, string>::const_iterator it = dirs.find(ev->wd);
+			if (it == dirs.end() || ev->len == 0 || 
+					!(ev->mask & WATCH_EVENTS))
+				continue;
+			changed.push_back(it->second + "/" + ev->name);
+			}
+		mutex.unlock();
+		}
+	return 0;
+	}
+
+void DirWatcher::stop() {
+
+	if (wakeup[1] >= 0 && write(wakeup[1], "q", 1) < 0) {}
+	}
+
+#endif
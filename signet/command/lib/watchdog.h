@@ -0,0 +1,51 @@
+#ifndef _WATCHDOG_H_
+#define _WATCHDOG_H_
+
+#include <map>
+#include <string>
+#include <vector>
+
+#include "workers.h"
+
+/* Notification of changes to the files in a set of directories (inotify,
+ * linux only). Watching directories rather than files also catches a file
+ * replaced by a rename, and costs one watch per directory. Nothing is read
+ * or polled while the files don't change.
+ *
+ * On other platforms open() fails. */
+
+class DirWatcher {
+
+private:
+	int fd;						/* inotify instance, or -1 */
+	int wakeup[2];				/* stop() wakes wait() through this pipe */
+	std::map<int, std::string> dirs;	/* by watch descriptor */
+	Mutex mutex;
+	DirWatcher(const DirWatcher&);
+	DirWatcher& operator=(const DirWatcher&);
+
+public:
+	DirWatcher();
+	~DirWatcher();
+
+	/* start watching, returns 0, or -1 if not supported */
+	int open();
+	int enabled() const { 
+		return fd >= 0; 
+		}
+
+	/* watch the files in directory *path* (adding it twice is harmless).
+	 * May be called from any thread. Returns 0, or -1 on error */
+	int add(const std::string& path);
+
+	/* block until files in the watched directories are written, replaced
+	 * or removed, and store their paths (directory + SEP + name) in
+	 * *changed* ("" if events were lost, and any file may have changed).
+	 * Returns 0, or -1 once stop() was called (or on error) */
+	int wait(std::vector<std::string>& changed);
+
+	/* make wait() return -1, may be called from any thread */
+	void stop();
+	};
+
+#endif //_WATCHDOG_H_
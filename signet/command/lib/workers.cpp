@@ -0,0 +1,449 @@
+#include <stdio.h>
+#include <stdlib.h>
+
+#include <algorithm>
+#include <vector>
+
+#include "workers.h"
+
+#ifndef _MSC_VER
+#include <sched.h>
+#include <unistd.h>
+#endif
+
+#ifdef __linux__
+#include <sys/resource.h>
+#include <sys/syscall.h>
+#endif
+
+#ifdef _MSC_VER
+#define THREAD_LOCAL __declspec(thread)
+#else
+#define THREAD_LOCAL __thread
+#endif
+
+/* set by lower_thread_priority(), the thread's parallel_for() calls then
+ * run on the idle priority pool */
+
+static THREAD_LOCAL int LowPriority = 0;
+
+struct Batch {					/* one parallel_for() call */
+	size_t count;
+	void (*fn)(size_t, void*);
+	void* arg;
+	volatile long next;			/* next index to claim */
+	int helpers;				/* pool threads it may use */
+	int active;					/* pool threads working on it */
+	};
+
+/* claim the next unprocessed index of *batch* */
+
+static long claim(Batch* batch) {
+	return atomic_add(&batch->next, 1);
+	}
+
+/* run jobs of *batch* until every one was claimed */
+
+static void work(Batch* batch) {
+	long i;
+	while((i = claim(batch)) < (long)batch->count) {
+		batch->fn((size_t)i, batch->arg);
+		}
+	}
+
+/* The worker threads are started once, by the first parallel_for() that
+ * needs them, and wait for batches between calls. Calls from fn (nested
+ * batches, eg: the chunks of a file) are queued on the same threads, so
+ * the pool's size bounds the threads hashing at once. Threads that lowered
+ * their priority use a pool of their own, of idle priority threads. Pools
+ * are never freed, their threads are still waiting when the process exits */
+
+class Pool {
+
+private:
+#ifdef _MSC_VER
+	CRITICAL_SECTION cs;
+	CONDITION_VARIABLE work_ready;	/* a batch was queued */
+	CONDITION_VARIABLE work_done;	/* a thread left a batch */
+#else
+	pthread_mutex_t mtx;
+	pthread_cond_t work_ready;
+	pthread_cond_t work_done;
+#endif
+	std::vector<Batch*> queue;	/* batches with jobs left to claim */
+	int started;				/* threads running */
+	int low;					/* threads run at idle priority */
+
+	void lock();
+	void unlock();
+	void wait(int done);
+	void wake(int done);
+	Batch* next_batch();
+
+#ifdef _MSC_VER
+	static DWORD WINAPI thread_main(LPVOID param);
+#else
+	static void* thread_main(void* param);
+#endif
+
+public:
+	Pool(int low);
+	void run(Batch& batch, int threads);
+#ifndef _MSC_VER
+	void before_fork() { lock(); }
+	void after_fork() { unlock(); }
+	void reset_child();
+#endif
+	};
+
+#ifdef _MSC_VER
+Pool::Pool(int low) : started(0), low(low) {
+	InitializeCriticalSection(&cs);
+	InitializeConditionVariable(&work_ready);
+	InitializeConditionVariable(&work_done);
+	}
+void Pool::lock() { EnterCriticalSection(&cs); }
+void Pool::unlock() { LeaveCriticalSection(&cs); }
+void Pool::wait(int done) {
+	SleepConditionVariableCS(done ? &work_done : &work_ready, &cs, INFINITE);
+	}
+void Pool::wake(int done) {
+	WakeAllConditionVariable(done ? &work_done : &work_ready);
+	}
+#else
+Pool::Pool(int low) : started(0), low(low) {
+	pthread_mutex_init(&mtx, NULL);
+	pthread_cond_init(&work_ready, NULL);
+	pthread_cond_init(&work_done, NULL);
+	}
+void Pool::lock() { pthread_mutex_lock(&mtx); }
+void Pool::unlock() { pthread_mutex_unlock(&mtx); }
+void Pool::wait(int done) {
+	pthread_cond_wait(done ? &work_done : &work_ready, &mtx);
+	}
+void Pool::wake(int done) {
+	pthread_cond_broadcast(done ? &work_done : &work_ready);
+	}
+
+/* the forked child has none of our threads, start afresh */
+
+void Pool::reset_child() {
+	pthread_mutex_init(&mtx, NULL);
+	pthread_cond_init(&work_ready, NULL);
+	pthread_cond_init(&work_done, NULL);
+	queue.clear();
+	started = 0;
+	}
+#endif
+
+/* the first queued batch a thread may help with, or NULL. Call locked */
+
+Batch* Pool::next_batch() {
+	for(size_t i = 0; i < queue.size(); i++) {
+		Batch* batch = queue[i];
+		if (batch->next < (long)batch->count && 
+				batch->active < batch->helpers)
+			return batch;
+		}
+	return NULL;
+	}
+
+/* pool thread body, help with queued batches forever */
+
+#ifdef _MSC_VER
+DWORD WINAPI Pool::thread_main(LPVOID param) {
+#else
+void* Pool::thread_main(void* param) {
+#endif
+	Pool* pool = (Pool*)param;
+	if (pool->low)
+		lower_thread_priority();
+
+	pool->lock();
+	for(;;) {
+		Batch* batch = pool->next_batch();
+		if (batch == NULL) {
+			pool->wait(0);
+			continue;
+			}
+		batch->active++;
+		pool->unlock();
+
+		work(batch);
+
+		pool->lock();
+		batch->active--;
+		pool->wake(1);
+		}
+	return 0;
+	}
+
+/* run *batch* on the calling thread and up to *threads* pool threads,
+ * returns once every job finished */
+
+void Pool::run(Batch& batch, int threads) {
+
+	lock();
+	for(; started < threads; started++) {
+#ifdef _MSC_VER
+		HANDLE handle = CreateThread(NULL, 0, thread_main, this, 0, NULL);
+		if (handle == NULL)
+			break;
+		CloseHandle(handle);
+#else
+		pthread_t handle;
+		pthread_attr_t attr;
+		pthread_attr_init(&attr);
+		pthread_attr_setdetachstate(&attr, PTHREAD_CREATE_DETACHED);
+		int rc = pthread_create(&handle, &attr, thread_main, this);
+		pthread_attr_destroy(&attr);
+		if (rc != 0)
+			break;
+#endif
+		}
+	batch.helpers = (threads < started) ? threads : started;
+	queue.push_back(&batch);
+	wake(0);
+	unlock();
+
+	work(&batch);
+
+	/* every job was claimed, wait for the threads still running one */
+
+	lock();
+	queue.erase(std::find(queue.begin(), queue.end(), &batch));
+	while (batch.active > 0)
+		wait(1);
+	unlock();
+	}
+
+static int PoolThreads = 0;		/* size_workers() setting */
+static Pool* Pools[2] = {NULL, NULL};	/* normal, idle priority */
+
+#ifndef _MSC_VER
+static void before_fork() {
+	for(int i = 0; i < 2; i++)
+		if (Pools[i]) Pools[i]->before_fork();
+	}
+static void after_fork_parent() {
+	for(int i = 1; i >= 0; i--)
+		if (Pools[i]) Pools[i]->after_fork();
+	}
+static void after_fork_child() {
+	for(int i = 0; i < 2; i++)
+		if (Pools[i]) Pools[i]->reset_child();
+	}
+#endif
+
+long atomic_add(volatile long* value, long delta) {
+#ifdef _MSC_VER
+	return InterlockedExchangeAdd(value, delta);
+#else
+	return __sync_fetch_and_add(value, delta);
+#endif
+	}
+
+long long atomic_add(volatile long long* value, long long delta) {
+#ifdef _MSC_VER
+	return InterlockedExchangeAdd64(value, delta);
+#else
+	return __sync_fetch_and_add(value, delta);
+#endif
+	}
+
+#ifdef _MSC_VER
+Mutex::Mutex() { InitializeCriticalSection(&cs); }
+Mutex::~Mutex() { DeleteCriticalSection(&cs); }
+void Mutex::lock() { EnterCriticalSection(&cs); }
+void Mutex::unlock() { LeaveCriticalSection(&cs); }
+#else
+Mutex::Mutex() { pthread_mutex_init(&mtx, NULL); }
+Mutex::~Mutex() { pthread_mutex_destroy(&mtx); }
+void Mutex::lock() { pthread_mutex_lock(&mtx); }
+void Mutex::unlock() { pthread_mutex_unlock(&mtx); }
+#endif
+
+#ifdef __linux__
+
+/* return the cpus allowed by the cgroup (v2 or v1) quota, or 0 if there
+ * is no quota */
+
+static int cgroup_cpus() {
+
+	long quota = -1, period = 0;
+	char max[32];
+
+	FILE* fin = fopen("/sys/fs/cgroup/cpu.max", "r");
+	if (fin) {
+		if (fscanf(fin, "%31s %ld", max, &period) == 2 && 
+				sscanf(max, "%ld", &quota) != 1)
+			quota = -1;				/* "max" -- unlimited */
+		fclose(fin);
+		}
+	else if ((fin = fopen("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", "r"))) {
+		if (fscanf(fin, "%ld", &quota) != 1)
+			quota = -1;
+		fclose(fin);
+		if ((fin = fopen("/sys/fs/cgroup/cpu/cpu.cfs_period_us", "r"))) {
+			if (fscanf(fin, "%ld", &period) != 1)
+				period = 0;
+			fclose(fin);
+			}
+		}
+
+	if (quota <= 0 || period <= 0)
+		return 0;
+	return (int)((quota + period - 1) / period);
+	}
+
+#endif
+
+int cpu_count() {
+
+	int count = 1;
+
+#ifdef _MSC_VER
+	DWORD_PTR procmask, sysmask;
+	if (GetProcessAffinityMask(GetCurrentProcess(), &procmask, &sysmask)) {
+		for(count = 0; procmask; procmask >>= 1)
+			count += (int)(procmask & 1);
+		}
+	else{
+		SYSTEM_INFO info;
+		GetSystemInfo(&info);
+		count = (int)info.dwNumberOfProcessors;
+		}
+#else
+	count = (int)sysconf(_SC_NPROCESSORS_ONLN);
+#ifdef __linux__
+	cpu_set_t cpus;
+	if (sched_getaffinity(0, sizeof(cpus), &cpus) == 0)
+		count = CPU_COUNT(&cpus);
+	int quota = cgroup_cpus();
+	if (quota > 0 && quota < count)
+		count = quota;
+#endif
+#endif
+
+	return count < 1 ? 1 : count;
+	}
+
+int worker_count(int requested, size_t jobs) {
+
+	int workers = requested > 0 ? requested : cpu_count();
+	if (workers > MAX_WORKERS)
+		workers = MAX_WORKERS;
+	if ((size_t)workers > jobs)
+		workers = (int)jobs;
+	return workers < 1 ? 1 : workers;
+	}
+
+void size_workers(int requested) {
+	PoolThreads = requested;
+	}
+
+void parallel_for(size_t count, int workers, void (*fn)(size_t, void*),
+		void* arg) {
+
+	Batch batch;
+	batch.count = count;
+	batch.fn = fn;
+	batch.arg = arg;
+	batch.next = 0;
+	batch.helpers = 0;
+	batch.active = 0;
+
+	/* the calling thread is a worker too, the pool runs the others */
+
+	int pool_size = worker_count(PoolThreads, MAX_WORKERS);
+	if (workers > pool_size)
+		workers = pool_size;
+	if (workers <= 1 || count <= 1) {
+		work(&batch);
+		return;
+		}
+
+	static Mutex& create = *new Mutex();
+	int low = LowPriority;
+	create.lock();
+	if (Pools[low] == NULL) {
+#ifndef _MSC_VER
+		if (Pools[0] == NULL && Pools[1] == NULL)
+			pthread_atfork(before_fork, after_fork_parent, after_fork_child);
+#endif
+		Pools[low] = new Pool(low);
+		}
+	create.unlock();
+
+	Pools[low]->run(batch, workers - 1);
+	}
+
+struct ThreadStart {			/* function run by a Thread */
+	void (*fn)(void*);
+	void* arg;
+	};
+
+#ifdef _MSC_VER
+static DWORD WINAPI thread_main(LPVOID param) {
+#else
+static void* thread_main(void* param) {
+#endif
+	ThreadStart* ts = (ThreadStart*)param;
+	ts->fn(ts->arg);
+	delete ts;
+	return 0;
+	}
+
+Thread::Thread() : running(0) {}
+
+Thread::~Thread() {
+	join();
+	}
+
+int Thread::start(void (*fn)(void*), void* arg) {
+
+	if (running)
+		return -1;
+
+	ThreadStart* ts = new ThreadStart;
+	ts->fn = fn;
+	ts->arg = arg;
+#ifdef _MSC_VER
+	handle = CreateThread(NULL, 0, thread_main, ts, 0, NULL);
+	running = (handle != NULL);
+#else
+	running = (pthread_create(&handle, NULL, thread_main, ts) == 0);
+#endif
+	if (!running) {
+		delete ts;
+		return -1;
+		}
+	return 0;
+	}
+
+int Thread::started() const {
+	return running;
+	}
+
+void Thread::join() {
+
+	if (!running)
+		return;
+#ifdef _MSC_VER
+	WaitForSingleObject(handle, INFINITE);
+	CloseHandle(handle);
+#else
+	pthread_join(handle, NULL);
+#endif
+	running = 0;
+	}
+
+void lower_thread_priority() {
+	LowPriority = 1;
+#ifdef _MSC_VER
+	SetThreadPriority(GetCurrentThread(), THREAD_PRIORITY_IDLE);
+#elif defined(__linux__)
+	/* linux threads have their own nice value */
+	setpriority(PRIO_PROCESS, (id_t)syscall(SYS_gettid), 19);
+#endif
+	}
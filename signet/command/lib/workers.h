@@ -0,0 +1,91 @@
+
+#ifndef _WORKERS_H_
+#define _WORKERS_H_
+
+#include <stddef.h>
+
+#ifdef _MSC_VER
+#include <windows.h>
+#else
+#include <pthread.h>
+#endif
+
+/* largest number of worker threads we will start */
+
+const int MAX_WORKERS = 64;
+
+/* return the number of cpus this process may run on, honoring the cpu
+ * affinity mask and (on linux) the cgroup cpu quota */
+
+int cpu_count();
+
+/* return the number of workers to use for *jobs* jobs. *requested* is the
+ * user's setting (0 for automatic, sized from cpu_count()) */
+
+int worker_count(int requested, size_t jobs);
+
+/* size the pool of worker threads parallel_for() runs on: *requested*
+ * threads (0 for automatic, sized from cpu_count()). The threads are started
+ * by the first parallel_for() that needs them, and reused by every later
+ * call. Call before the first parallel_for() */
+
+void size_workers(int requested);
+
+/* call fn(i, arg) for every i in [0, count), spread over *workers* threads
+ * (the calling thread is one of them, the others come from the pool, which
+ * caps them). Returns once every call finished. fn may call parallel_for()
+ * itself, the nested calls share the same pool threads */
+
+void parallel_for(size_t count, int workers, void (*fn)(size_t, void*),
+		void* arg);
+
+/* atomically add *delta* to *value*, return the previous value */
+
+long atomic_add(volatile long* value, long delta);
+long long atomic_add(volatile long long* value, long long delta);
+
+class Mutex {					/* portable, non-recursive mutex */
+
+private:
+#ifdef _MSC_VER
+	CRITICAL_SECTION cs;
+#else
+	pthread_mutex_t mtx;
+#endif
+	Mutex(const Mutex&);
+	Mutex& operator=(const Mutex&);
+
+public:
+	Mutex();
+	~Mutex();
+	void lock();
+	void unlock();
+	};
+
+/* run the calling thread at idle priority (on posix other than linux,
+ * the priority is per process and is left alone). It's parallel_for()
+ * calls run on a pool of idle priority threads */
+
+void lower_thread_priority();
+
+class Thread {					/* a single joinable background thread */
+
+private:
+#ifdef _MSC_VER
+	HANDLE handle;
+#else
+	pthread_t handle;
+#endif
+	int running;
+	Thread(const Thread&);
+	Thread& operator=(const Thread&);
+
+public:
+	Thread();
+	~Thread();
+	int start(void (*fn)(void*), void* arg);	/* 0 on success */
+	int started() const;
+	void join();
+	};
+
+#endif //_WORKERS_H_
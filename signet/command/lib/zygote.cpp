@@ -0,0 +1,320 @@
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include "zygote.h"
+
+#ifndef _MSC_VER
+#include <errno.h>
+#include <stdint.h>
+#include <sys/socket.h>
+#include <sys/stat.h>
+#include <sys/time.h>
+#include <sys/types.h>
+#include <sys/un.h>
+#include <unistd.h>
+
+extern char** environ;
+
+#ifndef MSG_NOSIGNAL
+#define MSG_NOSIGNAL 0
+#endif
+#endif
+
+using namespace std;
+
+#ifdef _MSC_VER
+
+int zygote_listen(const char* path) { return -1; }
+int zygote_accept(int listener) { return -1; }
+int zygote_recv(int sock, ZygoteRequest& req) { return -1; }
+int zygote_ack(int sock) { return -1; }
+int zygote_reply(int sock, int status) { return -1; }
+int zygote_run(const char* path, const string& id,
+		const vector<string>& argv, int* status) { return -1; }
+
+#else
+
+/* fill *addr* with UNIX socket *path*, returns -1 if it's too long */
+
+static int socket_address(const char* path, struct sockaddr_un* addr) {
+
+	memset(addr, 0, sizeof(*addr));
+	addr->sun_family = AF_UNIX;
+	if (strlen(path) >= sizeof(addr->sun_path))
+		return -1;
+	strcpy(addr->sun_path, path);
+	return 0;
+	}
+
+/* return 1 if the peer on *sock* runs as our user */
+
+static int same_user(int sock) {
+
+#ifdef __linux__
+	struct ucred cred;
+	socklen_t len = sizeof(cred);
+	if (getsockopt(sock, SOL_SOCKET, SO_PEERCRED, &cred, &len) != 0)
+		return 0;
+	return cred.uid == getuid();
+#else
+	uid_t uid;
+	gid_t gid;
+	if (getpeereid(sock, &uid, &gid) != 0)
+		return 0;
+	return uid == getuid();
+#endif
+	}
+
+/* write (or read) exactly *size* bytes, returns -1 on error or eof. A
+ * peer that went away is an error, not a SIGPIPE */
+
+static int write_all(int fd, const char* data, size_t size) {
+
+	while (size > 0) {
+		ssize_t n = send(fd, data, size, MSG_NOSIGNAL);
+		if (n < 0 && errno == EINTR)
+			continue;
+		if (n <= 0)
+			return -1;
+		data += n;
+		size -= (size_t)n;
+		}
+	return 0;
+	}
+
+static int read_all(int fd, char* data, size_t size) {
+
+	while (size > 0) {
+		ssize_t n = read(fd, data, size);
+		if (n < 0 && errno == EINTR)
+			continue;
+		if (n <= 0)
+			return -1;
+		data += n;
+		size -= (size_t)n;
+		}
+	return 0;
+	}
+
+static int write_int(int fd, int value) {
+	int32_t v = (int32_t)value;
+	return write_all(fd, (const char*)&v, sizeof(v));
+	}
+
+static int read_int(int fd, int* value) {
+	int32_t v;
+	if (read_all(fd, (char*)&v, sizeof(v)))
+		return -1;
+	*value = (int)v;
+	return 0;
+	}
+
+int zygote_listen(const char* path) {
+
+	struct sockaddr_un addr;
+	if (socket_address(path, &addr))
+		return -1;
+
+	int sock = socket(AF_UNIX, SOCK_STREAM, 0);
+	if (sock < 0)
+		return -1;
+
+	/* only replace a socket nobody is listening on */
+
+	if (connect(sock, (struct sockaddr*)&addr, sizeof(addr)) == 0) {
+		close(sock);
+		return -1;
+		}
+	close(sock);
+
+	struct stat st;
+	if (lstat(path, &st) == 0 && S_ISSOCK(st.st_mode))
+		unlink(path);
+
+	if ((sock = socket(AF_UNIX, SOCK_STREAM, 0)) < 0)
+		return -1;
+
+	mode_t mask = umask(077);
+	int rc = bind(sock, (struct sockaddr*)&addr, sizeof(addr));
+	umask(mask);
+
+	if (rc != 0 || listen(sock, SOMAXCONN) != 0) {
+		close(sock);
+		return -1;
+		}
+	return sock;
+	}
+
+int zygote_accept(int listener) {
+
+	int sock = accept(listener, NULL, NULL);
+	if (sock < 0)
+		return -1;
+	if (!same_user(sock)) {
+		close(sock);
+		return -1;
+		}
+
+	/* the server handles one request at a time, a client that connects
+	 * and sends nothing (or part of a request) must not stall it */
+
+	struct timeval timeout = {ZYGOTE_RECV_TIMEOUT, 0};
+	if (setsockopt(sock, SOL_SOCKET, SO_RCVTIMEO, &timeout,
+				sizeof(timeout)) != 0) {
+		close(sock);
+		return -1;
+		}
+	return sock;
+	}
+
+int zygote_recv(int sock, ZygoteRequest& req) {
+
+	/* the length carries the client's stdio */
+
+	uint32_t size = 0;
+	struct iovec iov = {&size, sizeof(size)};
+	char control[CMSG_SPACE(3 * sizeof(int))];
+	struct msghdr msg;
+	memset(&msg, 0, sizeof(msg));
+	msg.msg_iov = &iov;
+	msg.msg_iovlen = 1;
+	msg.msg_control = control;
+	msg.msg_controllen = sizeof(control);
+
+	ssize_t n;
+	while ((n = recvmsg(sock, &msg, 0)) < 0 && errno == EINTR)
+		;
+
+	int nfds = 0;
+	struct cmsghdr* cmsg = CMSG_FIRSTHDR(&msg);
+	if (n > 0 && cmsg != NULL && cmsg->cmsg_level == SOL_SOCKET &&
+			cmsg->cmsg_type == SCM_RIGHTS) {
+		nfds = (int)((cmsg->cmsg_len - CMSG_LEN(0)) / sizeof(int));
+		if (nfds > 3)
+			nfds = 3;
+		memcpy(req.fds, CMSG_DATA(cmsg), nfds * sizeof(int));
+		}
+
+	/* anything but exactly the three stdio fds is refused */
+
+	if (nfds != 3 || (msg.msg_flags & MSG_CTRUNC) ||
+			(n < (ssize_t)sizeof(size) &&
+			 read_all(sock, (char*)&size + n, sizeof(size) - n))) {
+		for(int i = 0; i < nfds; i++)
+			close(req.fds[i]);
+		return -1;
+		}
+
+	/* then the strings */
+
+	vector<string> fields;
+	if (size <= ZYGOTE_MAX_REQUEST) {
+		string data(size, '\0');
+		if (size == 0 || read_all(sock, &data[0], size) == 0) {
+			size_t pos = 0, end;
+			while ((end = data.find('\0', pos)) != string::npos) {
+				fields.push_back(data.substr(pos, end - pos));
+				pos = end + 1;
+				}
+			}
+		}
+
+	size_t argc = 0;
+	if (fields.size() > 2)
+		argc = strtoul(fields[2].c_str(), NULL, 10);
+	if (fields.size() < 3 || argc < 1 || fields.size() < 3 + argc) {
+		for(int i = 0; i < 3; i++)
+			close(req.fds[i]);
+		return -1;
+		}
+
+	req.id = fields[0];
+	req.cwd = fields[1];
+	req.argv.assign(fields.begin() + 3, fields.begin() + 3 + argc);
+	req.env.assign(fields.begin() + 3 + argc, fields.end());
+	return 0;
+	}
+
+int zygote_ack(int sock) {
+	return write_int(sock, 0);
+	}
+
+int zygote_reply(int sock, int status) {
+	return write_int(sock, status);
+	}
+
+int zygote_run(const char* path, const string& id,
+		const vector<string>& argv, int* status) {
+
+	struct sockaddr_un addr;
+	if (socket_address(path, &addr))
+		return -1;
+
+	int sock = socket(AF_UNIX, SOCK_STREAM, 0);
+	if (sock < 0)
+		return -1;
+	if (connect(sock, (struct sockaddr*)&addr, sizeof(addr)) != 0 ||
+			!same_user(sock)) {
+		close(sock);
+		return -1;
+		}
+
+	/* build the request */
+
+	char cwd[4096];
+	if (getcwd(cwd, sizeof(cwd)) == NULL)
+		cwd[0] = '\0';
+
+	char argc[32];
+	sprintf(argc, "%lu", (unsigned long)argv.size());
+
+	string data;
+	data.append(id).append(1, '\0');
+	data.append(cwd).append(1, '\0');
+	data.append(argc).append(1, '\0');
+	for(size_t i = 0; i < argv.size(); i++)
+		data.append(argv[i]).append(1, '\0');
+	for(char** ep = environ; *ep != NULL; ep++)
+		data.append(*ep).append(1, '\0');
+
+	/* send it, with our stdio */
+
+	uint32_t size = (uint32_t)data.size();
+	struct iovec iov = {&size, sizeof(size)};
+	int fds[3] = {0, 1, 2};
+	char control[CMSG_SPACE(sizeof(fds))];
+	memset(control, 0, sizeof(control));
+	struct msghdr msg;
+	memset(&msg, 0, sizeof(msg));
+	msg.msg_iov = &iov;
+	msg.msg_iovlen = 1;
+	msg.msg_control = control;
+	msg.msg_controllen = sizeof(control);
+	struct cmsghdr* cmsg = CMSG_FIRSTHDR(&msg);
+	cmsg->cmsg_level = SOL_SOCKET;
+	cmsg->cmsg_type = SCM_RIGHTS;
+	cmsg->cmsg_len = CMSG_LEN(sizeof(fds));
+	memcpy(CMSG_DATA(cmsg), fds, sizeof(fds));
+
+	ssize_t n;
+	while ((n = sendmsg(sock, &msg, MSG_NOSIGNAL)) < 0 && errno == EINTR)
+		;
+
+	int ack;
+	if (n != (ssize_t)sizeof(size) || size > ZYGOTE_MAX_REQUEST ||
+			write_all(sock, data.data(), data.size()) ||
+			read_int(sock, &ack) || ack != 0) {
+		close(sock);
+		return -1;
+		}
+
+	/* the request is running, lost contact is a failure */
+
+	if (read_int(sock, status))
+		*status = 255;
+	close(sock);
+	return 0;
+	}
+
+#endif
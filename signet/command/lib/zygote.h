@@ -0,0 +1,57 @@
+#ifndef _ZYGOTE_H_
+#define _ZYGOTE_H_
+
+#include <string>
+#include <vector>
+
+/* The fork server (zygote) protocol. A client connects to the server's
+ * UNIX socket and sends one request: its stdin, stdout & stderr (passed as
+ * SCM_RIGHTS), then a 4 byte length followed by nul terminated strings --
+ * the server id, the working directory, argc, argv[] and the environment.
+ * The server acknowledges a request it will run (4 zero bytes), then
+ * replies with the 4 byte exit status of the child it ran the request in.
+ * Both ends only talk to a peer running as the same user.
+ *
+ * Only available on posix, on windows every call fails. */
+
+const size_t ZYGOTE_MAX_REQUEST = 1024 * 1024;
+
+/* seconds a server waits for each read of a request before dropping the
+ * client */
+const int ZYGOTE_RECV_TIMEOUT = 5;
+
+struct ZygoteRequest {			/* one invocation, as received by a server */
+	std::string id;				/* identifies the script being served */
+	std::string cwd;
+	std::vector<std::string> argv;
+	std::vector<std::string> env;
+	int fds[3];					/* the client's stdin, stdout & stderr */
+	};
+
+/* listen on UNIX socket *path* (replacing a stale socket), accessible by
+ * our user only. Returns the listening socket, or -1 */
+int zygote_listen(const char* path);
+
+/* accept a connection on *listener* from a client running as our user,
+ * with reads timing out after ZYGOTE_RECV_TIMEOUT. Returns the
+ * connection, or -1 */
+int zygote_accept(int listener);
+
+/* read a request from connection *sock* into *req*. Returns 0 on success,
+ * the caller owns (and must close) req.fds */
+int zygote_recv(int sock, ZygoteRequest& req);
+
+/* tell the client on connection *sock* it's request will be run */
+int zygote_ack(int sock);
+
+/* send exit *status* to the client on connection *sock* */
+int zygote_reply(int sock, int status);
+
+/* run *argv* on the server listening at *path*, which must serve *id*,
+ * passing our working directory, environment and stdio. Blocks until it
+ * completes, and stores its exit status in *status*. Returns -1 if the
+ * server did not acknowledge the request (nothing was run) */
+int zygote_run(const char* path, const std::string& id,
+		const std::vector<std::string>& argv, int* status);
+
+#endif //_ZYGOTE_H_
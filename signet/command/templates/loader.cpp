@@ -1,21 +1,46 @@
 #include <Python.h>
+#include <marshal.h>
 #include <stdarg.h>
 #include <stdio.h>
 
 #include <algorithm>
+#include <map>
 #include <string>
 #include <sstream>
 #include <vector>
 
+#if __cplusplus >= 201103L || (defined(_MSC_VER) && _MSC_VER >= 1600)
+#include <unordered_map>
+#include <unordered_set>
+#define HASHED_CONTAINERS 1
+#else
+#include <set>
+#endif
+
 #include "loader.h"
-#include "sha1.h"
+#include "digest.h"
+#include "digestcache.h"
+#include "probes.h"
+#include "readring.h"
+#include "trace.h"
 #include "verifytrust.h"
+#include "watchdog.h"
+#include "workers.h"
+#include "zygote.h"
 
 
 #ifdef _MSC_VER
 #include <Windows.h>
+#include <io.h>
 #else
 #include <dirent.h>
+#include <fcntl.h>
+#include <poll.h>
+#include <signal.h>
+#include <sys/mman.h>
+#include <sys/wait.h>
+#include <time.h>
+#include <unistd.h>
 #endif
 
 using namespace std;
@@ -56,6 +81,67 @@ public:
 		}
 	};
 
+struct Check {					/* verification of one SIGS entry */
+	size_t index;				/* of the signature in SIGS */
+	int resolve;				/* resolve sig against sys.path first */
+	string verified;			/* path sig was already verified at */
+	string pathname;			/* path to check ("" - nothing to check) */
+	int size_ok;				/* 0 if pathname has the wrong size */
+	int hashed;					/* 0 if pathname was unreadable */
+	int deferred;				/* 1 if left to background verification */
+	int batched;				/* 1 if left to hash_batched() */
+	int fd;						/* pathname, opened while resolving (posix),
+								 * or -1 */
+	unsigned char digest[DIGEST_SIZE];	/* digest of pathname */
+	struct STAT st;				/* of pathname, once batched */
+	};
+
+#ifdef HASHED_CONTAINERS
+typedef unordered_set<string> NameSet;
+#else
+typedef set<string> NameSet;
+#endif
+
+struct IndexedDir {				/* a directory, as listed by DirIndex */
+	int fd;						/* kept open for *at() lookups (posix), 
+								 * or -1 */
+	int listed;					/* 0 if it could not be listed, names are
+								 * then looked up with stat() */
+	NameSet names;
+	};
+
+#ifdef HASHED_CONTAINERS
+typedef unordered_map<string, IndexedDir> DirMap;
+#else
+typedef map<string, IndexedDir> DirMap;
+#endif
+
+class DirIndex {				/* directory listings, built lazily */
+
+private:
+	DirMap dirs;
+	Mutex mutex;
+
+	int parent_fd(const string& path, string& name);
+
+public:
+	~DirIndex();
+	const IndexedDir& index(const string& path);
+	void release();
+	};
+
+struct Checks {					/* batch of checks run by the workers */
+	vector<Check> items;
+	vector<string> paths;		/* sys.path, to resolve against */
+	long long deadline;			/* defer checks not started by then (0 -
+								 * never), see run_check() */
+	DirIndex* index;			/* listings to resolve with (NULL - Index) */
+	const NameSet* only;		/* only hash these paths (NULL - all) */
+	int rehash;					/* bypass the verification cache */
+	int batch;					/* leave small files to hash_batched() */
+	Checks() : deadline(0), index(NULL), only(NULL), rehash(0), batch(0) {}
+	};
+
 // Enable debug logging during build by passing extra args, eg:
 // 		python setup.py build_signet --define LOGGING=10
 //
@@ -75,6 +161,102 @@ int Debug = LOGGING;
 int Debug = LOG_WARNING;
 #endif
 
+// Number of threads used to resolve and hash dependencies, 0 sizes the
+// pool from the cpus available to us. Override with SIGNET_THREADS=n
+
+int Threads = 0;
+
+// Files at least this large are memory mapped for hashing, smaller files
+// are cheaper to read()
+
+const long MMAP_MIN = 64 * 1024;
+
+struct HashStats {				/* hashing totals, reported at LOG_INFO */
+	volatile long files;
+	volatile long mapped;		/* files hashed from a memory map */
+	volatile long cached;		/* digests served from the cache */
+	volatile long uring;		/* files read through the io_uring */
+	volatile long long bytes;
+	volatile long long usecs;	/* sum of time spent hashing each file */
+	};
+
+HashStats Stats = {0, 0, 0, 0, 0, 0};
+
+// Digests of unchanged files are reused from a persistent cache when the
+// loader was built with --cache (CACHE_KEY). Disable with SIGNET_CACHE=OFF
+
+const size_t CACHE_ENTRIES = 4096;
+
+int UseCache = 1;
+DigestCache Cache;
+
+DirIndex Index;					/* listings of the dirs we search */
+
+vector<string> SigNames;		/* module names of SIGS, see decode_names() */
+
+// A JSON lines timeline of the loader's startup is written to the path or
+// file descriptor named by SIGNET_TRACE
+
+Tracer Trace;
+
+// A multi-call loader (ENTRY_POINTS) runs the script it was invoked as, see
+// select_entry_point(). Otherwise these are SCRIPT, SCRIPT_DIGEST and
+// SCRIPT_CODE
+
+const char* Script = SCRIPT;
+const unsigned char* ScriptDigest = SCRIPT_DIGEST;
+const Bytecode* ScriptCode = &SCRIPT_CODE;
+vector<char> Required;			/* by SIGS index, Script's dependencies */
+
+int ScriptVerified = 0;			/* Script matched ScriptDigest */
+
+vector<const FrozenModule*> Frozen;	/* by SIGS index, see index_frozen() */
+
+// Checks that don't start within BUDGET ms of validation are deferred to a
+// background thread that runs alongside SCRIPT, except for the CRITICAL
+// modules. Override with SIGNET_BUDGET=ms (OFF verifies everything first)
+
+long long Deadline = 0;			/* monotonic usecs, 0 - never defer */
+vector<char> Critical;			/* by SIGS index, see index_critical() */
+Checks Deferred;				/* checks left to the background thread */
+Thread Background;				/* joined by finish_background() */
+
+// Reported by signet.stats()
+
+string ScriptPath;				/* SCRIPT, next to our executable */
+long long ValidateUsecs = 0;	/* time spent validating */
+long long StartupUsecs = 0;		/* from main() to running SCRIPT */
+
+// A loader started with --SIGNETSERVE=<socket> becomes a fork server: it
+// verifies once, then runs SCRIPT in a forked child for each client loader
+// started with SIGNET_SERVER=<socket>. The files it verified are watched,
+// and verified again when they change
+
+struct Watched {				/* a verified file, watched by the server */
+	size_t index;				/* in SIGS, SIGS.count for SCRIPT */
+	string pathname;
+	struct STAT st;				/* fingerprint when verified */
+	};
+
+string ServePath;				/* --SIGNETSERVE socket, "" - not serving */
+vector<Watched> Watches;
+Mutex WatchLock;				/* guards Watches, see watch() */
+
+// A loader built with --watch (WATCH) keeps watching the files it verified
+// while SCRIPT runs, and a low priority thread verifies each file again
+// when it changes. Override with SIGNET_WATCH=ON|OFF
+
+DirWatcher Watcher;
+Thread Watchdog;				/* stopped through Watcher */
+
+// A loader built with --uring (URING) reads the small files it hashes
+// through an io_uring (linux), URING_BATCH files at a time with up to
+// URING_DEPTH reads in flight, rather than with a blocking read() per file
+// on each worker. Override with SIGNET_URING=ON|OFF
+
+const size_t URING_BATCH = 256;
+const unsigned URING_DEPTH = 64;
+
 
 // ---------------------------------------------------------------------------
 // FUNCTIONS
@@ -109,6 +291,22 @@ void log(int level, const char fmt[], ...) {
 	va_end(args);
 	}
 
+/* return a monotonic timestamp in microseconds */
+
+long long monotonic_usecs() {
+#ifdef _MSC_VER
+	LARGE_INTEGER freq, now;
+	QueryPerformanceFrequency(&freq);
+	QueryPerformanceCounter(&now);
+	return (now.QuadPart / freq.QuadPart) * 1000000 + 
+		(now.QuadPart % freq.QuadPart) * 1000000 / freq.QuadPart;
+#else
+	struct timespec ts;
+	clock_gettime(CLOCK_MONOTONIC, &ts);
+	return (long long)ts.tv_sec * 1000000 + ts.tv_nsec / 1000;
+#endif
+	}
+
 /* return the directory name of path */
 
 string _dirname(const char path[]) {
@@ -159,11 +357,28 @@ int isdir(const char pathname[]) {
 /* return 1 if *str* ends with the string *end* (str.endswith()) */
 
 int endswith(const string& str, const string& end) {
-    if (end.size() > end.size())
+    if (end.size() > str.size())
         return false;
     return equal(end.rbegin(), end.rend(), str.rbegin());
     }
 
+/* return the canonical form of *path* (symlinks resolved, no trailing
+ * separator), or *path* itself if it cannot be resolved */
+
+string normpath(const string& path) {
+#ifdef _MSC_VER
+	char* full = _fullpath(NULL, path.c_str(), 0);
+#else
+	char* full = realpath(path.c_str(), NULL);
+#endif
+	string norm = full ? full : path;
+	free(full);
+
+	while (norm.size() > 1 && endswith(norm, SEP))
+		norm.erase(norm.size()-1);
+	return norm;
+	}
+
 /* return the list of strings in *str* seperated by *delim* (str.split()) */
 
 vector<string> split(const string str, const char delim) {
@@ -205,7 +420,7 @@ vector<string> listdir(const string& path) {
         return files;
         }
     struct dirent* dent;
-    while((dirent = readdir(dirp)) != NULL) {
+    while((dent = readdir(dirp)) != NULL) {
         files.push_back(dent->d_name);
         }
     closedir(dirp);
@@ -213,294 +428,1868 @@ vector<string> listdir(const string& path) {
     return files;
     }
 
-/* Calculate sha1 file hash, return hexdigest as ascii string (lowercase) */
+/* if the directory holding *path* is indexed (and open), return its fd and
+ * store the last component of *path* in *name*. Otherwise returns -1 */
 
-char* sha1hexdigest(const char fname[]) {
+int DirIndex::parent_fd(const string& path, string& name) {
 
-	Sha1Context ctx;
-	Sha1Initialise(&ctx);
+	size_t slash = path.find_last_of(SEP);
+	if (slash == string::npos || slash == 0 || slash + 1 == path.size())
+		return -1;
 
-	FILE* fin = fopen(fname, "rb");
-	if (fin == NULL) {
-		log(LOG_ERROR, "sha1hexdigest() unable to open %s:%s\n", 
-				fname, strerror(errno));
-		return NULL;
-		}
+	mutex.lock();
+	DirMap::const_iterator hit = dirs.find(path.substr(0, slash));
+	int fd = (hit != dirs.end()) ? hit->second.fd : -1;
+	mutex.unlock();
 
-	char buf[64 * 1024];
-	size_t rdsz;
+	name = path.substr(slash + 1);
+	return fd;
+	}
 
-	while((rdsz=fread(buf, 1, sizeof(buf), fin)) > 0) {
-		Sha1Update(&ctx, buf, rdsz);
+/* close the directories kept open for lookups, and forget the listings
+ * (the next lookup lists them again). Nothing may be resolved against the
+ * index meanwhile */
+
+void DirIndex::release() {
+
+	mutex.lock();
+#ifndef _MSC_VER
+	for(DirMap::iterator it = dirs.begin(); it != dirs.end(); it++) {
+		if (it->second.fd >= 0)
+			close(it->second.fd);
 		}
+#endif
+	dirs.clear();
+	mutex.unlock();
+	}
 
-	fclose(fin);
+DirIndex::~DirIndex() {
+	release();
+	}
+
+/* a directory that could not be listed (not remembered by DirIndex) */
 
-	SHA1_HASH digest;
-	Sha1Finalise(&ctx, &digest);
+const IndexedDir Unlisted = {-1, 0, NameSet()};
 
-	static char hexdigest[40+1];
-	char* hp = hexdigest;
+/* return directory *path* (no names if it isn't a directory). Each
+ * directory is listed once per process, the listing is then shared by
+ * every lookup (and every worker thread). On posix the directory is kept
+ * open, and a package directory is opened relative to its (indexed)
+ * parent, so the kernel never walks the full path of what we look up.
+ * A directory that can't be listed (eg. we ran out of descriptors) is
+ * returned unlisted, and tried again by the next lookup */
 
-	unsigned char* dp = digest.bytes;
-	unsigned char* ep = dp + sizeof(digest);
+const IndexedDir& DirIndex::index(const string& path) {
 
-	while(dp < ep) {
-		hp += sprintf(hp, "%02x", *dp++);
+	mutex.lock();
+	DirMap::const_iterator hit = dirs.find(path);
+	if (hit != dirs.end()) {
+		mutex.unlock();
+		return hit->second;
 		}
-	return hexdigest;
-	}
+	mutex.unlock();
 
-/* compare two sha1 hexdigests for equality, return 1 if equal */
+	/* list outside the lock, if another thread beat us to it, keep theirs */
 
-int sha1equal(const char* h1, const char* h2) {
-	for(const char* ep = h1 + 40; h1 < ep; h1++, h2++) {
-		if (tolower(*h1) != tolower(*h2))
-			return 0;
+	IndexedDir dir;
+	dir.fd = -1;
+	dir.listed = 1;
+#ifdef _MSC_VER
+	if (isdir(path.c_str())) {
+		vector<string> files = listdir(path);
+		dir.names.insert(files.begin(), files.end());
 		}
-	return 1;
-	}
+#else
+	string name;
+	int parent = parent_fd(path, name);
+	if (parent >= 0)
+		dir.fd = openat(parent, name.c_str(), 
+				O_RDONLY | O_DIRECTORY | O_CLOEXEC);
+	else
+		dir.fd = open(path.c_str(), O_RDONLY | O_DIRECTORY | O_CLOEXEC);
+
+	int fd = (dir.fd >= 0) ? dup(dir.fd) : -1;
+	DIR* dirp = (fd >= 0) ? fdopendir(fd) : NULL;
+	if (dirp == NULL && fd >= 0)
+		close(fd);
+
+	/* without a descriptor to spare, list it by path */
+
+	if (dirp == NULL)
+		dirp = opendir(path.c_str());
+	if (dirp) {
+		struct dirent* dent;
+		while((dent = readdir(dirp)) != NULL) {
+			dir.names.insert(dent->d_name);
+			}
+		closedir(dirp);
+		}
+	else if (errno != ENOENT && errno != ENOTDIR) {
+		log(LOG_DEBUG, "unable to list %s: %s\n", path.c_str(), 
+				strerror(errno));
+		if (dir.fd >= 0)
+			close(dir.fd);
+		return Unlisted;
+		}
+#endif
 
-/* Search *paths* for a sub-directory *modname* or a file *fname*, and return
- * the match in *found_path*. Returns 1 if matched, 0 otherwise.  *found_path*
- * will be the fully qualified path of the match */
+	mutex.lock();
+	pair<DirMap::iterator, bool> added = dirs.insert(make_pair(path, dir));
+	mutex.unlock();
 
-int find_module(const string& modname, const string& fname, 
-        const vector<string>& paths, string& found_path) {
+#ifndef _MSC_VER
+	if (!added.second && dir.fd >= 0)
+		close(dir.fd);
+#endif
 
-	for(vector<string>::const_iterator it = paths.begin();
-			it != paths.end(); it++) {
-        if (!isdir((*it).c_str())) {
-            continue;
-            }
-        vector<string> files = listdir(*it);
+	return added.first->second;
+	}
 
-        if (find(files.begin(), files.end(), modname) != files.end()) {
-            found_path = *it;
-            found_path += SEP;
-            found_path += modname;
-            return 1;
-            }
-        else if (find(files.begin(), files.end(), fname) != files.end()) {
-            found_path = *it;
-            found_path += SEP;
-            found_path += fname;
-            return 1;
-            }
-        }
-    return 0;
-    }
+/* if *name* in directory *dir* (its full path is *pathname*) is a regular
+ * file, return 1 and (on posix) store it, opened, in *fd* (the caller
+ * closes it). Otherwise returns 0 */
 
-int find_module_path(const string& modname, const string& filename, 
-        const vector<string>& paths, string& pathname) {
+int open_regular(const IndexedDir& dir, const string& name, 
+		const string& pathname, int* fd) {
 
-    vector<string> localpaths = paths;
-    vector<string> modparts = split(modname, '.');
-	for(vector<string>::iterator it = modparts.begin();
-			it != modparts.end(); it++) {
-        string found_path;
-        if (!find_module(*it, filename, localpaths, found_path))
-            return 0;
-        if (isfile(found_path.c_str()))
-            return 1;
-        // we've found a subdir matching our modpart
-        localpaths.clear();
-        localpaths.push_back(found_path);
-        }
-    return 0;
-    }
+	*fd = -1;
+#ifdef _MSC_VER
+	return isfile(pathname.c_str());
+#else
+	int file = (dir.fd >= 0) ?
+		openat(dir.fd, name.c_str(), O_RDONLY | O_CLOEXEC | O_NONBLOCK) :
+		open(pathname.c_str(), O_RDONLY | O_CLOEXEC | O_NONBLOCK);
+	struct stat st;
+
+	/* a file we can't open now (eg. out of descriptors) is still found,
+	 * it's opened again by path when hashed */
+
+	if (file < 0)
+		return (errno != ENOENT && errno != ENOTDIR && errno != ELOOP &&
+				stat(pathname.c_str(), &st) == 0 && S_ISREG(st.st_mode));
+	if (fstat(file, &st) != 0 || !S_ISREG(st.st_mode)) {
+		close(file);
+		return 0;
+		}
+	*fd = file;
+	return 1;
+#endif
+	}
 
-/* perform validation (the heart of this code) */
+/* store *digest* as ascii string (lowercase) in *hex* (2*DIGEST_SIZE+1
+ * chars), returns hex. Digests are only formatted for logs & the cache */
 
-int validate(const string script_path) {
+char* hexlify(const unsigned char digest[], char hex[]) {
 
-    /* store sys.paths in vector of strings */
+	static const char digits[] = "0123456789abcdef";
+	for(size_t i = 0; i < DIGEST_SIZE; i++) {
+		hex[2*i] = digits[digest[i] >> 4];
+		hex[2*i+1] = digits[digest[i] & 0xf];
+		}
+	hex[2*DIGEST_SIZE] = '\0';
+	return hex;
+	}
 
-	PyPtr sys_mod( PyImport_ImportModule("sys") );
-	if (sys_mod.get() == NULL) {
-		python_err("error importing sys");
-		return -1;
+/* parse hex string *hex* into *digest*, return 0 or -1 if malformed */
+
+int unhexlify(const char* hex, unsigned char digest[]) {
+
+	for(size_t i = 0; i < DIGEST_SIZE; i++) {
+		unsigned int byte;
+		if (!isxdigit(hex[2*i]) || !isxdigit(hex[2*i+1]) ||
+				sscanf(hex + 2*i, "%2x", &byte) != 1)
+			return -1;
+		digest[i] = (unsigned char)byte;
 		}
-    PyPtr pypath( PyObject_GetAttrString(sys_mod.get(), "path") );
-    if (pypath.get() == NULL) {
-		python_err("'sys' module has no attribute 'path'");
-        return -1;
-        }
-    vector<string> paths;
-	for(Py_ssize_t i = 0; i < PyList_Size(pypath.get()); i++) {
-		PyObject* py_item = PyList_GetItem(pypath.get(), i);
-        paths.push_back(PyString_AsString(py_item));
-        }
+	return hex[2*DIGEST_SIZE] == '\0' ? 0 : -1;
+	}
 
-	/* iterate signatures, compare them to installed editions */
+/* compare two digests for equality, return 1 if equal */
 
-    const Signature* sp = SIGS;
+inline int digest_equal(const unsigned char* d1, const unsigned char* d2) {
+	return memcmp(d1, d2, DIGEST_SIZE) == 0;
+	}
 
-    for(;sp->modname != NULL; sp++) {
+/* Files larger than TREE_CHUNK bytes (when set) have a tree digest: the
+ * digest of a 0x01 byte followed by the digests of each TREE_CHUNK bytes
+ * of the file (the last chunk may be shorter), each prefixed by a 0x00
+ * byte. Chunks are independent, so they are hashed on the worker pool */
 
-		string pathname;
-		if (find_module_path(sp->modname, sp->filename, paths, pathname))
-			continue;
+inline int tree_hashed(long long size) {
+	return TREE_CHUNK > 0 && size > TREE_CHUNK;
+	}
 
-		log(LOG_INFO, ">>> Found module %s -> %s\n", sp->modname, pathname.c_str());
+struct TreeLeaves {				/* chunks of a file, hashed in parallel */
+	const char* data;
+	long long size;
+	vector<unsigned char> digests;	/* DIGEST_SIZE bytes per chunk */
+	};
 
-		const char* hexdigest = sha1hexdigest(pathname.c_str());
-		if (hexdigest != NULL && !sha1equal(hexdigest, sp->hexdigest)) {
-			log(LOG_ERROR, "SECURITY VIOLATION: '%s' has been tampered with!\n", 
-					pathname.c_str());
-            log(LOG_DEBUG, "expected %s, detected %s\n", 
-                    sp->hexdigest, hexdigest);
-			if (TAMPER >= 2)
-				return -1;
-			}
-		}
+/* parallel_for callback, hash chunk *i* of TreeLeaves *arg* */
 
-    /* check script */
+void hash_leaf(size_t i, void* arg) {
 
-    const char* script_digest = sha1hexdigest(script_path.c_str());
-    if (script_digest != NULL && !sha1equal(script_digest, SCRIPT_HEXDIGEST)) {
-        log(LOG_ERROR, "SECURITY VIOLATION: '%s' has been tampered with!\n", 
-                script_path.c_str());
-        log(LOG_DEBUG, "expected %s, detected %s\n", 
-                SCRIPT_HEXDIGEST, script_digest);
-        if (TAMPER >= 2)
-            return -1;
-        }
+	TreeLeaves& leaves = *(TreeLeaves*)arg;
+	long long offset = (long long)i * TREE_CHUNK;
+	long long size = min(TREE_CHUNK, leaves.size - offset);
 
-	return 0;
+	DigestContext ctx;
+	digest_init(&ctx, DIGEST_ALGORITHM);
+	digest_update(&ctx, "\0", 1);
+	digest_update(&ctx, leaves.data + offset, size);
+	digest_final(&ctx, &leaves.digests[i * DIGEST_SIZE]);
 	}
 
-/* search for our opts, pass ALL python */
+/* store the digest of the *size* bytes at *data* in *digest*, a tree
+ * digest if tree_hashed(size) */
 
-int parse_options(int argc, char* argv[], const char* script) {
+void content_digest(const char* data, long long size, unsigned char digest[]) {
 
-	char** args = new char*[argc];
-	int args_used = 1;
+	DigestContext ctx;
+	digest_init(&ctx, DIGEST_ALGORITHM);
+	if (!tree_hashed(size)) {
+		digest_update(&ctx, data, size);
+		digest_final(&ctx, digest);
+		return;
+		}
 
-	args[0] = strdup(script);
+	TreeLeaves leaves;
+	leaves.data = data;
+	leaves.size = size;
+	size_t count = (size_t)((size + TREE_CHUNK - 1) / TREE_CHUNK);
+	leaves.digests.resize(count * DIGEST_SIZE);
+	parallel_for(count, worker_count(Threads, count), hash_leaf, &leaves);
 
-	for(int i = 1; i < argc; i++) {
+	digest_update(&ctx, "\1", 1);
+	digest_update(&ctx, &leaves.digests[0], leaves.digests.size());
+	digest_final(&ctx, digest);
+	}
 
-		if (strcmp(argv[i], "--SECURITYOFF") == 0) {
-			TAMPER = 0;
-			log(LOG_WARNING, "SECURITY DISABLED\n");
-			}
+class StreamDigest {			/* content_digest() of a file read in parts */
 
-		else if (strcmp(argv[i], "--SECURITYWARN") == 0) {
-			TAMPER = 1;
-			log(LOG_WARNING, "SECURITY DISABLED\n");
-			}
+private:
+	DigestContext ctx;			/* the digest, or the root of the tree */
+	DigestContext leaf;			/* the chunk being read */
+	long long chunk;			/* TREE_CHUNK, 0 if not tree hashed */
+	long long used;				/* bytes in leaf */
+
+	void finish_leaf() {
+		unsigned char digest[DIGEST_SIZE];
+		digest_final(&leaf, digest);
+		digest_update(&ctx, digest, DIGEST_SIZE);
+		digest_init(&leaf, DIGEST_ALGORITHM);
+		digest_update(&leaf, "\0", 1);
+		used = 0;
+		}
 
-		else if (strcmp(argv[i], "--SECURITYMAX") == 0) {
-			TAMPER = 3;
-			log(LOG_WARNING, "SECURITY MAXIMUM Enabled\n");
+public:
+	/* start the digest of a *size* byte file */
+	StreamDigest(long long size) : chunk(0), used(0) {
+		digest_init(&ctx, DIGEST_ALGORITHM);
+		if (tree_hashed(size)) {
+			chunk = TREE_CHUNK;
+			digest_update(&ctx, "\1", 1);
+			digest_init(&leaf, DIGEST_ALGORITHM);
+			digest_update(&leaf, "\0", 1);
 			}
+		}
 
-		else if (strncmp(argv[i], "--SECURITY", 10) == 0) {
-			log(LOG_WARNING, "error: invalid setting, "
-					"valid choices are SECURITY(OFF|WARN|MAX)\n");
-			return -1;
+	void update(const char* data, long long size) {
+		if (!chunk) {
+			digest_update(&ctx, data, size);
+			return;
+			}
+		while (size > 0) {
+			long long part = min(chunk - used, size);
+			digest_update(&leaf, data, part);
+			used += part;
+			data += part;
+			size -= part;
+			if (used == chunk)
+				finish_leaf();
 			}
-
-		args[args_used++] = strdup(argv[i]);
 		}
 
-    /* search environment for security override */
+	void final(unsigned char digest[]) {
+		if (chunk && used)
+			finish_leaf();
+		digest_final(&ctx, digest);
+		}
+	};
 
-	const char* senv = getenv("SIGNETSECURITY");
-    if (senv) {
-        if (strcmp(senv, "OFF") == 0) {
-            TAMPER = 0;
-            }
-        else if (strcmp(senv, "WARN") == 0) {
-            TAMPER = 1;
-            }
-        else if (strcmp(senv, "MAX") == 0) {
-            TAMPER = 3;
-            }
-        else{
-            log(LOG_WARNING, "unrecognized environment SIGNETSECURITY=%s\n",
-                    senv);
-            }
-        }
+/* Calculate the DIGEST_ALGORITHM hash of a file (a tree digest if larger
+ * than TREE_CHUNK, see content_digest), store the raw digest in *digest*.
+ * Returns digest, or NULL on error. On posix, files of MMAP_MIN bytes or
+ * more are hashed straight from a memory map, and if *stp* is given, it
+ * receives the stat of the file hashed. If *file* is an open fd of
+ * *fname*, it is hashed (and left open) instead of opening *fname* again */
 
-    /* search environment for logging request */
+unsigned char* hash_file(const char fname[], unsigned char digest[], 
+		struct STAT* stp = NULL, int file = -1) {
 
-    const char* lenv = getenv("SIGNET_LOGLEVEL");
-    if (lenv) {
-        int level = atoi(lenv);
-        if (level < LOG_DEBUG || level > LOG_CRITICAL) {
-            log(LOG_WARNING, 
-                    "invalid environment setting SIGNET_LOGLEVEL=%s", lenv);
-            }
-        else{
-            Debug = level;
-            log(LOG_DEBUG, "SIGNET_LOGLEVEL set to %d\n", level);
-            }
-        }
+	long long start = monotonic_usecs();
+	long long size = 0;
+	int mapped = 0;
 
-	PySys_SetArgv(args_used, args);
+#ifdef _MSC_VER
+	FILE* fin = fopen(fname, "rb");
+	if (fin == NULL) {
+		log(LOG_ERROR, "hash_file() unable to open %s:%s\n", 
+				fname, strerror(errno));
+		return NULL;
+		}
 
-	return 0;
-	}
+	StreamDigest ctx(_filelengthi64(_fileno(fin)));
+	char buf[64 * 1024];
+	size_t rdsz;
 
-/* optionally initialize virtualenv */
+	while((rdsz=fread(buf, 1, sizeof(buf), fin)) > 0) {
+		ctx.update(buf, rdsz);
+		size += rdsz;
+		}
 
-void initialize_virtualenv() {
+	fclose(fin);
+	ctx.final(digest);
+#else
+	int fd = (file >= 0) ? file : open(fname, O_RDONLY | O_CLOEXEC);
+	if (fd < 0) {
+		log(LOG_ERROR, "hash_file() unable to open %s:%s\n", 
+				fname, strerror(errno));
+		return NULL;
+		}
 
-	/* is vritualenv active? */
+#ifdef POSIX_FADV_SEQUENTIAL
+	posix_fadvise(fd, 0, 0, POSIX_FADV_SEQUENTIAL);
+#endif
 
-	const char* venv = getenv("VIRTUAL_ENV");
-	if (venv == NULL) {
-		log(LOG_DEBUG, "no VIRTUAL_ENV defined\n");
-		return;
+	struct stat st;
+	if (fstat(fd, &st) != 0) {
+		log(LOG_ERROR, "hash_file() unable to stat %s:%s\n", 
+				fname, strerror(errno));
+		if (fd != file)
+			close(fd);
+		return NULL;
+		}
+	if (stp)
+		*stp = st;
+	PROBE2(hash__start, fname, (long long)st.st_size);
+
+	if (st.st_size >= MMAP_MIN) {
+		void* map = mmap(NULL, st.st_size, PROT_READ, MAP_PRIVATE, fd, 0);
+		if (map != MAP_FAILED) {
+			madvise(map, st.st_size, tree_hashed(st.st_size) ? 
+					MADV_WILLNEED : MADV_SEQUENTIAL);
+			content_digest((const char*)map, st.st_size, digest);
+			munmap(map, st.st_size);
+			size = st.st_size;
+			mapped = 1;
+			}
 		}
 
-	/* look for posix first, then windows */
+	/* small file, or a filesystem that won't map it */
 
-	string pyhome = venv;
-	pyhome += "/bin";
+	if (!mapped) {
+		StreamDigest ctx(st.st_size);
+		char buf[64 * 1024];
+		ssize_t rdsz;
 
-	if (!isdir(pyhome.c_str())) {
-		pyhome = venv;
-		pyhome += "/Scripts";
+		while((rdsz = read(fd, buf, sizeof(buf))) > 0) {
+			ctx.update(buf, rdsz);
+			size += rdsz;
+			}
+		if (rdsz < 0) {
+			log(LOG_ERROR, "hash_file() unable to read %s:%s\n", 
+					fname, strerror(errno));
+			if (fd != file)
+				close(fd);
+			return NULL;
+			}
+		ctx.final(digest);
 		}
 
-	if (!isdir(pyhome.c_str())) {
-		log(LOG_WARNING, "VIRTUAL_ENV defined, but missing target %s\n", venv);
-		return;
+	if (fd != file)
+		close(fd);
+#endif
+
+	PROBE2(hash__end, fname, size);
+
+	long long end = monotonic_usecs();
+	atomic_add(&Stats.files, 1);
+	atomic_add(&Stats.mapped, (long)mapped);
+	atomic_add(&Stats.bytes, size);
+	atomic_add(&Stats.usecs, end - start);
+
+	if (Trace.enabled()) {
+		char fields[64];
+		sprintf(fields, "\"bytes\": %lld, \"mapped\": %d", size, mapped);
+		Trace.event("hash", start, end, "\"path\": " + json_string(fname) + 
+				", " + fields);
 		}
 
-	Py_SetPythonHome((char*)venv);
+	return digest;
 	}
 
-int run_validation(int argc, char* argv[], const char* script) {
+/* store the digest of the *size* bytes at *data*, read from
+ * *pathname*, in *digest*, returns digest */
 
-	/* initialize python */
+unsigned char* data_digest(const char* pathname, const char* data, 
+		size_t size, unsigned char digest[]) {
 
-	Py_SetProgramName((char*)script);
-	initialize_virtualenv();
-	Py_Initialize();
+	long long start = monotonic_usecs();
 
-	/* parse command line */
+	PROBE2(hash__start, pathname, (long long)size);
+	content_digest(data, (long long)size, digest);
+	PROBE2(hash__end, pathname, (long long)size);
+
+	long long end = monotonic_usecs();
+	atomic_add(&Stats.files, 1);
+	atomic_add(&Stats.bytes, (long long)size);
+	atomic_add(&Stats.usecs, end - start);
+
+	if (Trace.enabled()) {
+		char fields[32];
+		sprintf(fields, "\"bytes\": %lld", (long long)size);
+		Trace.event("hash", start, end, "\"path\": " + 
+				json_string(pathname) + ", " + fields);
+		}
+
+	return digest;
+	}
+
+/* read all of *pathname* into *data*. Returns 0, or -1 on error */
+
+int read_file(const char* pathname, string& data) {
+
+	FILE* fin = fopen(pathname, "rb");
+	if (fin == NULL)
+		return -1;
+
+	char buf[64 * 1024];
+	size_t rdsz;
+	while((rdsz = fread(buf, 1, sizeof(buf), fin)) > 0) {
+		data.append(buf, rdsz);
+		}
+
+	int rc = ferror(fin) ? -1 : 0;
+	fclose(fin);
+	return rc;
+	}
+
+#ifndef _MSC_VER
+
+/* store the cached digest of *pathname*, if it's stat fingerprint *st* has
+ * not changed, in *digest*. Returns digest, or NULL if not cached */
+
+unsigned char* cached_digest(const char* pathname, const struct stat& st, 
+		unsigned char digest[]) {
+
+	if (!Cache.enabled())
+		return NULL;
+
+	long long start = monotonic_usecs();
+	char hex[2*DIGEST_MAX_SIZE+1];
+	if (!Cache.lookup(st, pathname, hex) || unhexlify(hex, digest) != 0)
+		return NULL;
+
+	atomic_add(&Stats.cached, 1);
+	Trace.event("cached", start, monotonic_usecs(), 
+			"\"path\": " + json_string(pathname));
+	return digest;
+	}
+
+/* remember the *digest* of *pathname* with stat fingerprint *st* */
+
+void cache_digest(const char* pathname, const struct stat& st, 
+		const unsigned char digest[]) {
+
+	if (Cache.enabled()) {
+		char hex[2*DIGEST_MAX_SIZE+1];
+		Cache.store(st, pathname, hexlify(digest, hex));
+		}
+	}
+
+#endif
+
+/* store the digest of *pathname* in *digest*, reusing the cached
+ * digest if the file's stat fingerprint has not changed. *fd*, if open, is
+ * *pathname* already opened by the caller. Returns digest, or NULL on
+ * error */
+
+unsigned char* file_digest(const char* pathname, unsigned char digest[], 
+		int fd = -1) {
+
+#ifndef _MSC_VER
+	struct stat st;
+	if (Cache.enabled()) {
+		int rc = (fd >= 0) ? fstat(fd, &st) : stat(pathname, &st);
+		if (rc == 0 && cached_digest(pathname, st, digest))
+			return digest;
+		if (hash_file(pathname, digest, &st, fd) == NULL)
+			return NULL;
+		cache_digest(pathname, st, digest);
+		return digest;
+		}
+#endif
+	return hash_file(pathname, digest, NULL, fd);
+	}
+
+/* close *fd*, if open (posix only) */
+
+void close_file(int& fd) {
+
+#ifndef _MSC_VER
+	if (fd >= 0)
+		close(fd);
+#endif
+	fd = -1;
+	}
+
+/* decode the front coded module names of SIGS into SigNames. Each name is
+ * stored as a byte counting the leading chars it shares with the previous
+ * name, followed by the rest of the name (nul terminated) */
+
+void decode_names() {
+
+	SigNames.resize(SIGS.count);
+	const char* np = SIGS.names;
+	for(size_t i = 0; i < SIGS.count; i++) {
+		size_t shared = (unsigned char)*np++;
+		if (i)
+			SigNames[i].assign(SigNames[i-1], 0, shared);
+		SigNames[i] += np;
+		np += strlen(np) + 1;
+		}
+	}
+
+/* index the FROZEN modules by their signature, if they were compiled by
+ * the python we run. Returns the number of usable frozen modules */
+
+size_t index_frozen() {
+
+	Frozen.assign(SIGS.count, (const FrozenModule*)NULL);
+	if (FROZEN.count == 0)
+		return 0;
+
+	if (FROZEN.magic != PyImport_GetMagicNumber()) {
+		log(LOG_WARNING, "frozen modules were compiled for another python, "
+				"ignored\n");
+		return 0;
+		}
+
+	for(size_t i = 0; i < FROZEN.count; i++) {
+		if (FROZEN.modules[i].sig < SIGS.count)
+			Frozen[FROZEN.modules[i].sig] = FROZEN.modules + i;
+		}
+	return FROZEN.count;
+	}
+
+/* flag the SIGS entries of the CRITICAL modules and their submodules */
+
+void index_critical() {
+
+	Critical.assign(SIGS.count, 0);
+	for(const char* const* cp = CRITICAL; *cp != NULL; cp++) {
+		string prefix = string(*cp) + ".";
+		for(size_t i = 0; i < SIGS.count; i++) {
+			if (SigNames[i] == *cp || 
+					SigNames[i].compare(0, prefix.size(), prefix) == 0)
+				Critical[i] = 1;
+			}
+		}
+	}
+
+/* return the entry point of a multi-call loader invoked as *argv0*, or
+ * NULL */
+
+const EntryPoint* find_entry_point(const char* argv0) {
+
+	string name = _basename(argv0);
+#ifdef _MSC_VER
+	if (name.size() > 4 && 
+			_stricmp(name.c_str() + name.size() - 4, ".exe") == 0)
+		name.erase(name.size() - 4);
+#endif
+	for(size_t i = 0; i < ENTRY_POINTS.count; i++) {
+		if (name == ENTRY_POINTS.entries[i].name)
+			return ENTRY_POINTS.entries + i;
+		}
+	return NULL;
+	}
+
+/* choose the script to run. A multi-call loader runs the entry point named
+ * by the link it was invoked through, or, invoked under its own name, the
+ * one named by the first argument (which is then dropped, busybox style).
+ * Marks the script's dependencies in Required. Returns -1 if no entry point
+ * matches */
+
+int select_entry_point(int& argc, char**& argv) {
+
+	Required.assign(SIGS.count, ENTRY_POINTS.count ? 0 : 1);
+	if (ENTRY_POINTS.count == 0)
+		return 0;
+
+	const EntryPoint* ep = find_entry_point(argv[0]);
+	if (ep == NULL && argc > 1 && (ep = find_entry_point(argv[1])) != NULL) {
+		argc--;
+		argv++;
+		}
+	if (ep == NULL) {
+		log(LOG_ERROR, "%s: unknown entry point, run as one of:\n", argv[0]);
+		for(size_t i = 0; i < ENTRY_POINTS.count; i++) {
+			log(LOG_ERROR, "\t%s\n", ENTRY_POINTS.entries[i].name);
+			}
+		return -1;
+		}
+
+	Script = ep->script;
+	ScriptDigest = ep->digest;
+	ScriptCode = ep->code;
+	for(const int* ip = ep->sigs; *ip >= 0; ip++) {
+		Required[*ip] = 1;
+		}
+	return 0;
+	}
+
+/* return the index of the signature of module *modname* in SIGS (sorted by
+ * module name), or -1 */
+
+long find_signature(const string& modname) {
+
+	vector<string>::const_iterator it = lower_bound(SigNames.begin(),
+			SigNames.end(), modname);
+	if (it == SigNames.end() || *it != modname)
+		return -1;
+	return (long)(it - SigNames.begin());
+	}
+
+/* return 1 if directory *dir* (it's full path is *path*) has an entry
+ * *name*. A directory that could not be listed is asked with stat() */
+
+int has_entry(const IndexedDir& dir, const string& path, const string& name) {
+
+	if (dir.listed)
+		return dir.names.count(name) != 0;
+	struct STAT st;
+	return STAT((path + SEP + name).c_str(), &st) == 0;
+	}
+
+/* Search *paths* (listed by *index*) for a sub-directory *modname* or a
+ * file *fname*, and return the match in *found_path* (fully qualified) and
+ * *name*. Returns the directory it was found in, or NULL */
+
+const IndexedDir* find_module(const string& modname, const string& fname, 
+        const vector<string>& paths, DirIndex& index, string& found_path, 
+        string& name) {
+
+	for(vector<string>::const_iterator it = paths.begin();
+			it != paths.end(); it++) {
+        const IndexedDir& dir = index.index(*it);
+
+        if (has_entry(dir, *it, modname))
+            name = modname;
+        else if (has_entry(dir, *it, fname))
+            name = fname;
+        else
+            continue;
+
+        found_path = *it;
+        found_path += SEP;
+        found_path += name;
+        return &dir;
+        }
+    return NULL;
+    }
+
+/* Search *paths* for module *modname* (dotted), whose file is named
+ * *filename*. Returns 1 if found, 0 otherwise. *pathname* will be the
+ * fully qualified path of the match. If *fd* is given, the file is
+ * returned open in it (posix, -1 otherwise), for the caller to hash and
+ * close. Directories are listed by *index* */
+
+int find_module_path(const string& modname, const string& filename, 
+        const vector<string>& paths, string& pathname, int* fd = NULL,
+        DirIndex& index = Index) {
+
+    vector<string> localpaths = paths;
+    vector<string> modparts = split(modname, '.');
+	for(vector<string>::iterator it = modparts.begin();
+			it != modparts.end(); it++) {
+        string found_path, name;
+        const IndexedDir* dir = find_module(*it, filename, localpaths, 
+                index, found_path, name);
+        if (dir == NULL)
+            return 0;
+        int file;
+        if (open_regular(*dir, name, found_path, &file)) {
+            pathname = found_path;
+            if (fd)
+                *fd = file;
+#ifndef _MSC_VER
+            else if (file >= 0)
+                close(file);
+#endif
+            return 1;
+            }
+        // we've found a subdir matching our modpart
+        localpaths.clear();
+        localpaths.push_back(found_path);
+        }
+    return 0;
+    }
+
+/* when serving or watching, remember *pathname* was verified as
+ * SIGS[index] (SCRIPT if index is SIGS.count), so changes to it are
+ * noticed. Called from any thread */
+
+void watch(size_t index, const string& pathname) {
+
+	Watched w;
+	if ((ServePath.empty() && !WATCH) || 
+			STAT(pathname.c_str(), &w.st) != 0)
+		return;
+	w.index = index;
+	w.pathname = normpath(pathname);		/* SCRIPT may chdir() */
+
+	WatchLock.lock();
+	Watches.push_back(w);
+	if (Watcher.enabled())
+		Watcher.add(w.pathname.substr(0, w.pathname.find_last_of(SEP)));
+	WatchLock.unlock();
+	}
+
+/* compare the digest of SCRIPT's *source*, read from *pathname*, with the
+ * embedded ScriptDigest. Returns -1 if tampering was detected, otherwise 0 */
+
+int check_script(const string& pathname, const string& source) {
+
+	unsigned char digest[DIGEST_SIZE];
+	data_digest(pathname.c_str(), source.data(), source.size(), digest);
+	ScriptVerified = digest_equal(digest, ScriptDigest);
+	if (ScriptVerified)
+		watch(SIGS.count, pathname);
+	else{
+		char hex1[2*DIGEST_SIZE+1], hex2[2*DIGEST_SIZE+1];
+		PROBE1(tamper, pathname.c_str());
+		log(LOG_ERROR, "SECURITY VIOLATION: '%s' has been tampered with!\n", 
+				pathname.c_str());
+		log(LOG_DEBUG, "expected %s, detected %s\n", 
+				hexlify(ScriptDigest, hex1), hexlify(digest, hex2));
+		return -1;
+		}
+	return 0;
+	}
+
+/* leave *ck* to hash_batched() if it's a file smaller than MMAP_MIN, and
+ * it's digest is not cached (or *rehash*). It keeps it's fd open until
+ * then. Returns 1 if *ck* was batched, or served from the cache */
+
+int batch_check(Check& ck, int rehash) {
+
+#ifndef _MSC_VER
+	if (ck.fd < 0 || fstat(ck.fd, &ck.st) != 0 || ck.st.st_size >= MMAP_MIN)
+		return 0;
+	if (!rehash && cached_digest(ck.pathname.c_str(), ck.st, ck.digest)) {
+		ck.hashed = 1;
+		close_file(ck.fd);
+		return 1;
+		}
+	ck.batched = 1;
+	return 1;
+#else
+	return 0;
+#endif
+	}
+
+/* worker: resolve (if requested) and hash a single check. Once the batch's
+ * deadline passed, only CRITICAL checks are run, the rest are deferred */
+
+void run_check(size_t i, void* arg) {
+
+	Checks* checks = (Checks*)arg;
+	Check& ck = checks->items[i];
+
+	if (checks->deadline && !Critical[ck.index] && 
+			monotonic_usecs() >= checks->deadline) {
+		ck.deferred = 1;
+		return;
+		}
+
+	if (ck.resolve) {
+		long long start = monotonic_usecs();
+		const char* filename = SIGS.strings + SIGS.sigs[ck.index].filename;
+		PROBE1(resolve__start, SigNames[ck.index].c_str());
+		int found = find_module_path(SigNames[ck.index], filename, 
+				checks->paths, ck.pathname, &ck.fd, 
+				checks->index ? *checks->index : Index);
+		PROBE2(resolve__end, SigNames[ck.index].c_str(), 
+				found ? ck.pathname.c_str() : NULL);
+		if (Trace.enabled())
+			Trace.event("resolve", start, monotonic_usecs(), "\"module\": " + 
+					json_string(SigNames[ck.index]) + ", \"path\": " + 
+					(found ? json_string(ck.pathname) : "null"));
+		if (!found || ck.pathname == ck.verified || (checks->only && 
+					!checks->only->count(normpath(ck.pathname)))) {
+			ck.pathname = "";
+			close_file(ck.fd);
+			}
+		}
+
+	/* hash the file we resolved (or located) through the fd we opened */
+
+	if (!ck.pathname.empty() && ck.size_ok) {
+		if (checks->batch && batch_check(ck, checks->rehash))
+			return;
+		if (checks->rehash)
+			ck.hashed = (hash_file(ck.pathname.c_str(), ck.digest, NULL,
+						ck.fd) != NULL);
+		else
+			ck.hashed = (file_digest(ck.pathname.c_str(), ck.digest, 
+						ck.fd) != NULL);
+		}
+	close_file(ck.fd);
+	}
+
+struct Batch {					/* batched checks, read by hash_batched() */
+	Checks* checks;
+	vector<size_t> items;		/* in checks->items */
+	vector<FileRead> files;		/* their contents */
+	};
+
+/* worker: hash batched check *i* from the contents read, or (if they could
+ * not be read) from it's fd */
+
+void hash_read(size_t i, void* arg) {
+
+	Batch& batch = *(Batch*)arg;
+	Check& ck = batch.checks->items[batch.items[i]];
+	const FileRead& file = batch.files[i];
+
+	if (file.error == 0) {
+		data_digest(ck.pathname.c_str(), file.data.data(), file.data.size(),
+				ck.digest);
+		atomic_add(&Stats.uring, 1);
+		ck.hashed = 1;
+		}
+	else{
+		ck.hashed = (hash_file(ck.pathname.c_str(), ck.digest, &ck.st, 
+					ck.fd) != NULL);
+		}
+#ifndef _MSC_VER
+	if (ck.hashed && !batch.checks->rehash)
+		cache_digest(ck.pathname.c_str(), ck.st, ck.digest);
+#endif
+	close_file(ck.fd);
+	}
+
+/* hash the checks run_check() batched, on *threads* workers. They are read
+ * URING_BATCH files at a time through an io_uring, or where that is not
+ * available, hashed as run_check() would have */
+
+void hash_batched(Checks& checks, int threads) {
+
+	vector<size_t> items;
+	for(size_t i = 0; i < checks.items.size(); i++) {
+		if (checks.items[i].batched)
+			items.push_back(i);
+		}
+
+	Batch batch;
+	batch.checks = &checks;
+	int uring = 1;
+
+	for(size_t first = 0; first < items.size(); first += URING_BATCH) {
+
+		size_t count = min(URING_BATCH, items.size() - first);
+		batch.items.assign(items.begin() + first, 
+				items.begin() + first + count);
+		batch.files.assign(count, FileRead());
+		for(size_t i = 0; i < count; i++) {
+			const Check& ck = checks.items[batch.items[i]];
+			batch.files[i].pathname = ck.pathname;
+			batch.files[i].fd = ck.fd;
+			batch.files[i].size = (long long)ck.st.st_size;
+			batch.files[i].error = ENOSYS;
+			}
+
+		if (uring) {
+			long long start = monotonic_usecs();
+			uring = (read_files(batch.files, URING_DEPTH) == 0);
+			if (!uring)
+				log(LOG_DEBUG, "io_uring not available, reading files\n");
+			else if (Trace.enabled()) {
+				char fields[32];
+				sprintf(fields, "\"files\": %lu", (unsigned long)count);
+				Trace.event("read", start, monotonic_usecs(), fields);
+				}
+			}
+
+		parallel_for(count, worker_count(threads, count), hash_read, &batch);
+		}
+	}
+
+/* run *checks* on the worker pool, then report their outcome in SIGS
+ * order. Checks deferred by the deadline are moved to Deferred. Returns -1 if
+ * tampering was detected and TAMPER >= 2 */
+
+int run_checks(Checks& checks) {
+
+	checks.batch = URING;
+	parallel_for(checks.items.size(), 
+			worker_count(Threads, checks.items.size()), run_check, &checks);
+	if (checks.batch)
+		hash_batched(checks, Threads);
+
+	for(vector<Check>::const_iterator it = checks.items.begin(); 
+			it != checks.items.end(); it++) {
+
+		if (it->deferred) {
+			Deferred.items.push_back(*it);
+			Deferred.items.back().deferred = 0;
+			continue;
+			}
+
+		if (it->pathname.empty())
+			continue;
+
+		const Signature& sig = SIGS.sigs[it->index];
+
+		log(LOG_INFO, ">>> Found module %s -> %s\n", 
+				SigNames[it->index].c_str(), it->pathname.c_str());
+
+		if (it->size_ok && (!it->hashed || 
+					digest_equal(it->digest, sig.digest))) {
+			if (it->hashed)
+				watch(it->index, it->pathname);
+			continue;
+			}
+
+		PROBE1(tamper, it->pathname.c_str());
+		log(LOG_ERROR, "SECURITY VIOLATION: '%s' has been tampered with!\n", 
+				it->pathname.c_str());
+		if (!it->size_ok) {
+			log(LOG_DEBUG, "expected %ld bytes\n", sig.size);
+			}
+		else{
+			char hex1[2*DIGEST_SIZE+1], hex2[2*DIGEST_SIZE+1];
+			log(LOG_DEBUG, "expected %s, detected %s\n", 
+					hexlify(sig.digest, hex1), hexlify(it->digest, hex2));
+			}
+
+		if (TAMPER >= 2)
+			return -1;
+		}
+	return 0;
+	}
+
+/* return the embedded search ROOTS, fully qualified. The empty root stands
+ * for the directory holding SCRIPT (*script_dir*) */
+
+vector<string> embedded_roots(const string& script_dir) {
+
+	vector<string> roots;
+	for(const char* const* rp = ROOTS; *rp != NULL; rp++) {
+		roots.push_back(**rp ? normpath(*rp) : normpath(script_dir));
+		}
+	return roots;
+	}
+
+/* return the index of the first of *roots* that provides the top-level
+ * module *top* (as a package dir or a module file), or -1. Results are
+ * remembered in *cache* */
+
+int first_root(const string& top, const vector<string>& roots, 
+		map<string, int>& cache) {
+
+	map<string, int>::iterator hit = cache.find(top);
+	if (hit != cache.end())
+		return hit->second;
+
+	static const char* exts[] = {
+#ifdef _MSC_VER
+		".py", ".pyc", ".pyo", ".pyd", NULL
+#else
+		".py", ".pyc", ".pyo", ".so", "module.so", NULL
+#endif
+		};
+
+	int found = -1;
+	for(size_t i = 0; found < 0 && i < roots.size(); i++) {
+		const IndexedDir& dir = Index.index(roots[i]);
+		if (has_entry(dir, roots[i], top)) {
+			found = (int)i;
+			break;
+			}
+		for(const char** ep = exts; *ep != NULL; ep++) {
+			if (has_entry(dir, roots[i], top + *ep)) {
+				found = (int)i;
+				break;
+				}
+			}
+		}
+	cache[top] = found;
+	return found;
+	}
+
+/* pre-interpreter validation. Check SCRIPT (its *source* as read from
+ * *script_path*) and every signature that has an embedded location (see
+ * build_signet --prevalidate) without python. On return, verified[i] holds
+ * the path SIGS[i] was verified at, or "" if it must be resolved against
+ * the interpreter's sys.path by validate() */
+
+int prevalidate(const string& script_path, const string& source, 
+		const vector<string>& roots, vector<string>& verified) {
+
+	/* check script */
+
+	if (check_script(script_path, source) && TAMPER >= 2)
+		return -1;
+
+	/* locate signatures at their embedded location */
+
+	Checks checks;
+	checks.deadline = Deadline;
+	map<string, int> tops;
+
+	for(size_t i = 0; i < SIGS.count; i++) {
+
+		const Signature* sp = SIGS.sigs + i;
+		verified.push_back("");
+
+		if (!Required[i] || LAZY || Frozen[i] || sp->root < 0 || 
+				sp->root >= (int)roots.size())
+			continue;
+
+		/* a module earlier in the search path would shadow this one */
+
+		string top = split(SigNames[i], '.')[0];
+		if (first_root(top, roots, tops) != sp->root) {
+			log(LOG_DEBUG, "embedded path for %s is shadowed\n", 
+					SigNames[i].c_str());
+			continue;
+			}
+
+		const char* relpath = SIGS.strings + sp->relpath;
+		string pathname = roots[sp->root] + SEP + relpath;
+
+		/* open it relative to it's (already open) root, the fd is then
+		 * hashed */
+
+		struct STAT st;
+		int fd = -1;
+#ifdef _MSC_VER
+		int found = (STAT(pathname.c_str(), &st) == 0);
+#else
+		const IndexedDir& root = Index.index(roots[sp->root]);
+		fd = (root.fd >= 0) ? 
+			openat(root.fd, relpath, O_RDONLY | O_CLOEXEC | O_NONBLOCK) :
+			open(pathname.c_str(), O_RDONLY | O_CLOEXEC | O_NONBLOCK);
+		int found = (fd >= 0 && fstat(fd, &st) == 0);
+#endif
+		if (!found || !S_ISREG(st.st_mode)) {
+			log(LOG_DEBUG, "embedded path %s missing\n", pathname.c_str());
+			close_file(fd);
+			continue;
+			}
+
+		verified.back() = pathname;
+
+		/* a change in size is tampering, no need to hash */
+
+		Check ck;
+		ck.index = i;
+		ck.resolve = 0;
+		ck.pathname = pathname;
+		ck.size_ok = ((long)st.st_size == sp->size);
+		ck.hashed = 0;
+		ck.deferred = 0;
+		ck.batched = 0;
+		ck.fd = fd;
+		checks.items.push_back(ck);
+		}
+
+	/* hash them */
+
+	return run_checks(checks);
+	}
+
+/* perform validation (the heart of this code). Resolve the signatures
+ * prevalidate() could not verify against the interpreter's sys.path. If
+ * sys.path differs from the embedded ROOTS, every signature is resolved
+ * again, but only files found at a new location are hashed. For LAZY
+ * loaders and FROZEN modules, only the modules python imported while
+ * initializing are checked, the rest are left to the importer (see
+ * install_importer) */
+
+int validate(const vector<string>& roots, const vector<string>& verified) {
+
+	Checks checks;
+
+    /* store sys.paths in vector of strings */
+
+	long long start = monotonic_usecs();
+	PyPtr sys_mod( PyImport_ImportModule("sys") );
+	if (sys_mod.get() == NULL) {
+		python_err("error importing sys");
+		return -1;
+		}
+    PyPtr pypath( PyObject_GetAttrString(sys_mod.get(), "path") );
+    if (pypath.get() == NULL) {
+		python_err("'sys' module has no attribute 'path'");
+        return -1;
+        }
+	for(Py_ssize_t i = 0; i < PyList_Size(pypath.get()); i++) {
+		PyObject* py_item = PyList_GetItem(pypath.get(), i);
+        checks.paths.push_back(PyString_AsString(py_item));
+        }
+	Trace.event("sys_path", start, monotonic_usecs());
+
+	PyPtr modules( PyObject_GetAttrString(sys_mod.get(), "modules") );
+	if (modules.get() == NULL || !PyDict_Check(modules.get())) {
+		python_err("'sys' module has no attribute 'modules'");
+		return -1;
+		}
+
+	/* does the runtime search path match the one we pre-validated? */
+
+	const vector<string>& paths = checks.paths;
+	int same_paths = (paths.size() == roots.size());
+	for(size_t i = 0; same_paths && i < paths.size(); i++) {
+		same_paths = (normpath(paths[i]) == roots[i]);
+		}
+	if (!same_paths && !roots.empty())
+		log(LOG_INFO, ">>> sys.path differs from embedded roots\n");
+
+	/* iterate signatures, compare them to installed editions */
+
+    for(size_t i = 0; i < SIGS.count; i++) {
+
+		if (!Required[i] || (same_paths && !verified[i].empty()))
+			continue;
+
+		if ((LAZY || Frozen[i]) && PyDict_GetItemString(modules.get(), 
+					SigNames[i].c_str()) == NULL)
+			continue;
+
+		Check ck;
+		ck.index = i;
+		ck.resolve = 1;
+		ck.verified = verified[i];
+		ck.size_ok = 1;
+		ck.hashed = 0;
+		ck.deferred = 0;
+		ck.batched = 0;
+		ck.fd = -1;
+		checks.items.push_back(ck);
+		}
+
+	checks.deadline = Deadline;
+	if (Deadline)
+		Deferred.paths = checks.paths;
+
+	return run_checks(checks);
+	}
+
+/* terminate the process from a thread running alongside SCRIPT, once it
+ * detected tampering. SCRIPT may be blocked in a read of stdin (holding the
+ * stream's lock), so only the output streams no one holds are flushed */
+
+void exit_tampered() {
+
+#ifndef _MSC_VER
+	FILE* streams[] = {stdout, stderr};
+	for(size_t i = 0; i < 2; i++) {
+		if (ftrylockfile(streams[i]) == 0) {
+			fflush(streams[i]);
+			funlockfile(streams[i]);
+			}
+		}
+#else
+	fflush(stdout);
+	fflush(stderr);
+#endif
+	_exit(-1);
+	}
+
+/* background thread: finish the checks deferred by the BUDGET (*arg* is
+ * Deferred) while SCRIPT runs. Tampering terminates the process, unless
+ * TAMPER is 1 */
+
+void verify_deferred(void* arg) {
+
+	Checks* checks = (Checks*)arg;
+	long long start = monotonic_usecs();
+	PROBE1(phase__start, "background");
+	int rc = run_checks(*checks);
+	PROBE1(phase__end, "background");
+	long long end = monotonic_usecs();
+	Index.release();
+
+	log(LOG_INFO, ">>> Background verification of %ld modules took %.3f ms\n",
+			(long)checks->items.size(), (end - start) / 1000.0);
+	if (Trace.enabled()) {
+		char fields[32];
+		sprintf(fields, "\"checks\": %ld", (long)checks->items.size());
+		Trace.event("background", start, end, fields);
+		}
+
+	if (rc)
+		exit_tampered();
+	}
+
+/* wait for background verification to finish, then save the cache (with
+ * room for an entry per signature and SCRIPT). Registered with Py_AtExit,
+ * as SCRIPT calling sys.exit() exits before main() can do it */
+
+void finish_background() {
+
+	if (!Background.started())
+		return;
+	Background.join();
+	if (Cache.save(CACHE_ENTRIES + SIGS.count + 1))
+		log(LOG_DEBUG, "verification cache not saved\n");
+	}
+
+/* _signet.signed(modname) -- return True if SIGS holds a signature for
+ * the module *modname* */
+
+PyObject* signet_signed(PyObject* self, PyObject* args) {
+
+	const char* modname;
+	if (!PyArg_ParseTuple(args, "s:signed", &modname))
+		return NULL;
+	return PyBool_FromLong(find_signature(modname) >= 0);
+	}
+
+/* _signet.frozen(modname) -- return (pathname, code) of the FROZEN module
+ * *modname*, or None */
+
+PyObject* signet_frozen(PyObject* self, PyObject* args) {
+
+	const char* modname;
+	if (!PyArg_ParseTuple(args, "s:frozen", &modname))
+		return NULL;
+
+	long index = find_signature(modname);
+	if (index < 0 || Frozen[index] == NULL)
+		Py_RETURN_NONE;
+
+	const FrozenModule* fp = Frozen[index];
+	PyPtr code( PyMarshal_ReadObjectFromString((char*)fp->code, 
+				(Py_ssize_t)fp->size) );
+	if (code.get() == NULL)
+		return NULL;
+	if (!PyCode_Check(code.get())) {
+		PyErr_Format(PyExc_ImportError, "frozen %s is not a code object", 
+				modname);
+		return NULL;
+		}
+
+	log(LOG_INFO, ">>> Frozen module %s\n", modname);
+	return Py_BuildValue("(sO)", fp->pathname, code.get());
+	}
+
+/* _signet.verify(modname, pathname, data) -- check *data*, read from
+ * *pathname*, against the signature of *modname*. On tampering, the loader
+ * exits at once if TAMPER >= 2 */
+
+PyObject* signet_verify(PyObject* self, PyObject* args) {
+
+	const char* modname;
+	const char* pathname;
+	const char* data;
+	int size;					/* s# length (no PY_SSIZE_T_CLEAN) */
+
+	if (!PyArg_ParseTuple(args, "sss#:verify", &modname, &pathname, 
+				&data, &size))
+		return NULL;
+
+	long index = find_signature(modname);
+	if (index < 0) {
+		PyErr_Format(PyExc_KeyError, "no signature for %s", modname);
+		return NULL;
+		}
+	const unsigned char* expected = SIGS.sigs[index].digest;
+
+	unsigned char digest[DIGEST_SIZE];
+	data_digest(pathname, data, (size_t)size, digest);
+
+	log(LOG_INFO, ">>> Found module %s -> %s\n", modname, pathname);
+
+	if (digest_equal(digest, expected))
+		watch((size_t)index, pathname);
+	else{
+		char hex1[2*DIGEST_SIZE+1], hex2[2*DIGEST_SIZE+1];
+		PROBE1(tamper, pathname);
+		log(LOG_ERROR, "SECURITY VIOLATION: '%s' has been tampered with!\n", 
+				pathname);
+		log(LOG_DEBUG, "expected %s, detected %s\n", hexlify(expected, hex1),
+				hexlify(digest, hex2));
+
+		/* the script is already running, don't let it handle this */
+
+		if (TAMPER >= 2)
+			exit_tampered();
+		}
+
+	Py_RETURN_NONE;
+	}
+
+PyMethodDef SignetMethods[] = {
+	{"frozen", signet_frozen, METH_VARARGS, 
+		"frozen(modname) -- (pathname, code) of a frozen module, or None"},
+	{"signed", signet_signed, METH_VARARGS, 
+		"signed(modname) -- True if modname has a signature"},
+	{"verify", signet_verify, METH_VARARGS, 
+		"verify(modname, pathname, data) -- verify module data"},
+	{NULL, NULL, 0, NULL}
+	};
+
+/* signet.verify(paths=None, threads=0) -- hash SCRIPT and the modules of
+ * SIGS found on sys.path again (only the files at *paths*, if given) on
+ * *threads* workers, with the GIL released. The verification cache is
+ * bypassed. Returns the list of files that failed verification */
+
+PyObject* signet_reverify(PyObject* self, PyObject* args, PyObject* kwds) {
+
+	static const char* kwlist[] = {"paths", "threads", NULL};
+	PyObject* py_paths = Py_None;
+	int threads = 0;
+	if (!PyArg_ParseTupleAndKeywords(args, kwds, "|Oi:verify", 
+				(char**)kwlist, &py_paths, &threads))
+		return NULL;
+	if (threads < 0) {
+		PyErr_SetString(PyExc_ValueError, "threads must be >= 0");
+		return NULL;
+		}
+
+	/* the files asked for, and the search path, are copied while we hold
+	 * the GIL */
+
+	Checks checks;
+	NameSet only;
+	if (py_paths != Py_None) {
+		PyPtr seq( PySequence_Fast(py_paths, "paths must be a sequence") );
+		if (seq.get() == NULL)
+			return NULL;
+		for(Py_ssize_t i = 0; i < PySequence_Fast_GET_SIZE(seq.get()); i++) {
+			PyObject* py_item = PySequence_Fast_GET_ITEM(seq.get(), i);
+			if (!PyString_Check(py_item)) {
+				PyErr_SetString(PyExc_TypeError, "paths must be strings");
+				return NULL;
+				}
+			only.insert(normpath(PyString_AsString(py_item)));
+			}
+		checks.only = &only;
+		}
+
+	PyObject* sys_path = PySys_GetObject((char*)"path");
+	for(Py_ssize_t i = 0; sys_path && PyList_Check(sys_path) && 
+			i < PyList_Size(sys_path); i++) {
+		PyObject* py_item = PyList_GetItem(sys_path, i);
+		if (PyString_Check(py_item))
+			checks.paths.push_back(PyString_AsString(py_item));
+		}
+
+	for(size_t i = 0; i < SIGS.count; i++) {
+		if (!Required[i] || Frozen[i])
+			continue;
+		Check ck;
+		ck.index = i;
+		ck.resolve = 1;
+		ck.size_ok = 1;
+		ck.hashed = 0;
+		ck.deferred = 0;
+		ck.batched = 0;
+		ck.fd = -1;
+		checks.items.push_back(ck);
+		}
+
+	/* directories are listed afresh, so files added since startup are
+	 * found */
+
+	DirIndex index;
+	checks.index = &index;
+	checks.rehash = 1;
+
+	string script = normpath(ScriptPath);
+	int with_script = (checks.only == NULL || only.count(script));
+	int script_ok = 1;
+	unsigned char digest[DIGEST_SIZE];
+
+	checks.batch = URING;
+
+	Py_BEGIN_ALLOW_THREADS
+	parallel_for(checks.items.size(), worker_count(threads ? threads : 
+				Threads, checks.items.size()), run_check, &checks);
+	if (checks.batch)
+		hash_batched(checks, threads ? threads : Threads);
+	if (with_script)
+		script_ok = (hash_file(script.c_str(), digest) != NULL && 
+				digest_equal(digest, ScriptDigest));
+	Py_END_ALLOW_THREADS
+
+	/* report in SIGS order, SCRIPT first */
+
+	PyPtr failed( PyList_New(0) );
+	if (failed.get() == NULL)
+		return NULL;
+
+	NameSet found;
+	if (with_script) {
+		found.insert(script);
+		if (!script_ok) {
+			PROBE1(tamper, script.c_str());
+			log(LOG_ERROR, "SECURITY VIOLATION: '%s' has been tampered "
+					"with!\n", script.c_str());
+			PyPtr py_path( PyString_FromString(script.c_str()) );
+			if (py_path.get() == NULL || 
+					PyList_Append(failed.get(), py_path.get()))
+				return NULL;
+			}
+		}
+
+	for(vector<Check>::const_iterator it = checks.items.begin(); 
+			it != checks.items.end(); it++) {
+
+		if (it->pathname.empty())
+			continue;
+		if (checks.only)
+			found.insert(normpath(it->pathname));
+		if (it->hashed && 
+				digest_equal(it->digest, SIGS.sigs[it->index].digest))
+			continue;
+
+		PROBE1(tamper, it->pathname.c_str());
+		log(LOG_ERROR, "SECURITY VIOLATION: '%s' has been tampered with!\n", 
+				it->pathname.c_str());
+		PyPtr py_path( PyString_FromString(it->pathname.c_str()) );
+		if (py_path.get() == NULL || 
+				PyList_Append(failed.get(), py_path.get()))
+			return NULL;
+		}
+
+	for(NameSet::const_iterator it = only.begin(); it != only.end(); it++) {
+		if (!found.count(*it)) {
+			PyErr_Format(PyExc_KeyError, "no signature for %s", it->c_str());
+			return NULL;
+			}
+		}
+
+	Py_INCREF(failed.get());
+	return failed.get();
+	}
+
+/* signet.signatures() -- return the embedded SIGS (of the running script,
+ * in a multi-call loader), as a list of (hexdigest, modulename, filename)
+ * sorted by modulename */
+
+PyObject* signet_signatures(PyObject* self, PyObject* unused) {
+
+	PyPtr sigs( PyList_New(0) );
+	if (sigs.get() == NULL)
+		return NULL;
+
+	for(size_t i = 0; i < SIGS.count; i++) {
+		if (!Required[i])
+			continue;
+		char hex[2*DIGEST_SIZE+1];
+		PyPtr sig( Py_BuildValue("(sss)", 
+				hexlify(SIGS.sigs[i].digest, hex), SigNames[i].c_str(), 
+				SIGS.strings + SIGS.sigs[i].filename) );
+		if (sig.get() == NULL || PyList_Append(sigs.get(), sig.get()))
+			return NULL;
+		}
+
+	Py_INCREF(sigs.get());
+	return sigs.get();
+	}
+
+/* signet.stats() -- return a dict of the hashing totals (including any
+ * signet.verify() calls) and startup timings, in milliseconds */
+
+PyObject* signet_stats(PyObject* self, PyObject* unused) {
+
+	return Py_BuildValue("{s:l,s:l,s:l,s:l,s:L,s:d,s:d,s:d,s:l,s:s,s:s}",
+			"files", Stats.files,
+			"mapped", Stats.mapped,
+			"cached", Stats.cached,
+			"uring", Stats.uring,
+			"bytes", Stats.bytes,
+			"hash_ms", Stats.usecs / 1000.0,
+			"validate_ms", ValidateUsecs / 1000.0,
+			"startup_ms", StartupUsecs / 1000.0,
+			"deferred", (long)Deferred.items.size(),
+			"digest", digest_name(DIGEST_ALGORITHM),
+			"sha1", Sha1Kernel());
+	}
+
+PyMethodDef RuntimeMethods[] = {
+	{"verify", (PyCFunction)(void(*)(void))signet_reverify, 
+		METH_VARARGS | METH_KEYWORDS, 
+		"verify(paths=None, threads=0) -- list of files failing verification"},
+	{"signatures", signet_signatures, METH_NOARGS, 
+		"signatures() -- [(hexdigest, modulename, filename), ...]"},
+	{"stats", signet_stats, METH_NOARGS, 
+		"stats() -- hashing totals and startup timings"},
+	{NULL, NULL, 0, NULL}
+	};
+
+/* register the signet module SCRIPT can import. Returns -1 on error */
+
+int install_runtime() {
+
+	if (Py_InitModule3("signet", RuntimeMethods, 
+				"signet loader runtime") == NULL) {
+		python_err("unable to create module signet");
+		return -1;
+		}
+	return 0;
+	}
+
+// The import hook serving FROZEN modules, and verifying the others when
+// LAZY. It only relies on builtin modules, so nothing unverified runs on
+// its behalf. Each module is read once, and the bytes verified are the
+// bytes compiled (bytecode caches are never trusted)
+
+const char IMPORTER[] =
+	"import imp, marshal, sys\n"
+	"import _signet\n"
+	"\n"
+	"def exec_module(fullname, pathname, code, loader):\n"
+	"    new = fullname not in sys.modules\n"
+	"    mod = sys.modules.setdefault(fullname, imp.new_module(fullname))\n"
+	"    mod.__file__ = pathname\n"
+	"    mod.__loader__ = loader\n"
+	"    try:\n"
+	"        exec code in mod.__dict__\n"
+	"    except:\n"
+	"        if new:\n"
+	"            sys.modules.pop(fullname, None)\n"
+	"        raise\n"
+	"    return sys.modules[fullname]\n"
+	"\n"
+	"class SignetImporter(object):\n"
+	"    def find_module(self, fullname, path=None):\n"
+	"        frozen = _signet.frozen(fullname)\n"
+	"        if frozen is not None:\n"
+	"            return FrozenLoader(*frozen)\n"
+	"        if not LAZY or not _signet.signed(fullname):\n"
+	"            return None\n"
+	"        try:\n"
+	"            fin, pathname, desc = imp.find_module(\n"
+	"                fullname.rpartition('.')[2], path)\n"
+	"        except ImportError:\n"
+	"            return None\n"
+	"        if fin is not None:\n"
+	"            fin.close()\n"
+	"        if desc[2] not in (imp.PY_SOURCE, imp.PY_COMPILED,\n"
+	"                imp.C_EXTENSION):\n"
+	"            return None\n"
+	"        return SignetLoader(pathname, desc[2])\n"
+	"\n"
+	"class SignetLoader(object):\n"
+	"    def __init__(self, pathname, kind):\n"
+	"        self.pathname = pathname\n"
+	"        self.kind = kind\n"
+	"\n"
+	"    def load_module(self, fullname):\n"
+	"        with open(self.pathname, 'rb') as fin:\n"
+	"            data = fin.read()\n"
+	"        _signet.verify(fullname, self.pathname, data)\n"
+	"        if self.kind == imp.C_EXTENSION:\n"
+	"            return imp.load_dynamic(fullname, self.pathname)\n"
+	"        if self.kind == imp.PY_COMPILED:\n"
+	"            if data[:4] != imp.get_magic():\n"
+	"                raise ImportError('bad magic number in %s' % \n"
+	"                    self.pathname)\n"
+	"            code = marshal.loads(data[8:])\n"
+	"        else:\n"
+	"            code = compile(data, self.pathname, 'exec', 0, True)\n"
+	"        return exec_module(fullname, self.pathname, code, self)\n"
+	"\n"
+	"class FrozenLoader(object):\n"
+	"    def __init__(self, pathname, code):\n"
+	"        self.pathname = pathname\n"
+	"        self.code = code\n"
+	"\n"
+	"    def load_module(self, fullname):\n"
+	"        return exec_module(fullname, self.pathname, self.code, self)\n"
+	"\n"
+	"sys.meta_path.insert(0, SignetImporter())\n";
+
+/* install the import hook, which looks modules up in SIGS (and FROZEN) by
+ * the name of the module imported. *lazy* enables verification on import.
+ * Returns -1 on error */
+
+int install_importer(int lazy) {
+
+	if (Py_InitModule3("_signet", SignetMethods, 
+				"signet loader internals") == NULL) {
+		python_err("unable to create module _signet");
+		return -1;
+		}
+
+	PyPtr globals( PyDict_New() );
+	if (globals.get() == NULL)
+		return -1;
+	PyDict_SetItemString(globals.get(), "__builtins__", PyEval_GetBuiltins());
+	PyDict_SetItemString(globals.get(), "LAZY", lazy ? Py_True : Py_False);
+
+	PyPtr result( PyRun_String(IMPORTER, Py_file_input, globals.get(), 
+				globals.get()) );
+	if (result.get() == NULL) {
+		python_err("unable to install import hook");
+		return -1;
+		}
+
+	log(LOG_DEBUG, "import hook installed\n");
+	return 0;
+	}
+
+/* search for our opts, pass ALL python (returned in *args*) */
+
+int parse_options(int argc, char* argv[], const char* script,
+		vector<char*>& args) {
+
+	args.push_back(strdup(script));
+
+	for(int i = 1; i < argc; i++) {
+
+		if (strcmp(argv[i], "--SECURITYOFF") == 0) {
+			TAMPER = 0;
+			log(LOG_WARNING, "SECURITY DISABLED\n");
+			}
+
+		else if (strcmp(argv[i], "--SECURITYWARN") == 0) {
+			TAMPER = 1;
+			log(LOG_WARNING, "SECURITY DISABLED\n");
+			}
+
+		else if (strcmp(argv[i], "--SECURITYMAX") == 0) {
+			TAMPER = 3;
+			log(LOG_WARNING, "SECURITY MAXIMUM Enabled\n");
+			}
+
+		else if (strncmp(argv[i], "--SECURITY", 10) == 0) {
+			log(LOG_WARNING, "error: invalid setting, "
+					"valid choices are SECURITY(OFF|WARN|MAX)\n");
+			return -1;
+			}
+
+		else if (strncmp(argv[i], "--SIGNETSERVE=", 14) == 0) {
+			ServePath = argv[i] + 14;
+#ifdef _MSC_VER
+			log(LOG_ERROR, "error: --SIGNETSERVE is not available on "
+					"windows\n");
+			return -1;
+#endif
+			}
+
+		args.push_back(strdup(argv[i]));
+		}
+
+    /* search environment for security override */
+
+	const char* senv = getenv("SIGNETSECURITY");
+    if (senv) {
+        if (strcmp(senv, "OFF") == 0) {
+            TAMPER = 0;
+            }
+        else if (strcmp(senv, "WARN") == 0) {
+            TAMPER = 1;
+            }
+        else if (strcmp(senv, "MAX") == 0) {
+            TAMPER = 3;
+            }
+        else{
+            log(LOG_WARNING, "unrecognized environment SIGNETSECURITY=%s\n",
+                    senv);
+            }
+        }
+
+    /* search environment for cache override */
+
+    const char* cenv = getenv("SIGNET_CACHE");
+    if (cenv) {
+        if (strcmp(cenv, "OFF") == 0) {
+            UseCache = 0;
+            }
+        else if (strcmp(cenv, "ON") != 0) {
+            log(LOG_WARNING, "unrecognized environment SIGNET_CACHE=%s\n",
+                    cenv);
+            }
+        }
+
+    /* search environment for time budget override */
+
+    const char* benv = getenv("SIGNET_BUDGET");
+    if (benv) {
+        char* end = NULL;
+        long budget = strtol(benv, &end, 10);
+        if (strcmp(benv, "OFF") == 0) {
+            BUDGET = -1;
+            }
+        else if (!*benv || *end || budget < 0) {
+            log(LOG_WARNING,
+                    "invalid environment setting SIGNET_BUDGET=%s\n", benv);
+            }
+        else{
+            BUDGET = (int)budget;
+            }
+        }
+
+    /* search environment for fast start override */
+
+    const char* fenv = getenv("SIGNET_FASTSTART");
+    if (fenv) {
+        if (strcmp(fenv, "OFF") == 0) {
+            FASTSTART = 0;
+            }
+        else if (strcmp(fenv, "ON") != 0) {
+            log(LOG_WARNING, "unrecognized environment SIGNET_FASTSTART=%s\n",
+                    fenv);
+            }
+        }
+
+    /* search environment for watch override */
+
+    const char* wenv = getenv("SIGNET_WATCH");
+    if (wenv) {
+        if (strcmp(wenv, "OFF") == 0) {
+            WATCH = 0;
+            }
+        else if (strcmp(wenv, "ON") == 0) {
+            WATCH = 1;
+            }
+        else{
+            log(LOG_WARNING, "unrecognized environment SIGNET_WATCH=%s\n",
+                    wenv);
+            }
+        }
+
+    /* search environment for io_uring override */
+
+    const char* uenv = getenv("SIGNET_URING");
+    if (uenv) {
+        if (strcmp(uenv, "OFF") == 0) {
+            URING = 0;
+            }
+        else if (strcmp(uenv, "ON") == 0) {
+            URING = 1;
+            }
+        else{
+            log(LOG_WARNING, "unrecognized environment SIGNET_URING=%s\n",
+                    uenv);
+            }
+        }
+
+    /* search environment for worker thread count */
+
+    const char* tenv = getenv("SIGNET_THREADS");
+    if (tenv) {
+        int threads = atoi(tenv);
+        if (threads < 1) {
+            log(LOG_WARNING,
+                    "invalid environment setting SIGNET_THREADS=%s\n", tenv);
+            }
+        else{
+            Threads = threads;
+            }
+        }
+
+    /* search environment for logging request */
+
+    const char* lenv = getenv("SIGNET_LOGLEVEL");
+    if (lenv) {
+        int level = atoi(lenv);
+        if (level < LOG_DEBUG || level > LOG_CRITICAL) {
+            log(LOG_WARNING, 
+                    "invalid environment setting SIGNET_LOGLEVEL=%s", lenv);
+            }
+        else{
+            Debug = level;
+            log(LOG_DEBUG, "SIGNET_LOGLEVEL set to %d\n", level);
+            }
+        }
 
-	if (parse_options(argc, argv, script)) {
-		Py_Finalize();
+    /* search environment for a sha1 kernel (e.g. scalar) to use in place
+     * of the fastest one the cpu supports */
+
+    const char* henv = getenv("SIGNET_SHA1");
+    if (henv && Sha1SelectKernel(henv) != 0) {
+        log(LOG_WARNING, "unavailable sha1 kernel SIGNET_SHA1=%s\n", henv);
+        }
+    log(LOG_DEBUG, "sha1 kernel %s\n", Sha1Kernel());
+
+	return 0;
+	}
+
+/* optionally initialize virtualenv */
+
+void initialize_virtualenv() {
+
+	/* is vritualenv active? */
+
+	const char* venv = getenv("VIRTUAL_ENV");
+	if (venv == NULL) {
+		log(LOG_DEBUG, "no VIRTUAL_ENV defined\n");
+		return;
+		}
+
+	/* look for posix first, then windows */
+
+	string pyhome = venv;
+	pyhome += "/bin";
+
+	if (!isdir(pyhome.c_str())) {
+		pyhome = venv;
+		pyhome += "/Scripts";
+		}
+
+	if (!isdir(pyhome.c_str())) {
+		log(LOG_WARNING, "VIRTUAL_ENV defined, but missing target %s\n", venv);
+		return;
+		}
+
+	Py_SetPythonHome((char*)venv);
+	}
+
+/* replace sys.path with *paths* (the embedded ROOTS, for FASTSTART).
+ * Returns -1 on error */
+
+int set_sys_path(const vector<string>& paths) {
+
+	PyPtr path( PyList_New((Py_ssize_t)paths.size()) );
+	if (path.get() == NULL)
 		return -1;
+	for(size_t i = 0; i < paths.size(); i++) {
+		PyObject* item = PyString_FromString(paths[i].c_str());
+		if (item == NULL)
+			return -1;
+		PyList_SET_ITEM(path.get(), (Py_ssize_t)i, item);
 		}
+	return PySys_SetObject((char*)"path", path.get());
+	}
+
+/* verify the binary, SCRIPT (read into *source*) and the dependencies we
+ * can locate without python. *verified* is filled in by prevalidate() */
 
-    /* retrieve fully qualified path of executable */
+int run_validation(const string& exename, const string& source, 
+		const vector<string>& roots, vector<string>& verified) {
 
-    string exename;
-    int rc = get_executable(argv, exename);
+	int rc = 0;
 
 	/* tamper protection set to warn or max? */
 
-	if (rc == 0 && (TAMPER == 1 || TAMPER == 3)) {
+	if (TAMPER == 1 || TAMPER == 3) {
 
 		/* validate binary signature */
 
+        long long start = monotonic_usecs();
+        PROBE1(phase__start, "verify_trust");
         int trusted = verify_trust(exename.c_str(), 1);
+        PROBE1(phase__end, "verify_trust");
+        Trace.event("verify_trust", start, monotonic_usecs());
 
         /* if untrusted, and max protection, exit */
 
@@ -508,72 +2297,680 @@ int run_validation(int argc, char* argv[], const char* script) {
             rc = -1;
 		}
 
-
-	/* validate module security */
+	/* validate script & embedded dependency locations */
 
 	if (rc == 0 && TAMPER >= 1) {
         string script_path = _dirname(exename.c_str());
-        script_path += SCRIPT;
-		rc = validate(script_path);
+        script_path += Script;
+		long long start = monotonic_usecs();
+		PROBE1(phase__start, "prevalidate");
+		rc = prevalidate(script_path, source, roots, verified);
+		PROBE1(phase__end, "prevalidate");
+		Trace.event("prevalidate", start, monotonic_usecs());
         }
 
+	return rc;
+	}
+
+/* return SCRIPT's code object, compiled from *source* (the very bytes that
+ * were verified). The embedded ScriptCode is used instead, when SCRIPT was
+ * verified (so it's ScriptCode's source) and python's magic number matches.
+ * Returns NULL, with a python exception set, on error */
+
+PyObject* script_code(const string& source) {
+
+	long long start = monotonic_usecs();
+
+	if (ScriptCode->data != NULL && ScriptVerified && 
+			ScriptCode->magic == PyImport_GetMagicNumber()) {
+		PyObject* code = PyMarshal_ReadObjectFromString(
+				(char*)ScriptCode->data, (Py_ssize_t)ScriptCode->size);
+		if (code != NULL && PyCode_Check(code)) {
+			log(LOG_DEBUG, "running embedded bytecode\n");
+			Trace.event("compile", start, monotonic_usecs(), 
+					"\"bytecode\": true");
+			return code;
+			}
+		Py_XDECREF(code);
+		PyErr_Clear();
+		log(LOG_DEBUG, "invalid embedded bytecode\n");
+		}
+
+	/* a nul would silently cut the source short */
+
+	if (source.find('\0') != string::npos) {
+		PyErr_SetString(PyExc_TypeError, 
+				"source code string cannot contain null bytes");
+		return NULL;
+		}
+
+	PyCompilerFlags flags = {0};
+	PyObject* code = Py_CompileStringFlags(source.c_str(), Script, 
+			Py_file_input, &flags);
+	Trace.event("compile", start, monotonic_usecs(), "\"bytecode\": false");
+	return code;
+	}
+
+/* run SCRIPT from *source* (see script_code) as PyRun_SimpleFileEx would.
+ * Returns 0, or -1 if an exception was raised */
+
+int run_script(const string& source) {
+
+	PyObject* main_mod = PyImport_AddModule("__main__");
+	if (main_mod == NULL)
+		return -1;
+	PyObject* globals = PyModule_GetDict(main_mod);
+
+	int set_file = (PyDict_GetItemString(globals, "__file__") == NULL);
+	if (set_file) {
+		PyPtr filename( PyString_FromString(Script) );
+		if (filename.get() == NULL || 
+				PyDict_SetItemString(globals, "__file__", filename.get()))
+			return -1;
+		}
+
+	int rc = 0;
+
+	PyPtr code( script_code(source) );
+	PyPtr result( code.get() ? PyEval_EvalCode((PyCodeObject*)code.get(), 
+				globals, globals) : NULL );
+
+	/* catch and report exception */
+
+	if (result.get() == NULL) {
+		PyErr_Print();
+		rc = -1;
+		}
+
+	if (set_file && PyDict_DelItemString(globals, "__file__"))
+		PyErr_Clear();
+
+	return rc;
+	}
+
+PyObject* BuiltinImport = NULL;	/* __import__ wrapped by traced_import */
+
+/* __import__ replacement that traces the time taken by each import of a
+ * module that is not loaded yet */
+
+PyObject* traced_import(PyObject* self, PyObject* args, PyObject* kwds) {
+
+	const char* name = NULL;
+	PyObject* first = PyTuple_Size(args) > 0 ? PyTuple_GetItem(args, 0) : NULL;
+	if (first != NULL && PyString_Check(first) && 
+			PyDict_GetItem(PyImport_GetModuleDict(), first) == NULL)
+		name = PyString_AsString(first);
+
+	long long start = monotonic_usecs();
+	PyObject* result = PyObject_Call(BuiltinImport, args, kwds);
+	if (name != NULL)
+		Trace.event("import", start, monotonic_usecs(), "\"module\": " + 
+				json_string(name) + (result ? "" : ", \"error\": true"));
+	return result;
+	}
+
+PyMethodDef TracedImport = {"__import__", 
+	(PyCFunction)(void(*)(void))traced_import, 
+	METH_VARARGS | METH_KEYWORDS, "__import__ (traced by signet)"};
+
+/* trace every import from now on. Returns -1 on error */
+
+int trace_imports() {
+
+	PyObject* builtins = PyEval_GetBuiltins();
+	BuiltinImport = PyDict_GetItemString(builtins, "__import__");
+	if (BuiltinImport == NULL)
+		return -1;
+	Py_INCREF(BuiltinImport);
+
+	PyPtr traced( PyCFunction_New(&TracedImport, NULL) );
+	if (traced.get() == NULL || 
+			PyDict_SetItemString(builtins, "__import__", traced.get()))
+		return -1;
+	return 0;
+	}
+
+#ifndef _MSC_VER
+
+/* verify watched file *w* again, if it changed since it was verified.
+ * Returns 0 if it's unchanged or verified (its fingerprint is updated),
+ * or -1 if it was tampered with */
+
+int verify_watched(Watched& w) {
+
+	struct stat st;
+	int found = (stat(w.pathname.c_str(), &st) == 0);
+	if (found && same_fingerprint(st, w.st))
+		return 0;
+
+	const unsigned char* expected = (w.index < SIGS.count) ? 
+		SIGS.sigs[w.index].digest : ScriptDigest;
+	unsigned char digest[DIGEST_SIZE];
+	if (found && file_digest(w.pathname.c_str(), digest) && 
+			digest_equal(digest, expected)) {
+		log(LOG_INFO, ">>> Re-verified %s\n", w.pathname.c_str());
+		w.st = st;
+		return 0;
+		}
+
+	PROBE1(tamper, w.pathname.c_str());
+	log(LOG_ERROR, "SECURITY VIOLATION: '%s' has been tampered with!\n", 
+			w.pathname.c_str());
+	return -1;
+	}
+
+/* re-verify the watched files that changed since they were verified.
+ * Returns -1 if tampering was detected and TAMPER >= 2 */
+
+int reverify() {
+
+	for(size_t i = 0; i < Watches.size(); ) {
+		if (verify_watched(Watches[i]) == 0) {
+			i++;
+			continue;
+			}
+		if (TAMPER >= 2)
+			return -1;
+		Watches.erase(Watches.begin() + i);		/* warn once */
+		}
+	return 0;
+	}
+
+/* watchdog thread: verify the watched files again as they change (all of
+ * them once at the start, for changes made before they were watched).
+ * Tampering terminates the process, unless TAMPER is 1 */
+
+void watchdog(void* arg) {
+
+	lower_thread_priority();
+
+	vector<string> changed(1, "");
+	do {
+		sort(changed.begin(), changed.end());
+		int all = (changed[0] == "");
+
+		/* hash outside the lock, so verification elsewhere never waits */
+
+		WatchLock.lock();
+		vector<Watched> affected;
+		for(size_t i = 0; i < Watches.size(); i++) {
+			if (all || binary_search(changed.begin(), changed.end(), 
+						Watches[i].pathname))
+				affected.push_back(Watches[i]);
+			}
+		WatchLock.unlock();
+
+		for(size_t i = 0; i < affected.size(); i++) {
+			Watched& w = affected[i];
+			int rc = verify_watched(w);
+			if (rc && TAMPER >= 2)
+				exit_tampered();
+
+			WatchLock.lock();
+			for(size_t j = 0; j < Watches.size(); j++) {
+				if (Watches[j].index != w.index || 
+						Watches[j].pathname != w.pathname)
+					continue;
+				if (rc)
+					Watches.erase(Watches.begin() + j);		/* warn once */
+				else
+					Watches[j].st = w.st;
+				break;
+				}
+			WatchLock.unlock();
+			}
+		}
+	while (Watcher.wait(changed) == 0);
+	}
+
+/* stop the watchdog, and wait for it to finish. Registered with Py_AtExit,
+ * as SCRIPT calling sys.exit() exits before main() can stop it (and exit()
+ * would otherwise join a watchdog still waiting for changes) */
+
+void stop_watchdog() {
+
+	if (Watchdog.started()) {
+		Watcher.stop();
+		Watchdog.join();
+		}
+	}
+
+/* watch the directories of the verified files, and start the watchdog.
+ * Returns -1 if watching is not supported */
+
+int start_watchdog() {
+
+	if (Py_AtExit(stop_watchdog) != 0 || Watcher.open())
+		return -1;
+
+	WatchLock.lock();
+	for(size_t i = 0; i < Watches.size(); i++) {
+		const string& pathname = Watches[i].pathname;
+		Watcher.add(pathname.substr(0, pathname.find_last_of(SEP)));
+		}
+	WatchLock.unlock();
+
+	return Watchdog.start(watchdog, NULL);
+	}
+
+/* import every signed dependency in the server, so children start with
+ * them loaded */
+
+void preload() {
+
+	for(size_t i = 0; i < SIGS.count; i++) {
+		if (!Required[i])
+			continue;
+		PyPtr mod( PyImport_ImportModule(SigNames[i].c_str()) );
+		if (mod.get() == NULL) {
+			log(LOG_DEBUG, "unable to preload %s\n", SigNames[i].c_str());
+			PyErr_Clear();
+			}
+		}
+	}
+
+int ServerPipe[2] = {-1, -1};	/* SIGCHLD/SIGTERM/SIGINT wake the server */
+
+void server_signal(int signum) {
+
+	char c = (signum == SIGCHLD) ? 'c' : 'q';
+	int saved = errno;
+	if (write(ServerPipe[1], &c, 1) < 0) {}
+	errno = saved;
+	}
+
+/* forked child: run SCRIPT (its verified *source*) for client request
+ * *req*, with the client's stdio, working directory, environment and
+ * arguments. Never returns */
+
+void run_request(const ZygoteRequest& req, const string& source) {
+
+	PyOS_AfterFork();
+
+	for(int fd = 0; fd < 3; fd++) {
+		dup2(req.fds[fd], fd);
+		close(req.fds[fd]);
+		}
+	if (!req.cwd.empty() && chdir(req.cwd.c_str()) != 0)
+		log(LOG_WARNING, "unable to change directory to %s\n", 
+				req.cwd.c_str());
+
+	/* replace os.environ (and so the process environment) */
+
+	PyPtr env( PyDict_New() );
+	int ok = (env.get() != NULL);
+	for(size_t i = 0; ok && i < req.env.size(); i++) {
+		size_t eq = req.env[i].find('=');
+		if (eq == string::npos)
+			continue;
+		PyPtr value( PyString_FromString(req.env[i].c_str() + eq + 1) );
+		ok = (value.get() != NULL && PyDict_SetItemString(env.get(), 
+					req.env[i].substr(0, eq).c_str(), value.get()) == 0);
+		}
+	PyPtr signet( PyString_FromString("1") );
+	ok = ok && signet.get() && 
+		PyDict_SetItemString(env.get(), "SIGNET", signet.get()) == 0;
+
+	PyPtr os_mod( ok ? PyImport_ImportModule("os") : NULL );
+	PyPtr os_environ( os_mod.get() ? 
+			PyObject_GetAttrString(os_mod.get(), "environ") : NULL );
+	PyPtr cleared( os_environ.get() ? 
+			PyObject_CallMethod(os_environ.get(), (char*)"clear", NULL) : NULL );
+	PyPtr updated( cleared.get() ? PyObject_CallMethod(os_environ.get(), 
+				(char*)"update", (char*)"(O)", env.get()) : NULL );
+	if (updated.get() == NULL) {
+		python_err("unable to set the client's environment");
+		_exit(-1);
+		}
+
+	vector<char*> args;
+	for(size_t i = 0; i < req.argv.size(); i++)
+		args.push_back(strdup(req.argv[i].c_str()));
+	PySys_SetArgvEx((int)args.size(), &args[0], 0);
+
+	int rc = run_script(source);
 	Py_Finalize();
+	fflush(NULL);
+	_exit(rc);
+	}
+
+/* send the exit *status* of child *pid* to it's client */
+
+void finish_request(map<pid_t, int>& clients, pid_t pid, int status) {
+
+	map<pid_t, int>::iterator it = clients.find(pid);
+	if (it == clients.end())
+		return;
+	int code = WIFEXITED(status) ? WEXITSTATUS(status) : 
+		128 + WTERMSIG(status);
+	zygote_reply(it->second, code);
+	close(it->second);
+	clients.erase(it);
+	}
+
+/* fork server: preload the dependencies, then listen on ServePath and run
+ * SCRIPT (its verified *source*) in a forked child for each client. Watched
+ * files that changed are verified again before each request. Returns 0
+ * when stopped by SIGTERM/SIGINT, -1 if tampering was detected (TAMPER >= 2)
+ * or on error */
+
+int serve(const string& source) {
+
+	preload();
+
+	int listener = zygote_listen(ServePath.c_str());
+	if (listener < 0) {
+		log(LOG_ERROR, "unable to listen on %s\n", ServePath.c_str());
+		return -1;
+		}
+	if (pipe(ServerPipe) != 0) {
+		close(listener);
+		return -1;
+		}
+	fcntl(ServerPipe[0], F_SETFL, O_NONBLOCK);
+	fcntl(ServerPipe[1], F_SETFL, O_NONBLOCK);
+
+	struct sigaction sa, old_chld, old_term, old_int;
+	memset(&sa, 0, sizeof(sa));
+	sa.sa_handler = server_signal;
+	sa.sa_flags = SA_RESTART;
+	sigemptyset(&sa.sa_mask);
+	sigaction(SIGCHLD, &sa, &old_chld);
+	sigaction(SIGTERM, &sa, &old_term);
+	sigaction(SIGINT, &sa, &old_int);
+
+	char id[2*DIGEST_SIZE+1];
+	hexlify(ScriptDigest, id);
+
+	log(LOG_INFO, ">>> Serving SCRIPT %s on %s\n", Script, ServePath.c_str());
+
+	map<pid_t, int> clients;	/* running children -> client connection */
+	int rc = 0, stop = 0;
+	while (!stop) {
+
+		struct pollfd pfds[2] = {{ServerPipe[0], POLLIN, 0}, 
+			{listener, POLLIN, 0}};
+		if (poll(pfds, 2, -1) < 0 && errno != EINTR) {
+			rc = -1;
+			break;
+			}
+
+		/* reap children, stop on request */
+
+		char c;
+		while (read(ServerPipe[0], &c, 1) == 1)
+			stop |= (c == 'q');
+		int status;
+		pid_t pid;
+		while ((pid = waitpid(-1, &status, WNOHANG)) > 0)
+			finish_request(clients, pid, status);
+
+		if (stop || !(pfds[1].revents & POLLIN))
+			continue;
+
+		int conn = zygote_accept(listener);
+		if (conn < 0)
+			continue;
+
+		ZygoteRequest req;
+		if (zygote_recv(conn, req)) {
+			close(conn);
+			continue;
+			}
+
+		/* refuse clients of another script, and stop serving once
+		 * tampering is detected */
+
+		if (req.id == id && reverify()) {
+			rc = -1;
+			stop = 1;
+			}
+		if (req.id != id || stop || zygote_ack(conn)) {
+			for(int fd = 0; fd < 3; fd++)
+				close(req.fds[fd]);
+			close(conn);
+			continue;
+			}
+
+		fflush(NULL);
+		pid = fork();
+		if (pid == 0) {
+			sigaction(SIGCHLD, &old_chld, NULL);
+			sigaction(SIGTERM, &old_term, NULL);
+			sigaction(SIGINT, &old_int, NULL);
+			close(ServerPipe[0]);
+			close(ServerPipe[1]);
+			close(listener);
+			close(conn);
+			for(map<pid_t, int>::iterator it = clients.begin(); 
+					it != clients.end(); it++)
+				close(it->second);
+			run_request(req, source);
+			}
+
+		for(int fd = 0; fd < 3; fd++)
+			close(req.fds[fd]);
+		if (pid < 0) {
+			zygote_reply(conn, 255);
+			close(conn);
+			}
+		else{
+			clients[pid] = conn;
+			}
+		}
+
+	close(listener);
+	unlink(ServePath.c_str());
+
+	/* let running children finish */
 
+	int status;
+	pid_t pid;
+	while (!clients.empty() && (pid = waitpid(-1, &status, 0)) > 0)
+		finish_request(clients, pid, status);
+
+	sigaction(SIGCHLD, &old_chld, NULL);
+	sigaction(SIGTERM, &old_term, NULL);
+	sigaction(SIGINT, &old_int, NULL);
 	return rc;
 	}
 
+#endif
+
 int main(int argc, char* argv[]) {
 
+	/* tracing starts first, to time everything (including resolving our
+	 * own executable) */
+
+	long long start = monotonic_usecs();
+	long long main_start = start;
+	const char* trace = getenv("SIGNET_TRACE");
+	if (trace && Trace.open(trace, start))
+		log(LOG_WARNING, "unable to open SIGNET_TRACE=%s\n", trace);
+
 	string exename;
 	if (get_executable(argv, exename)) {
 		return -1;
 		}
-	string script = _dirname(exename.c_str()) + SCRIPT;
+	Trace.event("executable", start, monotonic_usecs());
+	if (select_entry_point(argc, argv))
+		return -1;
+	string script = _dirname(exename.c_str()) + Script;
+	ScriptPath = script;
+	decode_names();
+	size_t frozen = index_frozen();
+	index_critical();
+
+	/* parse command line */
+
+	vector<char*> args;
+	if (parse_options(argc, argv, script.c_str(), args))
+		return -1;
+	size_workers(Threads);
+
+	/* hand this run to a fork server for SCRIPT, when one is running */
+
+	const char* server = getenv("SIGNET_SERVER");
+	if (server && ServePath.empty()) {
+		char id[2*DIGEST_SIZE+1];
+		int status;
+		if (zygote_run(server, hexlify(ScriptDigest, id), 
+					vector<string>(args.begin(), args.end()), &status) == 0)
+			return status;
+		log(LOG_DEBUG, "no signet server at %s\n", server);
+		}
+
+	/* validation that does not need python runs first, a tampered
+	 * SCRIPT or dependency aborts before the interpreter is started */
 
 	log(LOG_INFO, ">>> Validation step\n");
 
-	if (run_validation(argc, argv, script.c_str()))
+	vector<string> roots = embedded_roots(_dirname(exename.c_str()));
+	vector<string> verified;
+
+	/* SCRIPT is read once, the bytes verified are the bytes we run */
+
+	start = monotonic_usecs();
+	PROBE1(phase__start, "read_script");
+	string source;
+	if (read_file(script.c_str(), source)) {
+		log(LOG_ERROR, "could not open %s\n", script.c_str());
 		return -1;
+		}
+	PROBE1(phase__end, "read_script");
+	Trace.event("read_script", start, monotonic_usecs(), "\"path\": " + 
+			json_string(script));
 
-	log(LOG_INFO, ">>> Run SCRIPT %s\n", script.c_str());
+	if (UseCache && CACHE_KEY[0] && TAMPER >= 1)
+		Cache.open(default_cache_file(Script, CACHE_KEY), CACHE_KEY);
 
-	/* let python script know about signet */
+	long long validate_usecs = monotonic_usecs();
+	if (BUDGET >= 0 && TAMPER >= 1 && ServePath.empty())
+		Deadline = validate_usecs + BUDGET * 1000LL;
+	if (run_validation(exename, source, roots, verified))
+		return -1;
+	validate_usecs = monotonic_usecs() - validate_usecs;
 
-	putenv((char*)"SIGNET=1");
+	/* let python script know about signet (os.environ is captured
+	 * during Py_Initialize, so this must come first) */
 
-	int rc = 0;
+	putenv((char*)"SIGNET=1");
 
-	/* initialize python */
+	/* initialize python -- one interpreter serves both validation and
+	 * running SCRIPT. validate() never imports the modules it checks,
+	 * so nothing runs before verification is complete */
 
+	start = monotonic_usecs();
+	PROBE1(phase__start, "py_initialize");
 	Py_SetProgramName((char*)script.c_str());
 	initialize_virtualenv();
+	int faststart = (FASTSTART && !roots.empty());
+	if (faststart) {
+		Py_NoSiteFlag = 1;
+		Py_NoUserSiteDirectory = 1;
+		Py_IgnoreEnvironmentFlag = 1;
+		}
 	Py_Initialize();
+	PySys_SetArgvEx((int)args.size(), &args[0], !faststart);
+	if (faststart && set_sys_path(roots)) {
+		python_err("unable to set sys.path");
+		Py_Finalize();
+		return -1;
+		}
+	PROBE1(phase__end, "py_initialize");
+	Trace.event("py_initialize", start, monotonic_usecs());
 
-	/* parse command line */
-
-	if (parse_options(argc, argv, script.c_str())) {
+	if (install_runtime()) {
 		Py_Finalize();
 		return -1;
 		}
 
-	if (rc == 0) {
-		FILE* fin = fopen(script.c_str(), "r");
-		if (fin) {
-			rc = PyRun_SimpleFileEx(fin, SCRIPT, 1);
+	if (Trace.enabled() && trace_imports())
+		python_err("unable to trace imports");
 
-			/* catch and report exception */
+	/* resolve remaining dependencies against sys.path */
 
-			if (rc && PyErr_Occurred())
-				PyErr_Print();
-			}
-		else{
-			log(LOG_ERROR, "could not open %s\n", script.c_str());
-			rc = -1;
+	long long started = monotonic_usecs();
+	PROBE1(phase__start, "validate");
+	if (TAMPER >= 1 && validate(roots, verified)) {
+		Py_Finalize();
+		return -1;
+		}
+	int lazy = (TAMPER >= 1 && LAZY);
+	if ((lazy || frozen) && install_importer(lazy)) {
+		Py_Finalize();
+		return -1;
+		}
+	validate_usecs += monotonic_usecs() - started;
+	ValidateUsecs = validate_usecs;
+	PROBE1(phase__end, "validate");
+	Trace.event("validate", started, monotonic_usecs());
+
+	/* checks deferred by the BUDGET are finished while SCRIPT runs */
+
+	if (!Deferred.items.empty()) {
+		log(LOG_INFO, ">>> Deferred %ld modules to background verification\n",
+				(long)Deferred.items.size());
+		Deferred.deadline = 0;
+		if (Py_AtExit(finish_background) != 0 ||
+				Background.start(verify_deferred, &Deferred)) {
+			log(LOG_DEBUG, "unable to start background verification\n");
+			verify_deferred(&Deferred);
 			}
 		}
 
+	if (!Background.started() && 
+			Cache.save(CACHE_ENTRIES + SIGS.count + 1))
+		log(LOG_DEBUG, "verification cache not saved\n");
+
+	/* the directories searched are not kept open while SCRIPT runs (or in
+	 * the server's children), background verification closes them once
+	 * it's done */
+
+	if (!Background.started())
+		Index.release();
+
+	log(LOG_INFO, ">>> Hashed %ld files (%ld mapped, %ld cached, %ld read "
+			"through io_uring), %lld bytes in %.3f ms, validation took "
+			"%.3f ms\n", Stats.files, Stats.mapped, Stats.cached, 
+			Stats.uring, Stats.bytes, Stats.usecs / 1000.0, 
+			validate_usecs / 1000.0);
+
+#ifndef _MSC_VER
+	if (!ServePath.empty()) {
+		int rc = serve(source);
+		Py_Finalize();
+		return rc;
+		}
+
+	/* keep watching the files we verified while SCRIPT runs */
+
+	if (WATCH && TAMPER >= 1 && start_watchdog())
+		log(LOG_DEBUG, "unable to watch verified files\n");
+#endif
+
+	log(LOG_INFO, ">>> Run SCRIPT %s\n", script.c_str());
+
+	start = monotonic_usecs();
+	StartupUsecs = start - main_start;
+	PROBE2(script__start, script.c_str(), StartupUsecs);
+	PROBE1(phase__start, "run_script");
+	int rc = run_script(source);
+	PROBE1(phase__end, "run_script");
+	Trace.event("run_script", start, monotonic_usecs());
+
+	stop_watchdog();
+
+	/* SCRIPT finished first, background verification still has the
+	 * final say (tampering terminates the process) */
+
+	finish_background();
+
+	start = monotonic_usecs();
+	PROBE1(phase__start, "finalize");
 	Py_Finalize();
+	PROBE1(phase__end, "finalize");
+	Trace.event("finalize", start, monotonic_usecs());
 
 	return rc;
 	}
-
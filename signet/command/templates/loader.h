@@ -1,16 +1,94 @@
 
+const size_t DIGEST_SIZE = 20;	/* bytes in a DIGEST_ALGORITHM digest */
+
 struct Signature {				/* module signatures */
-	const char* hexdigest;
-	const char* modname;
-    const char* filename;
+	unsigned char digest[DIGEST_SIZE];
+	unsigned int filename;		/* offset of the file name in strings */
+	int root;					/* index into ROOTS, -1 if not embedded */
+	unsigned int relpath;		/* offset of the path relative to 
+								 * ROOTS[root] in strings */
+	long size;					/* file size in bytes */
+	};
+
+struct Bytecode {				/* marshalled code object */
+	long magic;					/* of the python that compiled it */
+	const unsigned char* data;
+	size_t size;
+	};
+
+struct SigTable {				/* SIGS, sorted by module name */
+	const char* names;			/* front coded module names, see 
+								 * decode_names() */
+	const char* strings;		/* nul separated file names & paths */
+	const Signature* sigs;
+	size_t count;
+	};
+
+struct FrozenModule {			/* dependency compiled into the loader */
+	size_t sig;					/* index into SIGS */
+	const char* pathname;		/* file it was compiled from */
+	const unsigned char* code;	/* marshalled code object */
+	size_t size;
+	};
+
+struct FrozenTable {			/* FROZEN, ordered as SIGS */
+	long magic;					/* of the python that compiled them */
+	const FrozenModule* modules;
+	size_t count;
+	};
+
+struct EntryPoint {				/* one script of a multi-call loader */
+	const char* name;			/* the loader runs it when invoked as name */
+	const char* script;
+	unsigned char digest[DIGEST_SIZE];	/* of script */
+	const Bytecode* code;		/* script's compiled code */
+	const int* sigs;			/* indexes into SIGS of its dependencies,
+								 * -1 terminated */
+	};
+
+struct EntryPointTable {		/* ENTRY_POINTS, ordered by name */
+	const EntryPoint* entries;
+	size_t count;
 	};
 
 // ---------------------------------------------------------------------------
 // REPLACED GLOBALS (replaced by signet.command.build_signet)
 //
 // SCRIPT	- will be replaced with the script name we are loading.
-// SCRIPT_HEXDIGEST - will be replaced with SHA1 of script
-// SIGS   	- module signatures {{"hexdigest","modulename","filename"},...}
+// DIGEST_ALGORITHM - the algorithm of SCRIPT_DIGEST and the SIGS digests,
+//			  DIGEST_SHA1, DIGEST_SHA256 or DIGEST_BLAKE2B (set by --digest).
+//			  DIGEST_SIZE is replaced with the size of its digests
+// TREE_CHUNK - files larger than this many bytes have a tree digest,
+//			  hashed a chunk at a time in parallel. 0 disables tree digests
+//			  (set by --treehash)
+// SCRIPT_DIGEST - will be replaced with the digest of script (raw bytes)
+// SCRIPT_CODE - will be replaced with SCRIPT's compiled code, run instead of
+//			  compiling SCRIPT when python's magic number matches
+// SIGS   	- module signatures, one per module file, named after the module
+//			  the file provides. With --prevalidate, each entry also has its
+//			  embedded location (root, relpath & size)
+// FROZEN	- compiled python source dependencies (set by --freeze)
+// ROOTS	- search roots the signatures were located under, NULL terminated
+//			  ("" is the directory holding SCRIPT), ie. sys.path at build
+//			  time. Only with --prevalidate or --faststart
+// CACHE_KEY - hex HMAC key of the verification cache, "" disables the cache
+//			  (set by --cache)
+// LAZY		- 1 verifies dependencies as they are first imported, instead of
+//			  before SCRIPT runs (set by --lazy)
+// BUDGET	- milliseconds of verification before SCRIPT runs, the rest is
+//			  finished by a background thread. -1 verifies everything
+//			  first (set by --budget)
+// CRITICAL	- modules (and their submodules) always verified before SCRIPT
+//			  runs, whatever the BUDGET. NULL terminated (set by --critical)
+// WATCH	- 1 keeps watching the verified files while SCRIPT runs, and
+//			  verifies them again when they change (set by --watch)
+// URING	- 1 reads the dependencies hashed in batches through an io_uring
+//			  (linux), rather than a blocking read() per file (set by --uring)
+// FASTSTART - 1 starts python without site, ignoring the PYTHON* environment,
+//			  with ROOTS as sys.path (set by --faststart)
+// ENTRY_POINTS - the scripts of a multi-call loader, chosen by the name the
+//			  loader was invoked as. When present, SCRIPT, SCRIPT_DIGEST and
+//			  SCRIPT_CODE are unused (set by --multicall)
 // TAMPER 	- controls how tampering is handled
 //	3  - maximum, SCRIPT & dependency check + require signed binary
 //		 (windows only)
@@ -19,9 +97,22 @@ struct Signature {				/* module signatures */
 //	0  - disable tamper checks
 // ---------------------------------------------------------------------------
 
+const int DIGEST_ALGORITHM = 0;
+long long TREE_CHUNK = 0;
 const char SCRIPT[] = "";
-const char SCRIPT_HEXDIGEST[] = "";
-const Signature SIGS[] = {{NULL,NULL,NULL}};
+const unsigned char SCRIPT_DIGEST[DIGEST_SIZE] = {0};
+const Bytecode SCRIPT_CODE = {0, NULL, 0};
+const SigTable SIGS = {"", "", NULL, 0};
+const FrozenTable FROZEN = {0, NULL, 0};
+const char* const ROOTS[] = {NULL};
+const char CACHE_KEY[] = "";
+int LAZY = 0;
+int BUDGET = -1;
+const char* const CRITICAL[] = {NULL};
+int WATCH = 0;
+int URING = 0;
+int FASTSTART = 0;
+const EntryPointTable ENTRY_POINTS = {NULL, 0};
 int TAMPER = 2;
 
 
@@ -0,0 +1,109 @@
+/* bench_sha1 - report sha1 throughput (MB/s) of each kernel this cpu runs.
+ *
+ * Build and run with 'make bench-sha1', or:
+ *
+ *	c++ -O2 -I signet/command/lib tests/bench_sha1.cpp \
+ *		signet/command/lib/sha1.cpp -o bench_sha1
+ *	./bench_sha1 [seconds per measurement]
+ *
+ * Each kernel hashes buffers the size of a small module (4KB), a large one
+ * (64KB) and a shared library (16MB). Kernels must agree on the digest of
+ * every buffer; exits 1 if they don't.
+ */
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+
+#include "sha1.h"
+
+#ifdef _MSC_VER
+#include <windows.h>
+#endif
+
+static const char* const KERNELS[] = {"scalar", "sha-ni", "armv8"};
+static const size_t SIZES[] = {4 << 10, 64 << 10, 16 << 20};
+
+#define NKERNELS (sizeof(KERNELS) / sizeof(KERNELS[0]))
+#define NSIZES (sizeof(SIZES) / sizeof(SIZES[0]))
+
+/* monotonic clock, in seconds */
+
+static double now() {
+#ifdef _MSC_VER
+	LARGE_INTEGER count, freq;
+	QueryPerformanceCounter(&count);
+	QueryPerformanceFrequency(&freq);
+	return (double)count.QuadPart / (double)freq.QuadPart;
+#else
+	struct timespec ts;
+	clock_gettime(CLOCK_MONOTONIC, &ts);
+	return ts.tv_sec + ts.tv_nsec / 1e9;
+#endif
+	}
+
+static void hash(const unsigned char* data, size_t size, SHA1_HASH* digest) {
+	Sha1Context ctx;
+	Sha1Initialise(&ctx);
+	Sha1Update(&ctx, (void*)data, (uint32_t)size);
+	Sha1Finalise(&ctx, digest);
+	}
+
+int main(int argc, char* argv[]) {
+
+	double seconds = argc > 1 ? atof(argv[1]) : 0.5;
+	size_t size = SIZES[NSIZES - 1];
+	unsigned char* data = (unsigned char*)malloc(size);
+	SHA1_HASH expected[NSIZES];
+	int failed = 0;
+
+	if (data == NULL) {
+		fprintf(stderr, "out of memory\n");
+		return 2;
+		}
+	for (size_t i = 0; i < size; i++) {
+		data[i] = (unsigned char)(i * 2654435761u >> 24);
+		}
+
+	Sha1SelectKernel(NULL);
+	printf("default kernel: %s\n\n", Sha1Kernel());
+	printf("%-8s", "kernel");
+	for (size_t s = 0; s < NSIZES; s++) {
+		printf(" %11luK", (unsigned long)(SIZES[s] >> 10));
+		}
+	printf("  (MB/s)\n");
+
+	for (size_t k = 0; k < NKERNELS; k++) {
+		if (Sha1SelectKernel(KERNELS[k]) != 0) {
+			printf("%-8s unavailable\n", KERNELS[k]);
+			continue;
+			}
+		printf("%-8s", KERNELS[k]);
+		for (size_t s = 0; s < NSIZES; s++) {
+			SHA1_HASH digest;
+			hash(data, SIZES[s], &digest);
+			if (k == 0) {
+				expected[s] = digest;
+				}
+			else if (memcmp(&digest, &expected[s], sizeof(digest)) != 0) {
+				printf(" %12s", "MISMATCH");
+				failed = 1;
+				continue;
+				}
+
+			double bytes = 0, start = now(), elapsed;
+			do {
+				hash(data, SIZES[s], &digest);
+				bytes += SIZES[s];
+				elapsed = now() - start;
+				} while (elapsed < seconds);
+			printf(" %12.1f", bytes / elapsed / (1 << 20));
+			}
+		printf("\n");
+		fflush(stdout);
+		}
+
+	free(data);
+	return failed;
+	}
@@ -0,0 +1,310 @@
+#!/usr/bin/env python2.7
+# pylint: disable=C0301
+r""":mod:`bench_startup` - loader startup benchmarks
+===================================================
+
+.. module:: signet.tests.bench_startup
+   :synopsis: measure signet loader startup against plain python
+.. moduleauthor:: Jim Carroll <jim@carroll.com>
+
+Generates synthetic projects (a script importing *n* dependencies of a given
+size, found behind a sys.path of a given depth), builds each one with
+build_signet and times the loader's startup against ``python script.py``.
+
+Each project is timed warm (after an untimed run to fill the page cache) and,
+on posix, cold (after evicting the project, the python executable and it's
+standard library from the page cache with posix_fadvise(POSIX_FADV_DONTNEED)).
+Results are written as JSON, one record per project and build variant, so
+startup can be plotted against the number of SIGS between releases::
+
+    python tests/bench_startup.py --deps 1,10,100,400 --variants default,cache
+        --output bench.json
+
+Copyright(c), 2014, Carroll-Net, Inc.
+All Rights Reserved"""
+# pylint: enable=C0301
+
+# ----------------------------------------------------------------------------
+# Standard library imports
+# ----------------------------------------------------------------------------
+import argparse
+import ctypes
+import ctypes.util
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# ----------------------------------------------------------------------------
+# Module level initializations
+# ----------------------------------------------------------------------------
+__version__ = '2.5.1'
+__author__ = 'Jim Carroll'
+__email__ = 'jim@carroll.com'
+__status__ = 'Testing'
+__copyright__ = 'Copyright(c) 2014, Carroll-Net, Inc., All Rights Reserved'
+
+PARENT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+POSIX_FADV_DONTNEED = 4     # linux value
+
+# build_signet options for each variant
+
+VARIANTS = {
+    'default': {},
+    'cache': {'cache': True},
+    'lazy': {'lazy': True},
+    'freeze': {'freeze': True},
+    'faststart': {'faststart': True},
+    }
+
+SETUP_PY = """\
+from distutils.core import setup, Extension
+from signet.command.build_signet import build_signet
+setup(name = 'hello',
+    cmdclass = {'build_signet': build_signet},
+    options = {'build_signet': %r},
+    ext_modules = [Extension('hello', sources=['hello.py'])],
+)
+"""
+
+def fadvise_func():
+    r"""return libc's posix_fadvise, or None if it's not available"""
+
+    if os.name != 'posix':
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        func = libc.posix_fadvise
+    except (OSError, AttributeError):
+        return None
+    func.argtypes = [ctypes.c_int, ctypes.c_longlong, ctypes.c_longlong,
+                     ctypes.c_int]
+    return func
+
+def evict(paths, fadvise):
+    r"""drop every file under *paths* from the page cache. Dirty pages
+        can't be dropped, so each file is flushed first."""
+
+    for path in paths:
+        if os.path.isfile(path):
+            files = [path]
+        else:
+            files = [os.path.join(dirpath, fname)
+                     for dirpath, _, fnames in os.walk(path)
+                     for fname in fnames]
+        for fname in files:
+            try:
+                fdesc = os.open(fname, os.O_RDONLY)
+            except OSError:
+                continue
+            try:
+                os.fsync(fdesc)
+                fadvise(fdesc, 0, 0, POSIX_FADV_DONTNEED)
+            except OSError:
+                pass
+            finally:
+                os.close(fdesc)
+
+def make_project(dirname, deps, size, depth):
+    r"""write a script importing *deps* modules of about *size* bytes each
+        to *dirname*. The modules are placed in the last of *depth*
+        directories, returned for use as PYTHONPATH."""
+
+    libs = [os.path.join(dirname, 'lib%d' % i) for i in range(depth)]
+    for lib in libs:
+        os.mkdir(lib)
+
+    for i in range(deps):
+        lines = ['r"""synthetic dependency %d"""\n' % i]
+        nbytes = len(lines[0])
+        func = 0
+        while nbytes < size:
+            line = ('def func%d(arg):\n'
+                    '    return arg * %d + len(%r)\n' % (func, func, 'x' * 32))
+            lines.append(line)
+            nbytes += len(line)
+            func += 1
+        with open(os.path.join(libs[-1], 'dep%d.py' % i), 'w') as fout:
+            fout.write(''.join(lines))
+
+    with open(os.path.join(dirname, 'hello.py'), 'w') as fout:
+        for i in range(deps):
+            fout.write('import dep%d\n' % i)
+        fout.write("print('hello')\n")
+
+    return libs
+
+def environment(libs):
+    r"""return environ for building and running a project found on *libs*,
+        using the development version of signet"""
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([PARENT] + libs)
+    for name in ('SIGNET_TRACE', 'SIGNET_LOGLEVEL', 'SIGNETSECURITY'):
+        env.pop(name, None)
+    return env
+
+def build(dirname, options, env):
+    r"""build the loader for the project in *dirname*, returns it's path"""
+
+    with open(os.path.join(dirname, 'setup.py'), 'w') as fout:
+        fout.write(SETUP_PY % options)
+
+    task = subprocess.Popen([sys.executable, 'setup.py', 'build_signet'],
+                            cwd=dirname, env=env, universal_newlines=True,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    (stdout, stderr) = task.communicate()
+    if task.returncode or stderr:
+        raise RuntimeError('build failed in %s\n%s\n%s' %
+                           (dirname, stdout, stderr))
+    return os.path.join(dirname, 'hello')
+
+def count_sigs(dirname, env):
+    r"""return the number of signatures the project's loader embeds"""
+
+    return int(subprocess.check_output(
+        [sys.executable, '-c',
+         'from signet.command.build_signet import module_signatures\n'
+         'print(len(module_signatures("hello.py", False)))\n'],
+        cwd=dirname, env=env))
+
+def timed(command, dirname, env):
+    r"""run *command*, return elapsed seconds"""
+
+    with open(os.devnull, 'w') as devnull:
+        start = time.time()
+        rc = subprocess.call(command, cwd=dirname, env=env, stdout=devnull)
+        elapsed = time.time() - start
+    if rc:
+        raise RuntimeError('%s exited %d' % (' '.join(command), rc))
+    return elapsed
+
+def summary(samples):
+    r"""return min/median/mean of *samples* (seconds) in milliseconds"""
+
+    ordered = sorted(samples)
+    return {
+        'min': round(ordered[0] * 1000, 3),
+        'median': round(ordered[len(ordered) // 2] * 1000, 3),
+        'mean': round(sum(ordered) / len(ordered) * 1000, 3),
+        'samples': [round(sample * 1000, 3) for sample in samples],
+        }
+
+def measure(command, dirname, env, repeat, evicted, fadvise):
+    r"""time *command* warm and (when *fadvise* is available) cold"""
+
+    timed(command, dirname, env)
+    warm = [timed(command, dirname, env) for _ in range(repeat)]
+
+    cold = None
+    if fadvise is not None:
+        cold = []
+        for _ in range(repeat):
+            evict(evicted, fadvise)
+            cold.append(timed(command, dirname, env))
+
+    return {'warm': summary(warm), 'cold': summary(cold) if cold else None}
+
+def benchmark(args):
+    r"""run every project and variant in *args*, return the results"""
+
+    fadvise = None if args.warm_only else fadvise_func()
+    stdlib = os.path.dirname(os.__file__)
+    results = []
+
+    for deps in args.deps:
+        for variant in args.variants:
+            tmpd = tempfile.mkdtemp(prefix='signet-bench-')
+            try:
+                libs = make_project(tmpd, deps, args.size, args.depth)
+                env = environment(libs)
+                exe = build(tmpd, VARIANTS[variant], env)
+                evicted = [tmpd, stdlib, os.path.realpath(sys.executable)]
+
+                result = {
+                    'variant': variant,
+                    'deps': deps,
+                    'size': args.size,
+                    'depth': args.depth,
+                    'sigs': count_sigs(tmpd, env),
+                    'python': measure([sys.executable, 'hello.py'], tmpd,
+                                      env, args.repeat, evicted, fadvise),
+                    'loader': measure([exe], tmpd, env, args.repeat,
+                                      evicted, fadvise),
+                    }
+                results.append(result)
+                sys.stderr.write(
+                    '%-8s deps=%-5d sigs=%-5d python %8.2fms loader %8.2fms'
+                    ' (warm median)\n' % (variant, deps, result['sigs'],
+                    result['python']['warm']['median'],
+                    result['loader']['warm']['median']))
+            finally:
+                shutil.rmtree(tmpd)
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'cold': fadvise is not None,
+        'results': results,
+        }
+
+def main():
+    r"""parse command line and run the benchmarks"""
+
+    def int_list(text):
+        r"""comma separated integers"""
+        return [int(item) for item in text.split(',')]
+
+    def variant_list(text):
+        r"""comma separated variant names"""
+        names = text.split(',')
+        for name in names:
+            if name not in VARIANTS:
+                raise argparse.ArgumentTypeError(
+                    'unknown variant %s (choose from %s)' %
+                    (name, ', '.join(sorted(VARIANTS))))
+        return names
+
+    parser = argparse.ArgumentParser(
+        description='measure signet loader startup against plain python')
+    parser.add_argument('--deps', type=int_list, default=[1, 10, 50, 100],
+                        help='dependency counts to benchmark (default '
+                        '1,10,50,100)')
+    parser.add_argument('--size', type=int, default=4096,
+                        help='approximate size of each dependency in bytes '
+                        '(default 4096)')
+    parser.add_argument('--depth', type=int, default=1,
+                        help='number of sys.path entries searched to find '
+                        'the dependencies (default 1)')
+    parser.add_argument('--variants', type=variant_list, default=['default'],
+                        help='build variants to benchmark, from %s '
+                        '(default default)' % ', '.join(sorted(VARIANTS)))
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='timed runs per measurement (default 5)')
+    parser.add_argument('--warm-only', action='store_true',
+                        help='skip cold cache measurements')
+    parser.add_argument('--output', default='-',
+                        help='file to write the JSON results to (default '
+                        'stdout)')
+    args = parser.parse_args()
+    if args.depth < 1 or args.repeat < 1:
+        parser.error('--depth and --repeat must be at least 1')
+
+    results = benchmark(args)
+
+    if args.output == '-':
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        with open(args.output, 'w') as fout:
+            json.dump(results, fout, indent=2, sort_keys=True)
+            fout.write('\n')
+
+if __name__ == '__main__':
+    main()
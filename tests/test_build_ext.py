@@ -14,11 +14,16 @@ All Rights Reserved"""
 # ----------------------------------------------------------------------------
 # Standard library imports
 # ----------------------------------------------------------------------------
+import ctypes
+import ctypes.util
+import json
 import os
 import shutil
+import socket
 import subprocess
 import sys
 import tempfile
+import time
 import unittest
 
 # ----------------------------------------------------------------------------
@@ -76,6 +81,40 @@ def run_setup(dirname, cmd, opts=None, debug=False):
         else:
             del os.environ['PYTHONPATH']
 
+def io_uring_available():
+    r"""return True if the kernel has an io_uring that supports the
+        OPENAT and READ operations (as the loader's --uring requires)"""
+
+    if not sys.platform.startswith('linux'):
+        return False
+
+    # io_uring_setup(2) and io_uring_register(2) have the same numbers on
+    # every architecture (the generic syscall table)
+
+    nr_setup, nr_register = 425, 427
+    register_probe, op_openat, op_read, op_supported = 8, 18, 22, 1
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    except OSError:
+        return False
+    params = ctypes.create_string_buffer(120)
+    ring = libc.syscall(nr_setup, 1, params)
+    if ring < 0:
+        return False
+    try:
+        ops = 256
+        probe = ctypes.create_string_buffer(16 + 8 * ops)
+        if libc.syscall(nr_register, ring, register_probe, probe, ops) < 0:
+            return False
+        last_op = ord(probe[0])
+        for op in (op_openat, op_read):
+            if op > last_op or not ord(probe[16 + 8 * op + 2]) & op_supported:
+                return False
+        return True
+    finally:
+        os.close(ring)
+
 class TestBuildSignet(unittest.TestCase):
     r"""test the signet.command.build_signet class"""
 
@@ -326,79 +365,1453 @@ class TestBuildSignet(unittest.TestCase):
             subprocess.check_output([exe], universal_newlines=True),
             "hello world\n")
 
-    def test_detection_levels(self):
-        r"""test alternate detection levels 3, 1 & 0 (omit 2)"""
-
-        # Generate signet loader
+    def test_prevalidate(self):
+        r"""confirm pre-interpreter validation detects tampering"""
 
         hello_py = os.path.join(self.tmpd, 'hello.py')
+        world_py = os.path.join(self.tmpd, 'world.py')
         setup_py = os.path.join(self.tmpd, 'setup.py')
 
         with open(hello_py, 'w') as fout:
-            fout.write("print('Hello world')\n")
+            fout.write("import world\n")
+        with open(world_py, 'w') as fout:
+            fout.write("print('hello world')\n")
         with open(setup_py, 'w') as fout:
             fout.write(
                 "from distutils.core import setup, Extension\n"
                 "from signet.command.build_signet import build_signet\n"
                 "setup(name = 'hello',\n"
-                "    cmdclass = {'build_signet':build_signet},\n"
+                "    cmdclass = {'build_signet': build_signet},\n"
                 "    ext_modules = [Extension('hello', \n"
                 "                      sources=['hello.py'])],\n"
                 ")\n"
                 )
 
-        (rc, stdout, stderr) = run_setup(self.tmpd, 'build_signet')
+        (rc, stdout, stderr) = run_setup(self.tmpd, 'build_signet',
+                                ['--prevalidate'])
         if rc or stderr:
             self.fail(stdout + "\n" + stderr)
 
-        # tamper with the SCRIPT
-
-        with open(hello_py, 'a') as fout:
-            fout.write('\n')
-
-        # run the signet loader
-
         if os.name == 'nt':
             exe = 'hello.exe'
         else:
             exe = 'hello'
+        exe = os.path.join(self.tmpd, exe)
 
-        # Confirm signed detection
+        self.assertEqual(
+            subprocess.check_output([exe], universal_newlines=True),
+            "hello world\n")
 
-        task = subprocess.Popen([os.path.join(self.tmpd, exe), '--SECURITYMAX'],
+        # tamper with the dependency
+
+        with open(world_py, 'a') as fout:
+            fout.write('\n')
+
+        task = subprocess.Popen([exe],
                 universal_newlines=True,
                 stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        (_, stderr) = task.communicate()
-        self.assertNotEqual(task.returncode, 0, "signed detection failed")
-        self.assertTrue(stderr and
-                'SECURITY MAXIMUM Enabled' in stderr and
-                'SECURITY WARNING:' in stderr,
+        (stdout, stderr) = task.communicate()
+        self.assertNotEqual(task.returncode, 0, "tamper detection failed")
+        self.assertFalse(stdout, "tampered dependency was run")
+        self.assertTrue(stderr and stderr.startswith('SECURITY VIOLATION:'),
                 "unrecognized tampered output %s" % stderr)
 
-        # Confirm warn only
+    @unittest.skipIf(os.name == 'nt', 'requires posix')
+    def test_cache(self):
+        r"""confirm cached digests never hide tampering"""
 
-        task = subprocess.Popen(
-                [os.path.join(self.tmpd, exe), '--SECURITYWARN'],
+        hello_py = os.path.join(self.tmpd, 'hello.py')
+        world_py = os.path.join(self.tmpd, 'world.py')
+        setup_py = os.path.join(self.tmpd, 'setup.py')
+        cache_dir = os.path.join(self.tmpd, 'cache')
+
+        with open(hello_py, 'w') as fout:
+            fout.write("import json, signet\n"
+                       "import world\n"
+                       "print(json.dumps(signet.stats()['cached']))\n")
+        with open(world_py, 'w') as fout:
+            fout.write("print('hello world')\n")
+        with open(setup_py, 'w') as fout:
+            fout.write(
+                "from distutils.core import setup, Extension\n"
+                "from signet.command.build_signet import build_signet\n"
+                "setup(name = 'hello',\n"
+                "    cmdclass = {'build_signet': build_signet},\n"
+                "    options = {'build_signet': {\n"
+                "                   'cache': True,\n"
+                "                   },\n"
+                "              },\n"
+                "    ext_modules = [Extension('hello', \n"
+                "                      sources=['hello.py'])],\n"
+                ")\n"
+                )
+
+        (rc, stdout, stderr) = run_setup(self.tmpd, 'build_signet')
+        if rc or stderr:
+            self.fail(stdout + "\n" + stderr)
+
+        exe = os.path.join(self.tmpd, 'hello')
+        env = dict(os.environ, XDG_CACHE_HOME=cache_dir)
+
+        # cold, then warm start, which takes world's digest from the cache
+
+        for cached in ('0', '1'):
+            self.assertEqual(
+                subprocess.check_output([exe], env=env,
+                    universal_newlines=True),
+                "hello world\n%s\n" % cached)
+        self.assertEqual(len([f for f in
+            os.listdir(os.path.join(cache_dir, 'signet'))
+            if f.endswith('.cache')]), 1)
+
+        # tamper with the dependency
+
+        with open(world_py, 'rb') as fin:
+            original = fin.read()
+        with open(world_py, 'a') as fout:
+            fout.write('\n')
+
+        task = subprocess.Popen([exe], env=env,
                 universal_newlines=True,
                 stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        (_, stderr) = task.communicate()
-        self.assertEqual(task.returncode, 0, "warn only failed")
-        self.assertTrue(stderr and
-                'SECURITY DISABLED' in stderr and
-                'SECURITY WARNING:' in stderr and
-                'SECURITY VIOLATION:' in stderr,
+        (stdout, stderr) = task.communicate()
+        self.assertNotEqual(task.returncode, 0, "tamper detection failed")
+        self.assertTrue(stderr and stderr.startswith('SECURITY VIOLATION:'),
                 "unrecognized tampered output %s" % stderr)
 
-        # Confirm disabled security
+        # once changed, world is hashed again (even with it's contents
+        # restored), not taken from the cache
 
-        task = subprocess.Popen([os.path.join(self.tmpd, exe), '--SECURITYOFF'],
+        with open(world_py, 'wb') as fout:
+            fout.write(original)
+
+        self.assertEqual(
+            subprocess.check_output([exe], env=env, universal_newlines=True),
+            "hello world\n0\n")
+
+    def test_sig_table(self):
+        r"""confirm the loader finds each module of a SIGS table built from
+            many dependencies (imported out of order, with shared name
+            prefixes), misses absent ones, and detects tampering with an
+            entry in the middle of the table"""
+
+        hello_py = os.path.join(self.tmpd, 'hello.py')
+        setup_py = os.path.join(self.tmpd, 'setup.py')
+
+        names = ['zeta', 'alpha', 'alphabet', 'alp', 'mu', 'beta', 'omega',
+                 'delta', 'kappa', 'gamma', 'pi', 'epsilon', 'lam', 'sigma',
+                 'omicron', 'al']
+        absent = ['a', 'alph', 'alphabets', 'm', 'kappa2', 'zz', 'zeta.x']
+        for name in names:
+            with open(os.path.join(self.tmpd, name + '.py'), 'w') as fout:
+                fout.write("NAME = %r\n" % name)
+        with open(hello_py, 'w') as fout:
+            fout.write("import json, signet\n"
+                       "import %s\n"
+                       "try:\n"
+                       "    import _signet\n"
+                       "    signed = [_signet.signed(name) for name in %r]\n"
+                       "except ImportError:\n"
+                       "    signed = None\n"
+                       "print(json.dumps([[sig[1] for sig in "
+                       "signet.signatures()], signed]))\n"
+                       % (', '.join(names), names + absent))
+
+        ordered = sorted(names)
+        middle = os.path.join(self.tmpd, ordered[len(ordered) // 2] + '.py')
+        exe = os.path.join(self.tmpd, 'hello')
+
+        for lazy in (False, True):
+            with open(setup_py, 'w') as fout:
+                fout.write(
+                    "from distutils.core import setup, Extension\n"
+                    "from signet.command.build_signet import build_signet\n"
+                    "setup(name = 'hello',\n"
+                    "    cmdclass = {'build_signet': build_signet},\n"
+                    "    options = {'build_signet': {'lazy': %r}},\n"
+                    "    ext_modules = [Extension('hello', \n"
+                    "                      sources=['hello.py'])],\n"
+                    ")\n" % lazy
+                    )
+            with open(middle, 'w') as fout:
+                fout.write("NAME = %r\n" % ordered[len(ordered) // 2])
+
+            (rc, stdout, stderr) = run_setup(self.tmpd, 'build_signet',
+                    ['--force'])
+            if rc or stderr:
+                self.fail(stdout + "\n" + stderr)
+
+            sigs, signed = json.loads(subprocess.check_output([exe],
+                    universal_newlines=True))
+            self.assertEqual([name for name in sigs if name in names],
+                             ordered)
+            if lazy:
+                self.assertEqual(signed, [True] * len(names) +
+                                 [False] * len(absent))
+
+            # tamper with the entry in the middle of the table
+
+            with open(middle, 'a') as fout:
+                fout.write("\n")
+
+            task = subprocess.Popen([exe], universal_newlines=True,
+                    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            (stdout, stderr) = task.communicate()
+            self.assertNotEqual(task.returncode, 0, "tamper detection failed")
+            self.assertTrue(stderr.startswith('SECURITY VIOLATION:'),
+                    "unrecognized tampered output %s" % stderr)
+            self.assertIn(os.path.basename(middle), stderr)
+
+    def test_lazy(self):
+        r"""confirm lazy loaders only verify the modules imported, and exit
+            on tampering while another thread is blocked reading stdin"""
+
+        hello_py = os.path.join(self.tmpd, 'hello.py')
+        world_py = os.path.join(self.tmpd, 'world.py')
+        setup_py = os.path.join(self.tmpd, 'setup.py')
+
+        with open(hello_py, 'w') as fout:
+            fout.write("import sys, threading, time\n"
+                       "if 'blocked' in sys.argv:\n"
+                       "    reader = threading.Thread(\n"
+                       "        target=sys.stdin.readline)\n"
+                       "    reader.daemon = True\n"
+                       "    reader.start()\n"
+                       "    time.sleep(0.5)\n"
+                       "if 'world' in sys.argv:\n"
+                       "    import world\n"
+                       "print('hello')\n")
+        with open(world_py, 'w') as fout:
+            fout.write("print('world')\n")
+        with open(setup_py, 'w') as fout:
+            fout.write(
+                "from distutils.core import setup, Extension\n"
+                "from signet.command.build_signet import build_signet\n"
+                "setup(name = 'hello',\n"
+                "    cmdclass = {'build_signet': build_signet},\n"
+                "    options = {'build_signet': {\n"
+                "                   'lazy': True,\n"
+                "                   },\n"
+                "              },\n"
+                "    ext_modules = [Extension('hello', \n"
+                "                      sources=['hello.py'])],\n"
+                ")\n"
+                )
+
+        (rc, stdout, stderr) = run_setup(self.tmpd, 'build_signet')
+        if rc or stderr:
+            self.fail(stdout + "\n" + stderr)
+
+        exe = os.path.join(self.tmpd, 'hello')
+
+        self.assertEqual(
+            subprocess.check_output([exe, 'world'], universal_newlines=True),
+            "world\nhello\n")
+
+        # tamper with the dependency, harmless until it's imported
+
+        with open(world_py, 'a') as fout:
+            fout.write('\n')
+
+        self.assertEqual(
+            subprocess.check_output([exe], universal_newlines=True),
+            "hello\n")
+
+        task = subprocess.Popen([exe, 'world'],
                 universal_newlines=True,
                 stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        (_, stderr) = task.communicate()
-        self.assertEqual(task.returncode, 0, "warn only failed")
-        self.assertTrue(stderr and 'SECURITY DISABLED' in stderr,
+        (stdout, stderr) = task.communicate()
+        self.assertNotEqual(task.returncode, 0, "tamper detection failed")
+        self.assertEqual(stdout, "", "tampered module was run")
+        self.assertTrue(stderr and stderr.startswith('SECURITY VIOLATION:'),
                 "unrecognized tampered output %s" % stderr)
 
+        # the reader holds stdin's lock, which the exit must not wait on
+
+        (rfd, wfd) = os.pipe()
+        try:
+            task = subprocess.Popen([exe, 'world', 'blocked'], stdin=rfd,
+                    universal_newlines=True,
+                    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            for _ in range(100):
+                if task.poll() is not None:
+                    break
+                time.sleep(0.1)
+            if task.poll() is None:
+                task.kill()
+            (stdout, stderr) = task.communicate()
+        finally:
+            os.close(rfd)
+            os.close(wfd)
+        self.assertNotIn(task.returncode, (0, -9), "tamper detection failed")
+        self.assertEqual(stdout, "", "tampered module was run")
+        self.assertTrue(stderr.startswith('SECURITY VIOLATION:'), stderr)
+
+    @unittest.skipIf(os.name == 'nt', 'requires posix')
+    def test_bytecode(self):
+        r"""confirm the embedded bytecode only runs for a verified script"""
+
+        hello_py = os.path.join(self.tmpd, 'hello.py')
+        setup_py = os.path.join(self.tmpd, 'setup.py')
+
+        with open(hello_py, 'w') as fout:
+            fout.write("from __future__ import print_function\n"
+                       "print('hello', 'world')\n")
+        with open(setup_py, 'w') as fout:
+            fout.write(
+                "from distutils.core import setup, Extension\n"
+                "from signet.command.build_signet import build_signet\n"
+                "setup(name = 'hello',\n"
+                "    cmdclass = {'build_signet': build_signet},\n"
+                "    ext_modules = [Extension('hello', \n"
+                "                      sources=['hello.py'])],\n"
+                ")\n"
+                )
+
+        (rc, stdout, stderr) = run_setup(self.tmpd, 'build_signet')
+        if rc or stderr:
+            self.fail(stdout + "\n" + stderr)
+
+        exe = os.path.join(self.tmpd, 'hello')
+        env = dict(os.environ, SIGNET_LOGLEVEL='10')
+
+        task = subprocess.Popen([exe], env=env,
+                universal_newlines=True,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        (stdout, stderr) = task.communicate()
+        self.assertEqual(stdout, "hello world\n")
+        self.assertIn("running embedded bytecode", stderr)
+
+        # a modified script (with tamper detection at warn) runs as modified
+
+        with open(hello_py, 'a') as fout:
+            fout.write("print('again')\n")
+
+        env['SIGNETSECURITY'] = 'WARN'
+        task = subprocess.Popen([exe], env=env,
+                universal_newlines=True,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        (stdout, stderr) = task.communicate()
+        self.assertEqual(stdout, "hello world\nagain\n")
+        self.assertNotIn("running embedded bytecode", stderr)
+
+    @unittest.skipIf(os.name == 'nt', 'requires posix')
+    def test_freeze(self):
+        r"""confirm frozen dependencies are imported from the loader"""
+
+        hello_py = os.path.join(self.tmpd, 'hello.py')
+        world_py = os.path.join(self.tmpd, 'world.py')
+        setup_py = os.path.join(self.tmpd, 'setup.py')
+
+        with open(hello_py, 'w') as fout:
+            fout.write("import world\n")
+        with open(world_py, 'w') as fout:
+            fout.write("print('hello world')\n")
+        with open(setup_py, 'w') as fout:
+            fout.write(
+                "from distutils.core import setup, Extension\n"
+                "from signet.command.build_signet import build_signet\n"
+                "setup(name = 'hello',\n"
+                "    cmdclass = {'build_signet': build_signet},\n"
+                "    options = {'build_signet': {\n"
+                "                   'freeze': True,\n"
+                "                   },\n"
+                "              },\n"
+                "    ext_modules = [Extension('hello', \n"
+                "                      sources=['hello.py'])],\n"
+                ")\n"
+                )
+
+        (rc, stdout, stderr) = run_setup(self.tmpd, 'build_signet')
+        if rc or stderr:
+            self.fail(stdout + "\n" + stderr)
+
+        exe = os.path.join(self.tmpd, 'hello')
+
+        # the copy on disk is never used
+
+        with open(world_py, 'w') as fout:
+            fout.write("print('tampered')\n")
+
+        self.assertEqual(
+            subprocess.check_output([exe], universal_newlines=True),
+            "hello world\n")
+
+        os.remove(world_py)
+        self.assertEqual(
+            subprocess.check_output([exe], universal_newlines=True),
+            "hello world\n")
+
+    def test_trace(self):
+        r"""confirm SIGNET_TRACE records the loader's startup timeline"""
+
+        hello_py = os.path.join(self.tmpd, 'hello.py')
+        world_py = os.path.join(self.tmpd, 'world.py')
+        setup_py = os.path.join(self.tmpd, 'setup.py')
+        trace = os.path.join(self.tmpd, 'trace.jsonl')
+
+        with open(hello_py, 'w') as fout:
+            fout.write("import world\n"
+                       "print('hello')\n")
+        with open(world_py, 'w') as fout:
+            fout.write("print('world')\n")
+        with open(setup_py, 'w') as fout:
+            fout.write(
+                "from distutils.core import setup, Extension\n"
+                "from signet.command.build_signet import build_signet\n"
+                "setup(name = 'hello',\n"
+                "    cmdclass = {'build_signet': build_signet},\n"
+                "    ext_modules = [Extension('hello', \n"
+                "                      sources=['hello.py'])],\n"
+                ")\n"
+                )
+
+        (rc, stdout, stderr) = run_setup(self.tmpd, 'build_signet')
+        if rc or stderr:
+            self.fail(stdout + "\n" + stderr)
+
+        exe = os.path.join(self.tmpd, 'hello')
+        env = dict(os.environ, SIGNET_TRACE=trace)
+        self.assertEqual(
+            subprocess.check_output([exe], env=env, universal_newlines=True),
+            "world\nhello\n")
+
+        with open(trace) as fin:
+            events = [json.loads(line) for line in fin]
+
+        names = [event['event'] for event in events]
+        for name in ('executable', 'read_script', 'py_initialize',
+                     'validate', 'run_script', 'finalize'):
+            self.assertIn(name, names)
+
+        hashed = dict((event['path'], event['bytes']) for event in events
+                      if event['event'] == 'hash')
+        self.assertEqual(hashed[world_py], os.path.getsize(world_py))
+
+        imported = [event['module'] for event in events
+                    if event['event'] == 'import']
+        self.assertIn('world', imported)
+
+    def test_budget(self):
+        r"""confirm deferred verification still catches tampering, and
+            critical modules are verified before the script runs"""
+
+        hello_py = os.path.join(self.tmpd, 'hello.py')
+        world_py = os.path.join(self.tmpd, 'world.py')
+        crit_py = os.path.join(self.tmpd, 'crit.py')
+        setup_py = os.path.join(self.tmpd, 'setup.py')
+
+        with open(hello_py, 'w') as fout:
+            fout.write("import crit\n"
+                       "import world\n"
+                       "print('hello')\n")
+        with open(world_py, 'w') as fout:
+            fout.write("print('world')\n")
+        with open(crit_py, 'w') as fout:
+            fout.write("print('crit')\n")
+        with open(setup_py, 'w') as fout:
+            fout.write(
+                "from distutils.core import setup, Extension\n"
+                "from signet.command.build_signet import build_signet\n"
+                "setup(name = 'hello',\n"
+                "    cmdclass = {'build_signet': build_signet},\n"
+                "    options = {'build_signet': {\n"
+                "                   'budget': '0',\n"
+                "                   'critical': 'crit',\n"
+                "                   },\n"
+                "              },\n"
+                "    ext_modules = [Extension('hello', \n"
+                "                      sources=['hello.py'])],\n"
+                ")\n"
+                )
+
+        (rc, stdout, stderr) = run_setup(self.tmpd, 'build_signet')
+        if rc or stderr:
+            self.fail(stdout + "\n" + stderr)
+
+        exe = os.path.join(self.tmpd, 'hello')
+
+        self.assertEqual(
+            subprocess.check_output([exe], universal_newlines=True),
+            "crit\nworld\nhello\n")
+
+        # tampering found in the background terminates the process
+
+        with open(world_py, 'a') as fout:
+            fout.write("print('tampered')\n")
+
+        task = subprocess.Popen([exe], universal_newlines=True,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        (stdout, stderr) = task.communicate()
+        self.assertNotEqual(task.returncode, 0, "tamper detection failed")
+        self.assertIn('SECURITY VIOLATION:', stderr)
+
+        # a tampered critical module stops the script before it runs
+
+        with open(world_py, 'w') as fout:
+            fout.write("print('world')\n")
+        with open(crit_py, 'a') as fout:
+            fout.write("print('tampered')\n")
+
+        task = subprocess.Popen([exe], universal_newlines=True,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        (stdout, stderr) = task.communicate()
+        self.assertNotEqual(task.returncode, 0, "tamper detection failed")
+        self.assertEqual(stdout, "", "tampered module was run")
+        self.assertTrue(stderr.startswith('SECURITY VIOLATION:'),
+                "unrecognized tampered output %s" % stderr)
+
+    @unittest.skipIf(os.name == 'nt', 'requires posix')
+    def test_budget_exit(self):
+        r"""confirm the digests verified in the background are cached when
+            the script ends with sys.exit()"""
+
+        hello_py = os.path.join(self.tmpd, 'hello.py')
+        world_py = os.path.join(self.tmpd, 'world.py')
+        setup_py = os.path.join(self.tmpd, 'setup.py')
+        cache_dir = os.path.join(self.tmpd, 'cache')
+
+        with open(hello_py, 'w') as fout:
+            fout.write("import sys\n"
+                       "import world\n"
+                       "sys.exit(5)\n")
+        with open(world_py, 'w') as fout:
+            fout.write("WORLD = 1\n")
+        with open(setup_py, 'w') as fout:
+            fout.write(
+                "from distutils.core import setup, Extension\n"
+                "from signet.command.build_signet import build_signet\n"
+                "setup(name = 'hello',\n"
+                "    cmdclass = {'build_signet': build_signet},\n"
+                "    options = {'build_signet': {\n"
+                "                   'budget': '0',\n"
+                "                   'cache': True,\n"
+                "                   },\n"
+                "              },\n"
+                "    ext_modules = [Extension('hello', \n"
+                "                      sources=['hello.py'])],\n"
+                ")\n"
+                )
+
+        (rc, stdout, stderr) = run_setup(self.tmpd, 'build_signet')
+        if rc or stderr:
+            self.fail(stdout + "\n" + stderr)
+
+        exe = os.path.join(self.tmpd, 'hello')
+        env = dict(os.environ, XDG_CACHE_HOME=cache_dir)
+
+        task = subprocess.Popen([exe], env=env, universal_newlines=True,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        (stdout, stderr) = task.communicate()
+        self.assertEqual(task.returncode, 5, stderr)
+        self.assertEqual(len([f for f in
+            os.listdir(os.path.join(cache_dir, 'signet'))
+            if f.endswith('.cache')]), 1)
+
+    def test_runtime_module(self):
+        r"""confirm the script can re-verify it's dependencies, and read
+            the signatures and stats, through the signet module"""
+
+        hello_py = os.path.join(self.tmpd, 'hello.py')
+        world_py = os.path.join(self.tmpd, 'world.py')
+        setup_py = os.path.join(self.tmpd, 'setup.py')
+
+        with open(hello_py, 'w') as fout:
+            fout.write("import json, os\n"
+                       "import world\n"
+                       "import signet\n"
+                       "before = signet.verify(threads=2)\n"
+                       "path = os.path.splitext(world.__file__)[0] + '.py'\n"
+                       "with open(path, 'a') as fout:\n"
+                       "    fout.write('# tampered\\n')\n"
+                       "print(json.dumps({\n"
+                       "    'before': before,\n"
+                       "    'after': signet.verify(paths=[path]),\n"
+                       "    'modules': [sig[1] for sig in signet.signatures()],\n"
+                       "    'stats': signet.stats(),\n"
+                       "    }))\n")
+        with open(world_py, 'w') as fout:
+            fout.write("WORLD = 1\n")
+        with open(setup_py, 'w') as fout:
+            fout.write(
+                "from distutils.core import setup, Extension\n"
+                "from signet.command.build_signet import build_signet\n"
+                "setup(name = 'hello',\n"
+                "    cmdclass = {'build_signet': build_signet},\n"
+                "    ext_modules = [Extension('hello', \n"
+                "                      sources=['hello.py'])],\n"
+                ")\n"
+                )
+
+        (rc, stdout, stderr) = run_setup(self.tmpd, 'build_signet')
+        if rc or stderr:
+            self.fail(stdout + "\n" + stderr)
+
+        exe = os.path.join(self.tmpd, 'hello')
+        task = subprocess.Popen([exe], universal_newlines=True,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        (stdout, stderr) = task.communicate()
+        self.assertEqual(task.returncode, 0, stderr)
+
+        result = json.loads(stdout)
+        self.assertEqual(result['before'], [])
+        self.assertEqual([os.path.basename(path) for path in result['after']],
+                ['world.py'])
+        self.assertIn('SECURITY VIOLATION:', stderr)
+        self.assertEqual(result['modules'], sorted(result['modules']))
+        self.assertIn('world', result['modules'])
+        self.assertGreater(result['stats']['files'], 0)
+        self.assertGreater(result['stats']['bytes'], 0)
+        self.assertGreater(result['stats']['startup_ms'], 0)
+
+    @unittest.skipIf(not sys.platform.startswith('linux'), 'requires linux')
+    def test_watch(self):
+        r"""confirm a dependency tampered with while the script runs
+            terminates it, and that a script calling sys.exit() exits"""
+
+        hello_py = os.path.join(self.tmpd, 'hello.py')
+        world_py = os.path.join(self.tmpd, 'world.py')
+        setup_py = os.path.join(self.tmpd, 'setup.py')
+
+        with open(hello_py, 'w') as fout:
+            fout.write("import sys\n"
+                       "import world\n"
+                       "print('started')\n"
+                       "sys.stdout.flush()\n"
+                       "line = sys.stdin.readline()\n"
+                       "if line.strip():\n"
+                       "    sys.exit(int(line))\n"
+                       "print('finished')\n")
+        with open(world_py, 'w') as fout:
+            fout.write("WORLD = 1\n")
+        with open(setup_py, 'w') as fout:
+            fout.write(
+                "from distutils.core import setup, Extension\n"
+                "from signet.command.build_signet import build_signet\n"
+                "setup(name = 'hello',\n"
+                "    cmdclass = {'build_signet': build_signet},\n"
+                "    options = {'build_signet': {'watch': True}},\n"
+                "    ext_modules = [Extension('hello', \n"
+                "                      sources=['hello.py'])],\n"
+                ")\n"
+                )
+
+        (rc, stdout, stderr) = run_setup(self.tmpd, 'build_signet')
+        if rc or stderr:
+            self.fail(stdout + "\n" + stderr)
+
+        exe = os.path.join(self.tmpd, 'hello')
+
+        # sys.exit() stops the watchdog on the way out
+
+        task = subprocess.Popen([exe], universal_newlines=True,
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE)
+        self.assertEqual(task.stdout.readline(), 'started\n')
+        task.stdin.write('3\n')
+        task.stdin.flush()
+        for _ in range(100):
+            if task.poll() is not None:
+                break
+            time.sleep(0.1)
+        if task.poll() is None:
+            task.kill()
+        (stdout, stderr) = task.communicate()
+        self.assertEqual(task.returncode, 3, stderr)
+
+        task = subprocess.Popen([exe], universal_newlines=True,
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE)
+        self.assertEqual(task.stdout.readline(), 'started\n')
+
+        # the script is waiting on stdin, only the watchdog can end it
+
+        with open(world_py, 'a') as fout:
+            fout.write("print('tampered')\n")
+        for _ in range(100):
+            if task.poll() is not None:
+                break
+            time.sleep(0.1)
+        (stdout, stderr) = task.communicate('\n')
+
+        self.assertNotEqual(task.returncode, 0, "tamper detection failed")
+        self.assertEqual(stdout, "", "script finished after tampering")
+        self.assertIn('SECURITY VIOLATION:', stderr)
+
+    @unittest.skipIf(not sys.platform.startswith('linux'), 'requires linux')
+    def test_watch_open_writer(self):
+        r"""confirm a dependency written through a descriptor that is kept
+            open while the script runs terminates it"""
+
+        hello_py = os.path.join(self.tmpd, 'hello.py')
+        world_py = os.path.join(self.tmpd, 'world.py')
+        setup_py = os.path.join(self.tmpd, 'setup.py')
+
+        with open(hello_py, 'w') as fout:
+            fout.write("import sys\n"
+                       "import world\n"
+                       "print('started')\n"
+                       "sys.stdout.flush()\n"
+                       "sys.stdin.readline()\n"
+                       "print('finished')\n")
+        with open(world_py, 'w') as fout:
+            fout.write("WORLD = 1\n")
+        with open(setup_py, 'w') as fout:
+            fout.write(
+                "from distutils.core import setup, Extension\n"
+                "from signet.command.build_signet import build_signet\n"
+                "setup(name = 'hello',\n"
+                "    cmdclass = {'build_signet': build_signet},\n"
+                "    options = {'build_signet': {'watch': True}},\n"
+                "    ext_modules = [Extension('hello', \n"
+                "                      sources=['hello.py'])],\n"
+                ")\n"
+                )
+
+        (rc, stdout, stderr) = run_setup(self.tmpd, 'build_signet')
+        if rc or stderr:
+            self.fail(stdout + "\n" + stderr)
+
+        exe = os.path.join(self.tmpd, 'hello')
+        task = subprocess.Popen([exe], universal_newlines=True,
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE)
+        self.assertEqual(task.stdout.readline(), 'started\n')
+
+        # rewrite world in place, and keep it open until the watchdog acts
+
+        fd = os.open(world_py, os.O_RDWR)
+        try:
+            os.write(fd, b"WORLD = 2\n")
+            for _ in range(100):
+                if task.poll() is not None:
+                    break
+                time.sleep(0.1)
+            self.assertIsNotNone(task.poll(), "tamper detection failed")
+        finally:
+            os.close(fd)
+        (stdout, stderr) = task.communicate('\n')
+
+        self.assertNotEqual(task.returncode, 0, "tamper detection failed")
+        self.assertEqual(stdout, "", "script finished after tampering")
+        self.assertIn('SECURITY VIOLATION:', stderr)
+
+    def test_faststart(self):
+        r"""confirm a fast start loader skips site and the PYTHON*
+            environment, and runs with the embedded sys.path"""
+
+        hello_py = os.path.join(self.tmpd, 'hello.py')
+        world_py = os.path.join(self.tmpd, 'world.py')
+        setup_py = os.path.join(self.tmpd, 'setup.py')
+
+        with open(hello_py, 'w') as fout:
+            fout.write("import json, sys\n"
+                       "import world\n"
+                       "print(json.dumps([sys.flags.no_site,\n"
+                       "    'site' in sys.modules, sys.path]))\n")
+        with open(world_py, 'w') as fout:
+            fout.write("WORLD = 1\n")
+        with open(setup_py, 'w') as fout:
+            fout.write(
+                "from distutils.core import setup, Extension\n"
+                "from signet.command.build_signet import build_signet\n"
+                "setup(name = 'hello',\n"
+                "    cmdclass = {'build_signet': build_signet},\n"
+                "    options = {'build_signet': {'faststart': True}},\n"
+                "    ext_modules = [Extension('hello', \n"
+                "                      sources=['hello.py'])],\n"
+                ")\n"
+                )
+
+        (rc, stdout, stderr) = run_setup(self.tmpd, 'build_signet')
+        if rc or stderr:
+            self.fail(stdout + "\n" + stderr)
+
+        exe = os.path.join(self.tmpd, 'hello')
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.path.join(self.tmpd, 'ignored')
+
+        (no_site, site, path) = json.loads(subprocess.check_output([exe],
+                universal_newlines=True, env=env))
+        self.assertEqual((no_site, site), (1, False))
+        self.assertEqual(path[0], os.path.realpath(self.tmpd))
+        self.assertNotIn(env['PYTHONPATH'], path)
+
+        # SIGNET_FASTSTART=OFF starts python as usual
+
+        env['SIGNET_FASTSTART'] = 'OFF'
+        (no_site, site, path) = json.loads(subprocess.check_output([exe],
+                universal_newlines=True, env=env))
+        self.assertEqual((no_site, site), (0, True))
+        self.assertIn(env['PYTHONPATH'], path)
+
+    def test_multicall(self):
+        r"""confirm a multi-call loader runs the script it's invoked as, and
+            only verifies that script's dependencies"""
+
+        for name, source in (
+                ('first.py', "import shared\nprint('first')\n"),
+                ('second.py', "import shared\nimport extra\n"
+                              "print('second')\n"),
+                ('shared.py', "SHARED = 1\n"),
+                ('extra.py', "EXTRA = 1\n")):
+            with open(os.path.join(self.tmpd, name), 'w') as fout:
+                fout.write(source)
+
+        with open(os.path.join(self.tmpd, 'setup.py'), 'w') as fout:
+            fout.write(
+                "from distutils.core import setup, Extension\n"
+                "from signet.command.build_signet import build_signet\n"
+                "setup(name = 'tools',\n"
+                "    cmdclass = {'build_signet': build_signet},\n"
+                "    options = {'build_signet': {'multicall': 'tools'}},\n"
+                "    ext_modules = [Extension('first', \n"
+                "                      sources=['first.py']),\n"
+                "                   Extension('second', \n"
+                "                      sources=['second.py'])],\n"
+                ")\n"
+                )
+
+        (rc, stdout, stderr) = run_setup(self.tmpd, 'build_signet')
+        if rc or stderr:
+            self.fail(stdout + "\n" + stderr)
+
+        ext = '.exe' if os.name == 'nt' else ''
+        tools = os.path.join(self.tmpd, 'tools' + ext)
+        first = os.path.join(self.tmpd, 'first' + ext)
+        second = os.path.join(self.tmpd, 'second' + ext)
+
+        self.assertEqual(subprocess.check_output([first],
+                universal_newlines=True), "first\n")
+        self.assertEqual(subprocess.check_output([second],
+                universal_newlines=True), "second\n")
+        self.assertEqual(subprocess.check_output([tools, 'second'],
+                universal_newlines=True), "second\n")
+
+        task = subprocess.Popen([tools], universal_newlines=True,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        (stdout, stderr) = task.communicate()
+        self.assertNotEqual(task.returncode, 0)
+        self.assertIn('unknown entry point', stderr)
+
+        # tampering is only seen by the scripts that depend on it
+
+        with open(os.path.join(self.tmpd, 'extra.py'), 'a') as fout:
+            fout.write("print('tampered')\n")
+
+        self.assertEqual(subprocess.check_output([first],
+                universal_newlines=True), "first\n")
+        task = subprocess.Popen([second], universal_newlines=True,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        (stdout, stderr) = task.communicate()
+        self.assertNotEqual(task.returncode, 0, "tamper detection failed")
+        self.assertTrue(stderr.startswith('SECURITY VIOLATION:'),
+                "unrecognized tampered output %s" % stderr)
+
+    def test_sha1_kernels(self):
+        r"""confirm the loader verifies (and detects tampering) with both
+            the fastest sha1 kernel and SIGNET_SHA1=scalar"""
+
+        hello_py = os.path.join(self.tmpd, 'hello.py')
+        world_py = os.path.join(self.tmpd, 'world.py')
+        setup_py = os.path.join(self.tmpd, 'setup.py')
+
+        with open(hello_py, 'w') as fout:
+            fout.write("import signet\n"
+                       "import world\n"
+                       "print(signet.stats()['sha1'])\n")
+        with open(world_py, 'w') as fout:
+            fout.write("WORLD = %r\n" % ('x' * 10000))
+        with open(setup_py, 'w') as fout:
+            fout.write(
+                "from distutils.core import setup, Extension\n"
+                "from signet.command.build_signet import build_signet\n"
+                "setup(name = 'hello',\n"
+                "    cmdclass = {'build_signet': build_signet},\n"
+                "    ext_modules = [Extension('hello', \n"
+                "                      sources=['hello.py'])],\n"
+                ")\n"
+                )
+
+        (rc, stdout, stderr) = run_setup(self.tmpd, 'build_signet')
+        if rc or stderr:
+            self.fail(stdout + "\n" + stderr)
+
+        exe = os.path.join(self.tmpd, 'hello')
+        env = dict(os.environ)
+        kernel = subprocess.check_output([exe], universal_newlines=True,
+                env=env).strip()
+        self.assertIn(kernel, ('sha-ni', 'armv8', 'scalar'))
+
+        env['SIGNET_SHA1'] = 'scalar'
+        self.assertEqual(subprocess.check_output([exe],
+                universal_newlines=True, env=env).strip(), 'scalar')
+
+        # an unknown kernel is reported, and the fastest used instead
+
+        env['SIGNET_SHA1'] = 'md5'
+        task = subprocess.Popen([exe], universal_newlines=True, env=env,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        (stdout, stderr) = task.communicate()
+        self.assertEqual((task.returncode, stdout.strip()), (0, kernel))
+        self.assertIn('SIGNET_SHA1=md5', stderr)
+
+        # tamper with the dependency
+
+        with open(world_py, 'a') as fout:
+            fout.write('\n')
+
+        for name in (kernel, 'scalar'):
+            env['SIGNET_SHA1'] = name
+            task = subprocess.Popen([exe], universal_newlines=True, env=env,
+                    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            (_, stderr) = task.communicate()
+            self.assertNotEqual(task.returncode, 0, name)
+            self.assertTrue(stderr.startswith('SECURITY VIOLATION:'), stderr)
+
+    def test_digest(self):
+        r"""confirm loaders built with --digest=sha256 (and blake2b, where
+            this python can compute it) sign and verify with it"""
+
+        from distutils.errors import DistutilsSetupError
+        from signet.command.build_signet import new_digest
+
+        hello_py = os.path.join(self.tmpd, 'hello.py')
+        world_py = os.path.join(self.tmpd, 'world.py')
+        setup_py = os.path.join(self.tmpd, 'setup.py')
+
+        with open(hello_py, 'w') as fout:
+            fout.write("import json, signet\n"
+                       "import world\n"
+                       "print(json.dumps([signet.stats()['digest'],\n"
+                       "    signet.signatures()]))\n")
+        with open(setup_py, 'w') as fout:
+            fout.write(
+                "from distutils.core import setup, Extension\n"
+                "from signet.command.build_signet import build_signet\n"
+                "setup(name = 'hello',\n"
+                "    cmdclass = {'build_signet': build_signet},\n"
+                "    ext_modules = [Extension('hello', \n"
+                "                      sources=['hello.py'])],\n"
+                ")\n"
+                )
+
+        exe = os.path.join(self.tmpd, 'hello')
+        for digest in ('sha256', 'blake2b'):
+            try:
+                new_digest(digest)
+            except DistutilsSetupError:
+                continue
+
+            with open(world_py, 'w') as fout:
+                fout.write("WORLD = 1\n")
+
+            (rc, stdout, stderr) = run_setup(self.tmpd, 'build_signet',
+                    ['--force', '--digest=%s' % digest])
+            if rc or stderr:
+                self.fail(stdout + "\n" + stderr)
+
+            (name, sigs) = json.loads(subprocess.check_output([exe],
+                    universal_newlines=True))
+            self.assertEqual(name, digest)
+            expected = new_digest(digest, "WORLD = 1\n").hexdigest()
+            self.assertIn([expected, 'world', 'world.py'], sigs)
+
+            with open(world_py, 'a') as fout:
+                fout.write('\n')
+
+            task = subprocess.Popen([exe], universal_newlines=True,
+                    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            (_, stderr) = task.communicate()
+            self.assertNotEqual(task.returncode, 0, digest)
+            self.assertTrue(stderr.startswith('SECURITY VIOLATION:'), stderr)
+
+        (rc, stdout, stderr) = run_setup(self.tmpd, 'build_signet',
+                ['--force', '--digest=md5'])
+        self.assertNotEqual(rc, 0)
+        self.assertIn("unknown digest 'md5'", stderr)
+
+    def test_treehash(self):
+        r"""confirm files larger than --treehash are signed with, and
+            verified by, their tree digest"""
+
+        from signet.command.build_signet import content_digest
+
+        hello_py = os.path.join(self.tmpd, 'hello.py')
+        world_py = os.path.join(self.tmpd, 'world.py')
+        setup_py = os.path.join(self.tmpd, 'setup.py')
+
+        with open(hello_py, 'w') as fout:
+            fout.write("import json, signet\n"
+                       "import world\n"
+                       "print(json.dumps(signet.signatures()))\n")
+        with open(world_py, 'w') as fout:
+            fout.write("WORLD = %r\n" % ('x' * (3 << 20)))
+        with open(setup_py, 'w') as fout:
+            fout.write(
+                "from distutils.core import setup, Extension\n"
+                "from signet.command.build_signet import build_signet\n"
+                "setup(name = 'hello',\n"
+                "    cmdclass = {'build_signet': build_signet},\n"
+                "    options = {'build_signet': {'treehash': 1}},\n"
+                "    ext_modules = [Extension('hello', \n"
+                "                      sources=['hello.py'])],\n"
+                ")\n"
+                )
+
+        (rc, stdout, stderr) = run_setup(self.tmpd, 'build_signet')
+        if rc or stderr:
+            self.fail(stdout + "\n" + stderr)
+
+        with open(world_py, 'rb') as fin:
+            data = fin.read()
+        expected = content_digest(data, 'sha1', 1 << 20)
+        self.assertNotEqual(expected, content_digest(data, 'sha1'))
+
+        exe = os.path.join(self.tmpd, 'hello')
+        env = dict(os.environ)
+        for threads in ('4', '1'):
+            env['SIGNET_THREADS'] = threads
+            sigs = json.loads(subprocess.check_output([exe],
+                    universal_newlines=True, env=env))
+            self.assertIn([expected, 'world', 'world.py'], sigs)
+
+        # tamper with the last chunk
+
+        with open(world_py, 'a') as fout:
+            fout.write('\n')
+
+        task = subprocess.Popen([exe], universal_newlines=True,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        (_, stderr) = task.communicate()
+        self.assertNotEqual(task.returncode, 0, "tamper detection failed")
+        self.assertTrue(stderr.startswith('SECURITY VIOLATION:'), stderr)
+
+    @unittest.skipIf(os.name == 'nt', 'requires posix')
+    def test_treehash_read(self):
+        r"""confirm tree digests of files too small to be memory mapped,
+            hashed as they are read (or from an io_uring read with
+            --uring), verify and detect tampering"""
+
+        from signet.command.build_signet import content_digest
+
+        hello_py = os.path.join(self.tmpd, 'hello.py')
+        world_py = os.path.join(self.tmpd, 'world.py')
+        setup_py = os.path.join(self.tmpd, 'setup.py')
+
+        with open(hello_py, 'w') as fout:
+            fout.write("import json, signet\n"
+                       "import world\n"
+                       "print(json.dumps([signet.signatures(),\n"
+                       "    signet.stats()['mapped'],\n"
+                       "    signet.stats()['uring']]))\n")
+        with open(world_py, 'w') as fout:
+            fout.write("WORLD = %r\n" % ('x' * (40 << 10)))
+        with open(setup_py, 'w') as fout:
+            fout.write(
+                "from distutils.core import setup, Extension\n"
+                "from signet.command.build_signet import build_signet\n"
+                "setup(name = 'hello',\n"
+                "    cmdclass = {'build_signet': build_signet},\n"
+                "    options = {'build_signet': {'treehash': '16K',\n"
+                "                                'uring': True}},\n"
+                "    ext_modules = [Extension('hello', \n"
+                "                      sources=['hello.py'])],\n"
+                ")\n"
+                )
+
+        (rc, stdout, stderr) = run_setup(self.tmpd, 'build_signet')
+        if rc or stderr:
+            self.fail(stdout + "\n" + stderr)
+
+        with open(world_py, 'rb') as fin:
+            data = fin.read()
+        expected = content_digest(data, 'sha1', 16 << 10)
+        self.assertNotEqual(expected, content_digest(data, 'sha1'))
+
+        exe = os.path.join(self.tmpd, 'hello')
+        env = dict(os.environ)
+        for uring in ('OFF', 'ON'):
+            env['SIGNET_URING'] = uring
+            sigs, mapped, count = json.loads(subprocess.check_output([exe],
+                    universal_newlines=True, env=env))
+            self.assertIn([expected, 'world', 'world.py'], sigs)
+            self.assertEqual(mapped, 0)
+            if uring == 'ON' and io_uring_available():
+                self.assertGreater(count, 0)
+
+        # tamper with a middle chunk
+
+        with open(world_py, 'r+b') as fout:
+            fout.seek(20 << 10)
+            fout.write(b'y')
+
+        for uring in ('OFF', 'ON'):
+            env['SIGNET_URING'] = uring
+            task = subprocess.Popen([exe], universal_newlines=True, env=env,
+                    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            (_, stderr) = task.communicate()
+            self.assertNotEqual(task.returncode, 0, "tamper detection failed")
+            self.assertTrue(stderr.startswith('SECURITY VIOLATION:'), stderr)
+
+    def test_uring(self):
+        r"""confirm a loader built with --uring verifies dependencies read
+            through the io_uring (or read as usual, where it is not
+            available) and detects tampering"""
+
+        hello_py = os.path.join(self.tmpd, 'hello.py')
+        world_py = os.path.join(self.tmpd, 'world.py')
+        setup_py = os.path.join(self.tmpd, 'setup.py')
+
+        with open(hello_py, 'w') as fout:
+            fout.write("import json, signet\n"
+                       "import world\n"
+                       "print(json.dumps([signet.verify(),\n"
+                       "    signet.stats()['uring']]))\n")
+        with open(world_py, 'w') as fout:
+            fout.write("NAME = 'world'\n")
+        with open(setup_py, 'w') as fout:
+            fout.write(
+                "from distutils.core import setup, Extension\n"
+                "from signet.command.build_signet import build_signet\n"
+                "setup(name = 'hello',\n"
+                "    cmdclass = {'build_signet': build_signet},\n"
+                "    options = {'build_signet': {'uring': True}},\n"
+                "    ext_modules = [Extension('hello', \n"
+                "                      sources=['hello.py'])],\n"
+                ")\n"
+                )
+
+        (rc, stdout, stderr) = run_setup(self.tmpd, 'build_signet')
+        if rc or stderr:
+            self.fail(stdout + "\n" + stderr)
+
+        exe = os.path.join(self.tmpd, 'hello')
+        env = dict(os.environ)
+        for uring in ('ON', 'OFF'):
+            env['SIGNET_URING'] = uring
+            failed, count = json.loads(subprocess.check_output([exe],
+                    universal_newlines=True, env=env))
+            self.assertEqual(failed, [])
+            if uring == 'OFF':
+                self.assertEqual(count, 0)
+            elif io_uring_available():
+                self.assertGreater(count, 0)
+
+        # tamper with world
+
+        with open(world_py, 'a') as fout:
+            fout.write('\n')
+
+        for uring in ('ON', 'OFF'):
+            env['SIGNET_URING'] = uring
+            task = subprocess.Popen([exe], universal_newlines=True, env=env,
+                    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            (_, stderr) = task.communicate()
+            self.assertNotEqual(task.returncode, 0, "tamper detection failed")
+            self.assertTrue(stderr.startswith('SECURITY VIOLATION:'), stderr)
+
+    @unittest.skipIf(not os.path.exists('/usr/include/sys/sdt.h'),
+                     'requires sys/sdt.h')
+    def test_probes(self):
+        r"""confirm a loader built with --define USDT carries the signet
+            probes, and still runs"""
+
+        hello_py = os.path.join(self.tmpd, 'hello.py')
+        setup_py = os.path.join(self.tmpd, 'setup.py')
+
+        with open(hello_py, 'w') as fout:
+            fout.write("print('hello')\n")
+        with open(setup_py, 'w') as fout:
+            fout.write(
+                "from distutils.core import setup, Extension\n"
+                "from signet.command.build_signet import build_signet\n"
+                "setup(name = 'hello',\n"
+                "    cmdclass = {'build_signet': build_signet},\n"
+                "    options = {'build_signet': {'define': 'USDT'}},\n"
+                "    ext_modules = [Extension('hello', \n"
+                "                      sources=['hello.py'])],\n"
+                ")\n"
+                )
+
+        (rc, stdout, stderr) = run_setup(self.tmpd, 'build_signet')
+        if rc or stderr:
+            self.fail(stdout + "\n" + stderr)
+
+        exe = os.path.join(self.tmpd, 'hello')
+        notes = subprocess.check_output(['readelf', '-n', exe],
+                universal_newlines=True)
+        for probe in ('phase__start', 'phase__end', 'resolve__end',
+                      'hash__start', 'hash__end', 'tamper', 'script__start'):
+            self.assertIn('Name: %s' % probe, notes)
+        self.assertIn('Provider: signet', notes)
+
+        self.assertEqual(subprocess.check_output([exe],
+                universal_newlines=True), 'hello\n')
+
+    @unittest.skipIf(not sys.platform.startswith('linux'), 'requires linux')
+    def test_dir_index(self):
+        r"""confirm a nested package resolved through the indexed (openat)
+            directory fds verifies, the fds are closed before the script
+            runs, and tampering is still detected through them"""
+
+        hello_py = os.path.join(self.tmpd, 'hello.py')
+        setup_py = os.path.join(self.tmpd, 'setup.py')
+        sub = os.path.join(self.tmpd, 'pkg', 'sub')
+        mod_py = os.path.join(sub, 'mod.py')
+
+        os.makedirs(sub)
+        for init in (os.path.join(self.tmpd, 'pkg', '__init__.py'),
+                os.path.join(sub, '__init__.py')):
+            open(init, 'w').close()
+        with open(mod_py, 'w') as fout:
+            fout.write("X = 1\n")
+        with open(hello_py, 'w') as fout:
+            fout.write("import os\n"
+                       "import pkg.sub.mod\n"
+                       "n = 0\n"
+                       "for fd in os.listdir('/proc/self/fd'):\n"
+                       "    try:\n"
+                       "        path = os.readlink('/proc/self/fd/' + fd)\n"
+                       "    except OSError:\n"
+                       "        continue\n"
+                       "    if path.startswith(%r) and os.path.isdir(path):\n"
+                       "        n += 1\n"
+                       "print(n)\n" % os.path.realpath(self.tmpd))
+
+        for prevalidate in (False, True):
+            with open(setup_py, 'w') as fout:
+                fout.write(
+                    "from distutils.core import setup, Extension\n"
+                    "from signet.command.build_signet import build_signet\n"
+                    "setup(name = 'hello',\n"
+                    "    cmdclass = {'build_signet': build_signet},\n"
+                    "    options = {'build_signet': {'prevalidate': %r}},\n"
+                    "    ext_modules = [Extension('hello', \n"
+                    "                      sources=['hello.py'])],\n"
+                    ")\n" % prevalidate
+                    )
+            with open(mod_py, 'w') as fout:
+                fout.write("X = 1\n")
+
+            (rc, stdout, stderr) = run_setup(self.tmpd, 'build_signet',
+                    ['--force'])
+            if rc or stderr:
+                self.fail(stdout + "\n" + stderr)
+
+            exe = os.path.join(self.tmpd, 'hello')
+            self.assertEqual(subprocess.check_output([exe],
+                    universal_newlines=True), "0\n")
+
+            # tamper with the module found through the package's fd
+
+            with open(mod_py, 'a') as fout:
+                fout.write("X = 2\n")
+
+            task = subprocess.Popen([exe], universal_newlines=True,
+                    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            (stdout, stderr) = task.communicate()
+            self.assertNotEqual(task.returncode, 0, "tamper detection failed")
+            self.assertTrue(stderr.startswith('SECURITY VIOLATION:'),
+                    "unrecognized tampered output %s" % stderr)
+
+    @unittest.skipIf(os.name == 'nt', 'requires posix')
+    def test_server(self):
+        r"""confirm clients run on the fork server, which stops serving once
+            a watched dependency is tampered with"""
+
+        hello_py = os.path.join(self.tmpd, 'hello.py')
+        world_py = os.path.join(self.tmpd, 'world.py')
+        setup_py = os.path.join(self.tmpd, 'setup.py')
+        sock = os.path.join(self.tmpd, 'hello.sock')
+
+        with open(hello_py, 'w') as fout:
+            fout.write("import os, sys\n"
+                       "import world\n"
+                       "print(' '.join(sys.argv[1:] + [os.getcwd(),\n"
+                       "    os.environ['HELLO'], world.NAME]))\n"
+                       "sys.exit(3)\n")
+        with open(world_py, 'w') as fout:
+            fout.write("NAME = 'world'\n")
+        with open(setup_py, 'w') as fout:
+            fout.write(
+                "from distutils.core import setup, Extension\n"
+                "from signet.command.build_signet import build_signet\n"
+                "setup(name = 'hello',\n"
+                "    cmdclass = {'build_signet': build_signet},\n"
+                "    ext_modules = [Extension('hello', \n"
+                "                      sources=['hello.py'])],\n"
+                ")\n"
+                )
+
+        (rc, stdout, stderr) = run_setup(self.tmpd, 'build_signet')
+        if rc or stderr:
+            self.fail(stdout + "\n" + stderr)
+
+        exe = os.path.join(self.tmpd, 'hello')
+        server = subprocess.Popen([exe, '--SIGNETSERVE=' + sock])
+        try:
+            for _ in range(100):
+                if os.path.exists(sock):
+                    break
+                time.sleep(0.1)
+            self.assertTrue(os.path.exists(sock), "server did not start")
+
+            # the client's args, cwd, environment and exit status
+
+            env = dict(os.environ, HELLO='hello', SIGNET_SERVER=sock)
+            task = subprocess.Popen([exe, 'a', 'b'], cwd=tempfile.gettempdir(),
+                    env=env, universal_newlines=True,
+                    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            (stdout, stderr) = task.communicate()
+            self.assertEqual(task.returncode, 3, stderr)
+            self.assertEqual(stdout, "a b %s hello world\n" %
+                             os.path.realpath(tempfile.gettempdir()))
+
+            # a client that sends nothing is dropped, and doesn't stall the
+            # clients after it
+
+            silent = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                silent.connect(sock)
+                task = subprocess.Popen([exe, 'c'], env=env,
+                        universal_newlines=True,
+                        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                (stdout, stderr) = task.communicate()
+                self.assertEqual(task.returncode, 3, stderr)
+                self.assertTrue(stdout.startswith("c "), stdout)
+                self.assertEqual(silent.recv(4), b'')
+            finally:
+                silent.close()
+
+            # tampering is caught by the server, and the client
+
+            with open(world_py, 'w') as fout:
+                fout.write("NAME = 'tampered'\n")
+
+            task = subprocess.Popen([exe], env=env, universal_newlines=True,
+                    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            (stdout, stderr) = task.communicate()
+            self.assertNotEqual(task.returncode, 3, "tamper detection failed")
+            self.assertEqual(stdout, "", "tampered module was run")
+
+            for _ in range(100):
+                if server.poll() is not None:
+                    break
+                time.sleep(0.1)
+            self.assertNotEqual(server.poll(), None, "server still serving")
+            self.assertNotEqual(server.returncode, 0)
+        finally:
+            if server.poll() is None:
+                server.kill()
+                server.wait()
+
+    def test_detection_levels(self):
+        r"""test alternate detection levels 3, 1 & 0 (omit 2)"""
+
+        # Generate signet loader
+
+        hello_py = os.path.join(self.tmpd, 'hello.py')
+        setup_py = os.path.join(self.tmpd, 'setup.py')
+
+        with open(hello_py, 'w') as fout:
+            fout.write("print('Hello world')\n")
+        with open(setup_py, 'w') as fout:
+            fout.write(
+                "from distutils.core import setup, Extension\n"
+                "from signet.command.build_signet import build_signet\n"
+                "setup(name = 'hello',\n"
+                "    cmdclass = {'build_signet':build_signet},\n"
+                "    ext_modules = [Extension('hello', \n"
+                "                      sources=['hello.py'])],\n"
+                ")\n"
+                )
+
+        (rc, stdout, stderr) = run_setup(self.tmpd, 'build_signet')
+        if rc or stderr:
+            self.fail(stdout + "\n" + stderr)
+
+        # tamper with the SCRIPT
+
+        with open(hello_py, 'a') as fout:
+            fout.write('\n')
+
+        # run the signet loader
+
+        if os.name == 'nt':
+            exe = 'hello.exe'
+        else:
+            exe = 'hello'
+
+        # Confirm signed detection
+
+        task = subprocess.Popen([os.path.join(self.tmpd, exe), '--SECURITYMAX'],
+                universal_newlines=True,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        (_, stderr) = task.communicate()
+        self.assertNotEqual(task.returncode, 0, "signed detection failed")
+        self.assertTrue(stderr and
+                'SECURITY MAXIMUM Enabled' in stderr and
+                'SECURITY WARNING:' in stderr,
+                "unrecognized tampered output %s" % stderr)
+
+        # Confirm warn only
+
+        task = subprocess.Popen(
+                [os.path.join(self.tmpd, exe), '--SECURITYWARN'],
+                universal_newlines=True,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        (_, stderr) = task.communicate()
+        self.assertEqual(task.returncode, 0, "warn only failed")
+        self.assertTrue(stderr and
+                'SECURITY DISABLED' in stderr and
+                'SECURITY WARNING:' in stderr and
+                'SECURITY VIOLATION:' in stderr,
+                "unrecognized tampered output %s" % stderr)
+
+        # Confirm disabled security
+
+        task = subprocess.Popen([os.path.join(self.tmpd, exe), '--SECURITYOFF'],
+                universal_newlines=True,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        (_, stderr) = task.communicate()
+        self.assertEqual(task.returncode, 0, "warn only failed")
+        self.assertTrue(stderr and 'SECURITY DISABLED' in stderr,
+                "unrecognized tampered output %s" % stderr)
+
+    def test_loader_source_path(self):
+        r"""confirm generate_loader_source() still accepts a script's path,
+            as subclasses overriding it pass"""
+
+        hello_py = os.path.join(self.tmpd, 'hello.py')
+        setup_py = os.path.join(self.tmpd, 'setup.py')
+
+        with open(hello_py, 'w') as fout:
+            fout.write("print('hello')\n")
+        with open(setup_py, 'w') as fout:
+            fout.write(
+                "from distutils.core import setup, Extension\n"
+                "from signet.command.build_signet import build_signet\n"
+                "class custom_build(build_signet):\n"
+                "    def generate_loader_source(self, py_source,\n"
+                "                               multicall=None):\n"
+                "        return build_signet.generate_loader_source(self,\n"
+                "            py_source[0])\n"
+                "setup(name = 'hello',\n"
+                "    cmdclass = {'build_signet': custom_build},\n"
+                "    ext_modules = [Extension('hello', \n"
+                "                      sources=['hello.py'])],\n"
+                ")\n"
+                )
+
+        (rc, stdout, stderr) = run_setup(self.tmpd, 'build_signet')
+        if rc or stderr:
+            self.fail(stdout + "\n" + stderr)
+
+        exe = os.path.join(self.tmpd, 'hello')
+        self.assertEqual(subprocess.check_output([exe],
+                universal_newlines=True), "hello\n")
+
     @unittest.skipUnless(os.name == 'nt', 'requires windows')
     def test_rc_generation(self):
         r"""test windows resource generation"""